@@ -0,0 +1,51 @@
+import functools
+import inspect
+
+from fastapi import APIRouter, Depends
+from fastapi.routing import APIRoute
+
+from app.db.models import async_connection_db
+from app.utils.streaming import JSONStreamingResponse
+
+
+async def pullChunks(database, chunks):
+    """Читает порции потокового ответа через run_sync: генератор ходит в базу синхронной сессией"""
+    while (chunk := await database.run_sync(lambda session: next(chunks, None))) is not None:
+        yield chunk
+
+
+def asyncEndpoint(endpoint):
+    """
+    Делает из синхронного обработчика async def на AsyncSession. Тело обработчика и
+    помощники из app.utils и app.validations выполняются через AsyncSession.run_sync:
+    каждый запрос к базе уходит в асинхронный драйвер, а поток пула не занимается.
+    """
+    signature = inspect.signature(endpoint)
+    if 'database' not in signature.parameters:
+        # без базы обработчик не блокирует цикл событий и остаётся как есть
+        return endpoint
+    parameters = [
+        parameter.replace(default=Depends(async_connection_db)) if parameter.name == 'database' else parameter
+        for parameter in signature.parameters.values()
+    ]
+
+    @functools.wraps(endpoint)
+    async def wrapper(**kwargs):
+        database = kwargs.pop('database')
+        response = await database.run_sync(lambda session: endpoint(database=session, **kwargs))
+        if isinstance(response, JSONStreamingResponse):
+            response.body_iterator = pullChunks(database, response.chunks)
+        return response
+
+    wrapper.__signature__ = signature.replace(parameters=parameters)
+    return wrapper
+
+
+def makeAsyncRouter(router: APIRouter) -> APIRouter:
+    """Копирует маршруты синхронного роутера с асинхронными обработчиками"""
+    asyncRouter = APIRouter()
+    for route in router.routes:
+        if isinstance(route, APIRoute):
+            asyncRouter.add_api_route(route.path, asyncEndpoint(route.endpoint),
+                                      methods=list(route.methods), name=route.name)
+    return asyncRouter
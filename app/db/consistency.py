@@ -0,0 +1,155 @@
+"""
+Проверка согласованности сохранённых размеров папок, их агрегатов и материализованных путей.
+
+    python -m app.db.consistency          # только отчёт
+    python -m app.db.consistency --fix    # отчёт и исправление
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+from sqlalchemy.orm import Session
+
+from app.config import DATABASE_URL
+from app.db.models import Item, init_engine
+from app.utils.utils import pathSegment
+
+
+def countFolderSizes(database) -> dict[str, int]:
+    """Пересчитывает размеры всех папок с нуля за один проход снизу вверх"""
+    rows = database.query(Item.id, Item.parentId, Item.type, Item.size).all()
+    children = defaultdict(list)
+    for row in rows:
+        children[row.parentId].append(row)
+    ids = {row.id for row in rows}
+
+    # обход в ширину от корней, затем сложение в обратном порядке
+    order = [row for row in rows if row.parentId is None or row.parentId not in ids]
+    for row in order:
+        order.extend(children[row.id])
+    sizes = {row.id: 0 for row in rows if row.type == 'FOLDER'}
+    for row in reversed(order):
+        if row.parentId in sizes:
+            sizes[row.parentId] += sizes[row.id] if row.type == 'FOLDER' else (row.size or 0)
+    return sizes
+
+
+def findSizeDrift(database) -> list[dict]:
+    """Возвращает папки, у которых сохранённый размер расходится с пересчитанным"""
+    sizes = countFolderSizes(database)
+    stored = database.query(Item.id, Item.size).filter(Item.type == 'FOLDER')
+    return [{'id': row.id, 'stored': row.size, 'actual': sizes[row.id]}
+            for row in stored if row.size != sizes[row.id]]
+
+
+def fixSizeDrift(database, drift: list[dict]) -> None:
+    """Записывает пересчитанные размеры папок"""
+    database.bulk_update_mappings(Item, [{'id': row['id'], 'size': row['actual']} for row in drift])
+
+
+STATS_COLUMNS = ('fileCount', 'folderCount', 'maxDepth', 'newestUpdate')
+
+
+def countFolderStats(database) -> dict[str, tuple]:
+    """
+    Пересчитывает агрегаты всех папок (fileCount, folderCount, maxDepth, newestUpdate)
+    за один проход снизу вверх, как countFolderSizes
+    """
+    rows = database.query(Item.id, Item.parentId, Item.type, Item.updateDate).all()
+    children = defaultdict(list)
+    for row in rows:
+        children[row.parentId].append(row)
+    ids = {row.id for row in rows}
+
+    order = [row for row in rows if row.parentId is None or row.parentId not in ids]
+    for row in order:
+        order.extend(children[row.id])
+    stats = {row.id: [0, 0, 0, None] for row in rows if row.type == 'FOLDER'}
+    for row in reversed(order):
+        parent = stats.get(row.parentId)
+        if parent is None:
+            continue
+        if row.type == 'FOLDER':
+            files, folders, depth, newest = stats[row.id]
+            parent[0] += files
+            parent[1] += folders + 1
+        else:
+            parent[0] += 1
+            depth, newest = 0, row.updateDate
+        parent[2] = max(parent[2], depth + 1)
+        if newest is not None and (parent[3] is None or newest > parent[3]):
+            parent[3] = newest
+    return {id: tuple(value) for id, value in stats.items()}
+
+
+def findStatsDrift(database) -> list[dict]:
+    """Возвращает папки, у которых сохранённые агрегаты расходятся с пересчитанными"""
+    stats = countFolderStats(database)
+    stored = database.query(Item.id, *(getattr(Item, column) for column in STATS_COLUMNS)) \
+        .filter(Item.type == 'FOLDER')
+    return [{'id': row[0], 'stored': tuple(row[1:]), 'actual': stats[row[0]]}
+            for row in stored if tuple(row[1:]) != stats[row[0]]]
+
+
+def fixStatsDrift(database, drift: list[dict]) -> None:
+    """Записывает пересчитанные агрегаты папок"""
+    database.bulk_update_mappings(Item, [{'id': row['id'], **dict(zip(STATS_COLUMNS, row['actual']))}
+                                         for row in drift])
+
+
+def countPaths(database) -> dict[str, str]:
+    """Пересчитывает материализованные пути всех элементов по ссылкам parentId"""
+    rows = database.query(Item.id, Item.parentId).all()
+    children = defaultdict(list)
+    for row in rows:
+        children[row.parentId].append(row.id)
+    ids = {row.id for row in rows}
+
+    order = [row.id for row in rows if row.parentId is None or row.parentId not in ids]
+    paths = {id: '/' + pathSegment(id) for id in order}
+    for id in order:
+        for child in children[id]:
+            paths[child] = paths[id] + pathSegment(child)
+            order.append(child)
+    # элементы из циклов недостижимы от корней, их пути начинаются с них самих
+    for id in ids - paths.keys():
+        paths[id] = '/' + pathSegment(id)
+    return paths
+
+
+def findPathDrift(database) -> list[dict]:
+    """Возвращает элементы, у которых сохранённый путь расходится с пересчитанным"""
+    paths = countPaths(database)
+    return [{'id': row.id, 'stored': row.path, 'actual': paths[row.id]}
+            for row in database.query(Item.id, Item.path) if row.path != paths[row.id]]
+
+
+def fixPathDrift(database, drift: list[dict]) -> None:
+    """Записывает пересчитанные пути"""
+    database.bulk_update_mappings(Item, [{'id': row['id'], 'path': row['actual']} for row in drift])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка размеров и агрегатов папок и путей')
+    parser.add_argument('--fix', action='store_true', help='исправить найденные расхождения')
+    parser.add_argument('--database-url', default=DATABASE_URL)
+    args = parser.parse_args()
+
+    with Session(init_engine(args.database_url)) as database:
+        sizeDrift = findSizeDrift(database)
+        statsDrift = findStatsDrift(database)
+        pathDrift = findPathDrift(database)
+        if args.fix:
+            fixSizeDrift(database, sizeDrift)
+            fixStatsDrift(database, statsDrift)
+            fixPathDrift(database, pathDrift)
+            database.commit()
+    drift = len(sizeDrift) + len(statsDrift) + len(pathDrift)
+    print(json.dumps({'drift': drift, 'fixed': bool(drift and args.fix), 'sizes': sizeDrift,
+                      'stats': statsDrift, 'paths': pathDrift}, indent=2, ensure_ascii=False, default=str))
+    sys.exit(1 if drift and not args.fix else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Версионные миграции: схема создаётся и обновляется только ими. Номер последней
+применённой миграции хранится в таблице schema_version, каждая миграция выполняется в
+своей транзакции. SQL общий для SQLite и PostgreSQL: имена столбцов в camelCase
+заключены в кавычки, иначе PostgreSQL приведёт их к нижнему регистру.
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.db.consistency import findSizeDrift, fixSizeDrift, findPathDrift, fixPathDrift, findStatsDrift, \
+    fixStatsDrift
+from app.db.models import Item, ItemHistory, ItemChange
+from app.utils.dates import toUtc
+
+
+# ключ pg_advisory_lock: воркеры, стартующие одновременно, применяют миграции по очереди
+MIGRATIONS_LOCK_ID = 2022090101
+
+
+def isPostgres(database) -> bool:
+    return database.bind.dialect.name == 'postgresql'
+
+
+def backfillFolderSizes(database) -> None:
+    """Размеры папок хранятся в строках items"""
+    fixSizeDrift(database, findSizeDrift(database))
+
+
+def createItems(database) -> None:
+    """Исходная таблица items; path и индексы добавляют следующие миграции"""
+    database.execute(text("""create table IF NOT EXISTS items(
+        id varchar(256) primary key,
+        "parentId" varchar(256),
+        url varchar(255) NULL,
+        size bigint NULL,
+        type varchar(6) NULL,
+        "updateDate" timestamp
+    )"""))
+    # базы, созданные до миграций, уже содержат элементы
+    backfillFolderSizes(database)
+
+
+def normalizeUpdateDates(database) -> None:
+    """Даты обновления хранятся в UTC в сортируемом виде вместо исходных строк ISO 8601"""
+    rows = database.execute(text('select id, "updateDate" from items')).all()
+    database.bulk_update_mappings(Item, [{'id': id, 'updateDate': toUtc(updateDate)}
+                                         for id, updateDate in rows if isinstance(updateDate, str)])
+
+
+# вторичные индексы items: имена без кавычек, как их создали миграции (в PostgreSQL - в нижнем регистре)
+ITEMS_INDEXES = {
+    'ix_items_type_updateDate': 'items(type, "updateDate")',
+    'ix_items_path': 'items(path)',
+    'ix_items_parentId_id': 'items("parentId", id)',
+}
+
+
+def createIndex(database, name: str) -> None:
+    database.execute(text(f'create index IF NOT EXISTS {name} on {ITEMS_INDEXES[name]}'))
+
+
+def dropItemsIndexes(database) -> None:
+    """Удаляет вторичные индексы items перед массовой загрузкой"""
+    for name in ITEMS_INDEXES:
+        database.execute(text(f'drop index IF EXISTS {name}'))
+
+
+def createItemsIndexes(database) -> None:
+    for name in ITEMS_INDEXES:
+        createIndex(database, name)
+
+
+def addUpdatesIndex(database) -> None:
+    """Индекс для выборки окна /updates"""
+    createIndex(database, 'ix_items_type_updateDate')
+
+
+def createItemHistory(database) -> None:
+    """Журнал версий элементов, начинается с текущего состояния каждого элемента"""
+    ItemHistory.__table__.create(database.connection(), checkfirst=True)
+    database.execute(text("""insert into item_history("itemId", "parentId", url, size, type, date)
+        select id, "parentId", url, size, type, "updateDate" from items"""))
+
+
+def addItemPaths(database) -> None:
+    """Материализованные пути элементов с индексом для выборок по поддереву"""
+    # пути сравниваются побайтово: в PostgreSQL нужна collation "C", в SQLite она и так двоичная
+    collation = ' collate "C"' if isPostgres(database) else ''
+    database.execute(text(f'alter table items add column path varchar{collation}'))
+    fixPathDrift(database, findPathDrift(database))
+    createIndex(database, 'ix_items_path')
+
+
+def addChildrenIndex(database) -> None:
+    """Составной индекс (parentId, id) для постраничной выдачи детей; индекс по parentId им покрывается"""
+    createIndex(database, 'ix_items_parentId_id')
+    database.execute(text('drop index IF EXISTS ix_items_parentId'))
+
+
+def addFolderStats(database) -> None:
+    """Агрегаты поддерева папок (число файлов и папок, глубина, последняя дата) рядом с size"""
+    for column, type in [('fileCount', 'bigint'), ('folderCount', 'bigint'),
+                         ('maxDepth', 'integer'), ('newestUpdate', 'timestamp')]:
+        database.execute(text(f'alter table items add column "{column}" {type}'))
+    fixStatsDrift(database, findStatsDrift(database))
+
+
+def createItemChanges(database) -> None:
+    """Журнал изменений для GET /changes; начинается пустым, клиенты синхронизируются через /export"""
+    ItemChange.__table__.create(database.connection(), checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, createItems),
+    (2, normalizeUpdateDates),
+    (3, addUpdatesIndex),
+    (4, createItemHistory),
+    (5, addItemPaths),
+    (6, addChildrenIndex),
+    (7, addFolderStats),
+    (8, createItemChanges),
+]
+
+
+def applyMigrations(engine: Engine) -> int:
+    with engine.begin() as connection:
+        connection.execute(text('create table IF NOT EXISTS schema_version(version integer not null)'))
+        version = connection.execute(text('select max(version) from schema_version')).scalar() or 0
+    for number, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        with Session(engine) as database:
+            migration(database)
+            database.execute(text('insert into schema_version(version) values (:version)'),
+                             {'version': number})
+            database.commit()
+        version = number
+    return version
+
+
+def migrate(engine: Engine) -> int:
+    """Применяет недостающие миграции и возвращает текущую версию схемы"""
+    if engine.dialect.name != 'postgresql':
+        return applyMigrations(engine)
+    # блокировка уровня сессии держится на отдельном соединении до конца миграций
+    with engine.connect() as lock:
+        lock.execute(text('select pg_advisory_lock(:id)'), {'id': MIGRATIONS_LOCK_ID})
+        try:
+            return applyMigrations(engine)
+        finally:
+            lock.execute(text('select pg_advisory_unlock(:id)'), {'id': MIGRATIONS_LOCK_ID})
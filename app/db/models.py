@@ -1,19 +1,101 @@
-from sqlalchemy import create_engine, Column, Integer, String
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, event, Column, Integer, BigInteger, String, DateTime, Index
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from enum import Enum
 
 
-from app.config import DATABASE_URL
+from app.config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, \
+    DB_POOL_RECYCLE, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT, SQLITE_MMAP_SIZE
+from app.utils.metrics import instrumentEngine
 
 
 Base = declarative_base()
+SessionLocal = sessionmaker()
+engine: Engine | None = None
+AsyncSessionLocal = sessionmaker(class_=AsyncSession)
+async_engine: AsyncEngine | None = None
+
+# асинхронные драйверы для синхронных url из конфигурации
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Настраивает каждое новое соединение SQLite"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA journal_mode={SQLITE_JOURNAL_MODE}')
+    cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+    cursor.execute(f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT)}')
+    cursor.execute(f'PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}')
+    cursor.close()
+
+
+def init_engine(database_url: str = DATABASE_URL) -> Engine:
+    """Создаёт общий для процесса engine с пулом соединений"""
+    global engine
+    if engine is not None:
+        engine.dispose()
+    is_sqlite = database_url.startswith('sqlite')
+    engine = create_engine(
+        database_url,
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        connect_args={'check_same_thread': False} if is_sqlite else {}
+    )
+    if is_sqlite:
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+    instrumentEngine(engine)
+    SessionLocal.configure(bind=engine)
+    return engine
+
+
+def async_database_url(database_url: str) -> str:
+    """Переводит url базы на асинхронный драйвер: sqlite:///... -> sqlite+aiosqlite:///..."""
+    scheme, rest = database_url.split('://', 1)
+    return f"{ASYNC_DRIVERS[scheme.split('+')[0]]}://{rest}"
+
+
+def init_async_engine(database_url: str = DATABASE_URL) -> AsyncEngine:
+    """Создаёт общий для процесса асинхронный engine с теми же настройками пула"""
+    global async_engine
+    is_sqlite = database_url.startswith('sqlite')
+    async_engine = create_async_engine(
+        async_database_url(database_url),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        connect_args={'check_same_thread': False} if is_sqlite else {}
+    )
+    if is_sqlite:
+        event.listen(async_engine.sync_engine, 'connect', set_sqlite_pragmas)
+    instrumentEngine(async_engine.sync_engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+    return async_engine
 
 
 def connection_db():
-    engine = create_engine(DATABASE_URL, connect_args={})
-    session = Session(bind=engine.connect())
-    return session
+    """Выдаёт сессию на время запроса и всегда закрывает её"""
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+async def async_connection_db():
+    """Выдаёт асинхронную сессию на время запроса и всегда закрывает её"""
+    async with AsyncSessionLocal() as session:
+        yield session
 
 
 class Type(Enum):
@@ -28,6 +110,60 @@ class Item(Base):
     id = Column(String, primary_key=True)
     parentId = Column(String)
     url = Column(String(255), nullable=True)
-    size = Column(Integer, nullable=True)
+    # суммарный размер папки может превысить 2 ГБ, в PostgreSQL integer 32-битный
+    size = Column(BigInteger, nullable=True)
+    type = Column(String)
+    # наивный datetime в UTC; в SQLite хранится строкой фиксированной ширины и сортируется как дата
+    updateDate = Column(DateTime)
+    # материализованный путь /root/.../id/, см. app.utils.utils.pathSegment;
+    # сравнение строк побайтовое, поэтому в PostgreSQL нужна collation "C"
+    path = Column(String().with_variant(String(collation='C'), 'postgresql'))
+    # агрегаты поддерева папки (у файлов NULL), поддерживаются при импорте и удалении вместе
+    # с size: число файлов и папок в поддереве, глубина самого глубокого потомка (ребёнок - 1)
+    # и самая поздняя дата файла
+    fileCount = Column(BigInteger, nullable=True)
+    folderCount = Column(BigInteger, nullable=True)
+    maxDepth = Column(Integer, nullable=True)
+    newestUpdate = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_items_parentId_id', 'parentId', 'id'),
+        Index('ix_items_type_updateDate', 'type', 'updateDate'),
+        Index('ix_items_path', 'path'),
+    )
+
+
+class ItemHistory(Base):
+    """Класс для предствления таблицы item_history - журнала версий элементов"""
+    __tablename__ = 'item_history'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    itemId = Column(String, nullable=False)
+    parentId = Column(String)
+    url = Column(String(255), nullable=True)
+    size = Column(BigInteger, nullable=True)
     type = Column(String)
-    updateDate = Column(String)
+    date = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_item_history_itemId_date', 'itemId', 'date'),
+    )
+
+
+class ItemChange(Base):
+    """Класс для предствления таблицы item_changes - журнала изменений для GET /changes"""
+    __tablename__ = 'item_changes'
+
+    # монотонный номер изменения; в SQLite AUTOINCREMENT не выдаёт номера удалённых записей повторно
+    seq = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    # UPDATE - новое состояние элемента, DELETE - удаление элемента с поддеревом,
+    # RESET - дерево заменено восстановлением снимка
+    kind = Column(String, nullable=False)
+    itemId = Column(String, nullable=True)
+    parentId = Column(String)
+    url = Column(String(255), nullable=True)
+    size = Column(BigInteger, nullable=True)
+    type = Column(String)
+    date = Column(DateTime, nullable=False)
+
+    __table_args__ = {'sqlite_autoincrement': True}
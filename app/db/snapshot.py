@@ -0,0 +1,217 @@
+"""
+Выгрузка и восстановление всего дерева. Снимок - NDJSON: по строке на элемент с полями
+ответа GET /nodes/{id} без children, в порядке материализованного пути (обход в глубину,
+родитель раньше детей). Восстановление читает снимок один раз: проверяет элементы,
+вставляет их пачками и считает размеры папок снизу вверх по мере закрытия папок, так что
+в памяти держатся только пачка и цепочка открытых папок. Вторичные индексы на время
+загрузки удаляются и строятся заново в конце. Агрегаты папок считаются так же, как размеры.
+
+    python -m app.db.snapshot export disk.ndjson.gz
+    python -m app.db.snapshot restore disk.ndjson.gz [--replace]
+"""
+import argparse
+import gzip
+import json
+import sys
+from functools import lru_cache
+from typing import Iterable, Iterator, NamedTuple
+
+import orjson
+from sqlalchemy import select, insert, delete
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from app.config import DATABASE_URL
+from app.db.models import Item, ItemHistory, ItemChange, SessionLocal, init_engine
+from app.db.migrations import migrate, dropItemsIndexes, createItemsIndexes
+from app.utils.dates import parseDate, utcNow
+from app.utils.exceptions import ValidateExeption
+from app.utils.utils import pathSegment, isTopLevel
+from app.utils.writes import runWrite
+from app.validations import checkFile, checkFolder
+
+MEDIA_TYPE = 'application/x-ndjson'
+# строк в одном insert
+RESTORE_BATCH_SIZE = 10000
+# тело POST /restore больше этого размера уходит во временный файл
+SPOOL_SIZE = 16 * 2 ** 20
+
+
+class SnapshotItem(NamedTuple):
+    """Элемент снимка; поля для checkFile и checkFolder"""
+    id: str
+    url: str | None
+    parentId: str | None
+    size: int | None
+    type: str
+
+
+def exportLines(database) -> Iterator[bytes]:
+    """Строки снимка в порядке path; дата с микросекундами, чтобы восстановление было точным"""
+    rows = database.execute(select(Item.id, Item.url, Item.type, Item.parentId, Item.updateDate, Item.size)
+                            .order_by(Item.path).execution_options(stream_results=True))
+    for id, url, type, parentId, updateDate, size in rows:
+        yield orjson.dumps({'id': id, 'url': url, 'type': type, 'parentId': parentId,
+                            'date': updateDate.isoformat() + 'Z', 'size': size}) + b'\n'
+
+
+# у элементов одного импорта даты совпадают: строка снимка разбирается один раз
+snapshotDate = lru_cache(maxsize=4096)(parseDate)
+
+
+def snapshotError(number: int, error: str) -> ValidateExeption:
+    return ValidateExeption("Invalid snapshot", [{'line': number, 'error': error}])
+
+
+def parseLine(line: bytes, number: int) -> tuple[SnapshotItem, object]:
+    """Разбирает и проверяет строку снимка; ошибка называет номер строки"""
+    try:
+        value = orjson.loads(line)
+        item = SnapshotItem(value['id'], value.get('url'), value.get('parentId'), value.get('size'), value['type'])
+        if not isinstance(item.id, str) or not item.id or not isinstance(item.parentId, (str, type(None))) \
+                or not isinstance(item.url, (str, type(None))) or not isinstance(item.size, (int, type(None))):
+            raise ValueError(line)
+        date = snapshotDate(value['date'])
+    except (orjson.JSONDecodeError, KeyError, TypeError, ValueError, ValidateExeption):
+        raise snapshotError(number, "Invalid item")
+    if item.type == 'FILE':
+        error = checkFile(item)
+    elif item.type == 'FOLDER':
+        # размер папки в снимке справочный, он считается заново
+        error = checkFolder(item._replace(size=None))
+    else:
+        error = "Invalid type"
+    if error:
+        raise snapshotError(number, error)
+    return item, date
+
+
+def restoreRows(lines: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Строки для вставки в items. Файл выдаётся сразу, папка - когда закрывается, уже с
+    размером и агрегатами поддерева. Родитель элемента должен быть открытой папкой (предком предыдущего
+    элемента): так выглядит обход в глубину. parentId "0" (см. isTopLevel) - элемент верхнего уровня.
+    """
+    # открытые папки от корня: [строка, накопленный размер]; агрегаты копятся в строке
+    stack = []
+
+    def add(files: int, folders: int, depth: int, newest) -> None:
+        parent = stack[-1][0]
+        parent['fileCount'] += files
+        parent['folderCount'] += folders
+        parent['maxDepth'] = max(parent['maxDepth'], depth + 1)
+        if newest is not None and (parent['newestUpdate'] is None or parent['newestUpdate'] < newest):
+            parent['newestUpdate'] = newest
+
+    def close() -> dict:
+        row, size = stack.pop()
+        row['size'] = size
+        if stack:
+            stack[-1][1] += size
+            add(row['fileCount'], row['folderCount'] + 1, row['maxDepth'], row['newestUpdate'])
+        return row
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        item, date = parseLine(line, number)
+        topLevel = isTopLevel(item.parentId)
+        while stack and (topLevel or stack[-1][0]['id'] != item.parentId):
+            yield close()
+        if not topLevel and not stack:
+            raise snapshotError(number, "Parent not found before its children")
+        path = (stack[-1][0]['path'] if stack else '/') + pathSegment(item.id)
+        row = {'id': item.id, 'parentId': item.parentId, 'url': item.url, 'type': item.type,
+               'size': item.size, 'updateDate': date, 'path': path,
+               'fileCount': None, 'folderCount': None, 'maxDepth': None, 'newestUpdate': None}
+        if item.type == 'FOLDER':
+            row.update(fileCount=0, folderCount=0, maxDepth=0)
+            stack.append([row, 0])
+        else:
+            if stack:
+                stack[-1][1] += item.size
+                add(1, 0, 0, date)
+            yield row
+    while stack:
+        yield close()
+
+
+def writeSnapshot(database, lines: Iterable[bytes], replace: bool) -> int:
+    """Загрузка снимка в транзакции записи (см. runWrite); индексы удаляются и строятся в ней же"""
+    if getattr(lines, 'seekable', lambda: False)():
+        # при повторе транзакции снимок читается с начала
+        lines.seek(0)
+    if not replace and database.execute(select(Item.id).limit(1)).first():
+        raise ValidateExeption("Disk is not empty")
+    dropItemsIndexes(database)
+    count = 0
+    database.execute(delete(ItemHistory))
+    if replace:
+        database.execute(delete(Item))
+    batch = []
+    for row in restoreRows(lines):
+        batch.append(row)
+        if len(batch) == RESTORE_BATCH_SIZE:
+            database.execute(Item.__table__.insert(), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        database.execute(Item.__table__.insert(), batch)
+        count += len(batch)
+    database.execute(insert(ItemHistory).from_select(
+        ['itemId', 'parentId', 'url', 'size', 'type', 'date'],
+        select(Item.id, Item.parentId, Item.url, Item.size, Item.type, Item.updateDate)))
+    # номера журнала продолжаются: клиенты с прежним номером получат RESET
+    database.execute(delete(ItemChange))
+    database.execute(insert(ItemChange).values(kind='RESET', date=utcNow()))
+    createItemsIndexes(database)
+    database.commit()
+    return count
+
+
+def restoreSnapshot(lines: Iterable[bytes], engine: Engine, replace: bool = False) -> int:
+    """
+    Загружает снимок одной транзакцией записи и возвращает число элементов. В непустую базу -
+    только с replace: тогда прежние элементы удаляются. История начинается заново с
+    версии каждого восстановленного элемента, журнал изменений - с записи RESET.
+    Восстановление идёт по очереди с импортами и удалениями, как любая запись дерева.
+    При ошибке в снимке база остаётся прежней.
+    """
+    with SessionLocal(bind=engine) as database:
+        try:
+            return runWrite(database, writeSnapshot, lines, replace)
+        except IntegrityError:
+            raise ValidateExeption("Invalid snapshot", [{'line': None, 'error': "Duplicate id"}])
+
+
+def openSnapshot(path: str, mode: str):
+    """Файл снимка; '-' - stdin/stdout, .gz - сжатый"""
+    if path == '-':
+        return (sys.stdin if 'r' in mode else sys.stdout).buffer
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['export', 'restore'])
+    parser.add_argument('file', help="файл снимка, '-' - stdin/stdout")
+    parser.add_argument('--replace', action='store_true', help='заменить элементы непустой базы')
+    args = parser.parse_args()
+
+    engine = init_engine(DATABASE_URL)
+    migrate(engine)
+    if args.command == 'export':
+        with engine.connect() as database, openSnapshot(args.file, 'wb') as output:
+            output.writelines(exportLines(database))
+        return
+    with openSnapshot(args.file, 'rb') as lines:
+        try:
+            count = restoreSnapshot(lines, engine, args.replace)
+        except ValidateExeption as error:
+            print(json.dumps({'error': str(error), 'errors': error.errors}))
+            sys.exit(1)
+    print(json.dumps({'restored': count}))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,5 @@
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
 
 
 class ItemForm(BaseModel):
@@ -15,4 +14,15 @@ class ItemForm(BaseModel):
 class ImportForm(BaseModel):
     """Форма для предствления импорта"""
     items: list[ItemForm]
-    updateDate: str = datetime.now().isoformat()
+    # без даты импорт получает время запроса
+    updateDate: Optional[str] = None
+
+
+class IdsForm(BaseModel):
+    """Форма для пакетных запросов по списку id"""
+    ids: list[str]
+
+
+class NodesBatchForm(IdsForm):
+    """Форма для пакетного запроса узлов"""
+    depth: Optional[int] = None
@@ -1,23 +1,72 @@
-from datetime import datetime
+import inspect
+import time
 
-from fastapi import APIRouter, Depends, HTTPException
-from app.forms import ImportForm
-from app.db.models import connection_db, Item
+from tempfile import SpooledTemporaryFile
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from app.forms import ImportForm, IdsForm, NodesBatchForm
+from app.db import models
+from app.db.models import connection_db, Item, SessionLocal
+from app.config import CHANGES_PAGE_LIMIT, CHANGES_MAX_WAIT
+from app.db.snapshot import exportLines, restoreSnapshot, MEDIA_TYPE as SNAPSHOT_MEDIA_TYPE, SPOOL_SIZE
 from starlette import status
 
-from app.validations import validateDate, validateItems, validateUrl
-from app.utils.utils import deletingChildrenOfFolder, getLastUpdates, \
-    checkFolderForChildren, addItem, updateItem, countSize, updateParentsDate
-from app.utils.exceptions import ValidateExeption, NotFoundExeption
+from app.validations import validateItems, validateNoCycles, validateUrl
+from app.utils.utils import removeItem, lastUpdatesQuery, saveHistory, getHistory, \
+    loadItemsWithAncestors, importItems, childrenQuery, decodeIdCursor, countTree, decodeUpdatesCursor, \
+    getFolderStats
+from app.utils.dates import parseDate, requestDate, dayWindow
+from app.utils.exceptions import ValidateExeption, NotFoundExeption, PreconditionExeption
+from app.utils.cache import nodesCache, pathCache, cacheParts, invalidateItems, clearCaches
+from app.utils import import_queue, tree_index
+from app.utils.tree_index import commitChanges, startTreeIndex
+from app.utils import changes
+from app.utils.changes import recordChanges, recordDelete, lastChangeSeq, readChangesPage, waitForChanges, \
+    parseIfMatch, checkUnchangedSince
+from app.utils.writes import runWrite
+from app.utils.metrics import renderMetrics, cacheGauges, treeGauges, importQueueGauges
+from app.utils.streaming import jsonResponse, encodeNode, encodeUpdates, encodeChildren, \
+    JSONStreamingResponse, bufferChunks, encodeNodesBatch
 
 BAD_REQUEST_DETAIL = "Невалидная схема документа или входные данные не верны."
 NOT_FOUND_DETAIL = "Элемент не найден."
+CHANGES_GONE_DETAIL = "Журнал изменений уплотнён, нужна полная синхронизация."
+PRECONDITION_DETAIL = "Элементы изменились после версии из If-Match."
 
 router = APIRouter()
+# маршруты режима очереди импортов, заменяют одноимённые маршруты router
+queueRouter = APIRouter()
+
+
+def importError(error: ValidateExeption) -> HTTPException:
+    """Ответ 400 на невалидный импорт: ошибки элементов отдаются все сразу"""
+    detail = {'message': BAD_REQUEST_DETAIL, 'errors': error.errors} if error.errors else BAD_REQUEST_DETAIL
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def writeImport(database, import_values: ImportForm, updateDate, ifMatch: int | None) -> set[str]:
+    """Проверка и запись импорта в транзакции записи (см. runWrite)"""
+    # существующие элементы импорта, их новые родители и все предки - одним запросом
+    itemIds = {item.id for item in import_values.items}
+    itemIds.update(item.parentId for item in import_values.items if item.parentId)
+    existing = loadItemsWithAncestors(list(itemIds), database)
+    validateItems(import_values.items, existing)
+    validateNoCycles(import_values.items, existing)
+    if ifMatch is not None:
+        checkUnchangedSince({item.id for item in import_values.items}, ifMatch, database)
+
+    changed = importItems(import_values.items, existing, updateDate, database)
+    saveHistory(changed, updateDate, database)
+    recordChanges(changed, database)
+    commitChanges(database, changed)
+    return changed
 
 
 @router.post('/imports', name='')
-def importItem(import_values: ImportForm, database=Depends(connection_db)):
+def importItem(import_values: ImportForm, if_match: str | None = Header(None), database=Depends(connection_db)):
     """
     Импортирует элементы файловой системы. Элементы импортированные повторно обновляют текущие.
     Изменение типа элемента с папки на файл и с файла на папку не допускается.
@@ -35,46 +84,125 @@ def importItem(import_values: ImportForm, database=Depends(connection_db)):
     - при обновлении элемента обновленными считаются **все** их параметры
     - при обновлении параметров элемента обязательно обновляется поле **date** в соответствии с временем обновления
     - в одном запросе не может быть двух элементов с одинаковым id
+    - при ошибках в элементах в detail ответа 400 перечисляются все ошибки
     - дата обрабатывается согласно ISO 8601 (такой придерживается OpenAPI). Если дата не удовлетворяет данному формату, ответом будет код 400.
+    - заголовок If-Match с номером журнала изменений (lastSeq из GET /changes, X-Changes-Seq
+    из GET /export) делает импорт условным: если какой-то из элементов изменился после этого
+    номера, ничего не записывается и ответом будет код 412
     """
     try:
-        validateDate(import_values.updateDate)
-        validateItems(import_values.items, database)
-    except ValidateExeption:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=BAD_REQUEST_DETAIL)
-    
-    for item in import_values.items:
-        existsFile = database.query(Item).filter(Item.id == item.id).one_or_none()
-        if existsFile:
-            updateItem(item, import_values.updateDate, database)
-        else:
-            addItem(item, import_values.updateDate, database)
-    
-    database.commit()
+        updateDate = requestDate(import_values.updateDate)
+        ifMatch = parseIfMatch(if_match)
+        changed = runWrite(database, writeImport, import_values, updateDate, ifMatch)
+    except ValidateExeption as error:
+        raise importError(error)
+    except PreconditionExeption:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=PRECONDITION_DETAIL)
+    invalidateItems(changed)
+    raise HTTPException(status_code=status.HTTP_200_OK, detail="Вставка или обновление прошли успешно.")
+
+
+@queueRouter.post('/imports', name='', description=inspect.cleandoc(importItem.__doc__))
+def importItemQueued(import_values: ImportForm, if_match: str | None = Header(None)):
+    # без сессии базы: пишет поток очереди, а в асинхронном режиме обработчик остаётся
+    # синхронным и ждёт результата в пуле потоков, не блокируя цикл событий
+    try:
+        import_queue.importQueue.submit(import_values.items, requestDate(import_values.updateDate),
+                                        parseIfMatch(if_match))
+    except ValidateExeption as error:
+        raise importError(error)
+    except PreconditionExeption:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=PRECONDITION_DETAIL)
     raise HTTPException(status_code=status.HTTP_200_OK, detail="Вставка или обновление прошли успешно.")
 
 
+def overrideRoutes(router: APIRouter, overrides: APIRouter) -> APIRouter:
+    """Копия router, в которой маршруты с теми же путём и методом взяты из overrides"""
+    replaced = {(route.path, method): route for route in overrides.routes for method in route.methods}
+    result = APIRouter()
+    for route in router.routes:
+        result.routes.append(next((replaced[route.path, method] for method in route.methods
+                                   if (route.path, method) in replaced), route))
+    return result
+
+
+def writeDelete(database, id: str, updateDate) -> list[str]:
+    """Удаление в транзакции записи (см. runWrite)"""
+    # проверка на существование элемента
+    if not database.query(Item.id).filter(Item.id == id).one_or_none():
+        raise NotFoundExeption(id)
+    recordDelete(id, updateDate, database)
+    changed = removeItem(id, updateDate, database)
+    # строк удалённых элементов уже нет: записи UPDATE получат только предки
+    recordChanges(changed, database)
+    commitChanges(database, changed)
+    return changed
+
+
 @router.delete('/delete/{id}', name='')
-def deleteItem(item_id: str, date: str = datetime.now().isoformat(), database=Depends(connection_db)):
+def deleteItem(id: str, date: str | None = None, database=Depends(connection_db)):
     """
     Удалить элемент по идентификатору. При удалении папки удаляются все дочерние элементы.
     Доступ к истории обновлений удаленного элемента невозможен.
     """
-    # проверка на существование элемента
-    existsFile = database.query(Item).filter(Item.id == item_id).one_or_none()
-    if existsFile:
-        if existsFile.type == 'FOLDER':
-            deletingChildrenOfFolder(item_id, database)
-        updateParentsDate(existsFile.parentId, date, database)
-        database.query(Item).filter(Item.id == item_id).delete()
-        database.commit()
-        raise HTTPException(status_code=status.HTTP_200_OK, detail="Удаление прошло успешно.")
-    else:
+    try:
+        updateDate = requestDate(date)
+        changed = runWrite(database, writeDelete, id, updateDate)
+    except ValidateExeption:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=BAD_REQUEST_DETAIL)
+    except NotFoundExeption:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=NOT_FOUND_DETAIL)
+    invalidateItems(changed)
+    raise HTTPException(status_code=status.HTTP_200_OK, detail="Удаление прошло успешно.")
+
+
+@router.get('/export', name='')
+def exportDisk(database=Depends(connection_db)):
+    """
+    Выгрузка всех элементов в NDJSON: по строке на элемент, родитель раньше детей.
+    Ответ подходит для POST /restore. Заголовок X-Changes-Seq - номер журнала изменений,
+    которому соответствует выгрузка: с него продолжается GET /changes.
+    """
+    # номер читается в той же транзакции, что и выгрузка
+    seq = lastChangeSeq(database)
+    return JSONStreamingResponse(bufferChunks(exportLines(database)), media_type=SNAPSHOT_MEDIA_TYPE,
+                                 headers={'X-Changes-Seq': str(seq)})
+
+
+def restoreFromFile(body, replace: bool) -> int:
+    count = restoreSnapshot(body, models.engine, replace)
+    # восстановление идёт мимо commitChanges: кэши и индекс собираются заново
+    clearCaches()
+    changes.notifyChanges()
+    if tree_index.treeIndex is not None:
+        with SessionLocal() as database:
+            startTreeIndex(database)
+    return count
+
+
+@router.post('/restore', name='')
+async def restoreDisk(request: Request, replace: bool = False):
+    """
+    Загрузка снимка из GET /export одной транзакцией. Без replace база должна быть пустой,
+    с replace прежние элементы заменяются. Элементы должны идти в порядке выгрузки.
+    """
+    # тело копится на диске, а не в памяти; загрузка идёт в потоке пула
+    body = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+        count = await run_in_threadpool(restoreFromFile, body, replace)
+    except ValidateExeption as error:
+        raise importError(error)
+    finally:
+        body.close()
+    raise HTTPException(status_code=status.HTTP_200_OK, detail=f"Восстановлено элементов: {count}.")
 
 
 @router.get('/nodes/{id}', name='')
-def getNodes(id: str, database=Depends(connection_db)):
+def getNodes(id: str, depth: int | None = None, limit: int | None = None, cursor: str | None = None,
+             database=Depends(connection_db)):
     """
     Получить информацию об элементе по идентификатору. При получении информации о папке также 
     предоставляется информация о её дочерних элементах.
@@ -83,67 +211,214 @@ def getNodes(id: str, database=Depends(connection_db)):
     - размер папки - это суммарный размер всех её элементов. Если папка не содержит элементов, 
     то размер равен 0. При обновлении размера элемента, суммарный размер папки, которая содержит 
     этот элемент, тоже обновляется.
+    - depth ограничивает глубину вложенности: у папок на этой глубине children равно null,
+    размер при этом остаётся полным
+    - limit включает постраничную выдачу прямых детей в порядке id: в ответе появляется
+    nextCursor, который передаётся в cursor для получения следующей страницы
     """
+    try:
+        if depth is not None and depth < 0 or limit is not None and limit <= 0:
+            raise ValidateExeption("Invalid depth or limit")
+        after = decodeIdCursor(cursor) if cursor else None
+    except ValidateExeption:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=BAD_REQUEST_DETAIL)
+    index = tree_index.treeIndex
+    if index is not None:
+        with index.lock:
+            if id not in index:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=NOT_FOUND_DETAIL)
+            content = b''.join(index.encodeNode(id, depth, limit, after))
+        return Response(content=content, media_type='application/json')
+    # в кэше только полные ответы без параметров
+    cacheable = depth is None and limit is None and cursor is None
+    cached = nodesCache.get(id) if cacheable else None
+    if cached is not None:
+        return Response(content=cached, media_type='application/json')
+    # версия берётся до чтения: если дерево изменится во время запроса, ответ не закэшируется
+    version = nodesCache.version()
     # проверка на существование элемента
     existsItem = database.query(Item).filter(Item.id == id).one_or_none()
-    if existsItem and existsItem.type == 'FILE':
-        return {
-            'id': existsItem.id,
-            'url': existsItem.url,
-            'type': existsItem.type,
-            'parentId': existsItem.parentId,
-            'date': existsItem.updateDate,
-            'size': existsItem.size
-        }
-    elif existsItem and existsItem.type == 'FOLDER':
-        response = {
-            'id': existsItem.id,
-            'url': existsItem.url,
-            'type': existsItem.type,
-            'parentId': existsItem.parentId,
-            'date': existsItem.updateDate,
-            'size': existsItem.size,
-            'children': []
-        }
-        checkFolderForChildren(response['children'], id, database)
-        response = countSize(response)
-        return response
-    else:
+    if not existsItem:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=NOT_FOUND_DETAIL)
+    parts = encodeNode(existsItem, database, depth, limit, after)
+    if cacheable:
+        parts = cacheParts(nodesCache, id, version, parts)
+    return jsonResponse(parts)
+
+
+@router.post('/nodes/batch', name='')
+def getNodesBatch(form: NodesBatchForm, database=Depends(connection_db)):
+    """
+    Несколько элементов за один запрос: items в порядке ids, каждый - как ответ GET /nodes/{id}
+    с тем же depth. Для отсутствующего id в items приходит {"id", "error"}, остальные
+    элементы выдаются как обычно. Поддеревья читаются ограниченным числом запросов,
+    пересекающиеся поддеревья - один раз.
+    """
+    if form.depth is not None and form.depth < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=BAD_REQUEST_DETAIL)
+    index = tree_index.treeIndex
+    if index is not None:
+        parts = []
+        with index.lock:
+            for id in form.ids:
+                parts.append(b''.join(index.encodeNode(id, form.depth)) if id in index else
+                             orjson.dumps({'id': id, 'error': "Item not found"}))
+        return Response(content=b'{"items":[' + b','.join(parts) + b']}', media_type='application/json')
+    return jsonResponse(encodeNodesBatch(form.ids, database, form.depth))
+
+
+@router.get('/cache/stats', name='')
+def getCacheStats():
+    """
+    Счётчики кэшей: ответов GET /nodes/{id} и проверенных путей GET /children
+    (попадания, промахи, вытеснения и занятый объём).
+    """
+    return {'nodes': nodesCache.stats(), 'paths': pathCache.stats()}
+
+
+@router.get('/metrics', name='', response_class=PlainTextResponse)
+def getMetrics(database=Depends(connection_db)):
+    """
+    Метрики в текстовом формате Prometheus: задержки и число SQL-запросов по маршрутам,
+    попадания в кэши и размер дерева.
+    """
+    counts, totalSize = countTree(database)
+    gauges = cacheGauges({'nodes': nodesCache.stats(), 'paths': pathCache.stats()}) + treeGauges(counts, totalSize)
+    if import_queue.importQueue is not None:
+        gauges += importQueueGauges(import_queue.importQueue.stats())
+    return PlainTextResponse(renderMetrics(gauges), media_type='text/plain; version=0.0.4')
+
+
+@router.get('/node/{id}/history', name='')
+def getNodeHistory(id: str, dateStart: str | None = None, dateEnd: str | None = None,
+                   database=Depends(connection_db)):
+    """
+    Получение истории обновлений по элементу за заданный полуинтервал [from, to).
+    История по удаленным элементам недоступна.
+
+    - размер папки - это суммарный размер всех её элементов
+    - можно получить статистику за всё время.
+    """
+    try:
+        start = parseDate(dateStart) if dateStart is not None else None
+        end = parseDate(dateEnd) if dateEnd is not None else None
+        if start and end and start > end:
+            raise ValidateExeption("Invalid interval")
+    except ValidateExeption:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=BAD_REQUEST_DETAIL)
+    if not database.query(Item.id).filter(Item.id == id).one_or_none():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=NOT_FOUND_DETAIL)
+    return {'items': getHistory(id, database, start, end)}
+
+
+@router.get('/node/{id}/stats', name='')
+def getNodeStats(id: str, database=Depends(connection_db)):
+    """
+    Агрегаты папки: размер, число файлов и папок в поддереве, глубина самого глубокого
+    потомка (у прямого ребёнка - 1) и дата последнего обновлённого файла (null, если файлов нет).
+    Значения хранятся и поддерживаются при импорте и удалении, поддерево не обходится.
+
+    - для файла ответом будет код 400
+    """
+    stats, = getFolderStats([id], database)
+    if stats.get('error') == "Item not found":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=NOT_FOUND_DETAIL)
+    if 'error' in stats:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=BAD_REQUEST_DETAIL)
+    return stats
+
+
+@router.post('/nodes/stats/batch', name='')
+def getNodesStats(form: IdsForm, database=Depends(connection_db)):
+    """
+    Агрегаты нескольких папок за один запрос, в порядке ids. Для отсутствующего элемента
+    и файла в items вместо агрегатов приходит {"id", "error"}.
+    """
+    return {'items': getFolderStats(form.ids, database)}
 
 
 @router.get('/updates', name='')
-def getUpdates(date: str, database=Depends(connection_db)):
+def getUpdates(date: str, limit: int | None = None, cursor: str | None = None,
+               database=Depends(connection_db)):
     """
     Получение списка **файлов**, которые были обновлены за последние 24 часа включительно 
     [date - 24h, date] от времени переданном в запросе.
+
+    - limit включает постраничную выдачу: в ответе появляется nextCursor, который передаётся
+    в cursor для получения следующей страницы (null на последней странице)
     """
-    if not validateDate(date):
+    try:
+        updateDate = parseDate(date)
+        if limit is not None and limit <= 0:
+            raise ValidateExeption("Invalid limit")
+        index = tree_index.treeIndex
+        if index is not None:
+            start, end = dayWindow(updateDate)
+            after = decodeUpdatesCursor(cursor) if cursor else None
+            with index.lock:
+                rows = index.updates(start, end, after, limit)
+        else:
+            rows = lastUpdatesQuery(updateDate, database, limit, cursor).yield_per(1000)
+    except ValidateExeption:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=BAD_REQUEST_DETAIL)
+    return jsonResponse(encodeUpdates(rows, limit))
+
+
+@router.get('/changes', name='')
+async def getChanges(since: int = 0, limit: int | None = None, wait: float = 0):
+    """
+    Журнал изменений после номера since в порядке номеров: UPDATE - новое состояние
+    элемента (в том числе предка с обновлённой датой), DELETE - удаление элемента вместе
+    с поддеревом, RESET - дерево заменено восстановлением. lastSeq передаётся в since
+    следующего запроса, hasMore - есть ли ещё записи.
+
+    - limit ограничивает страницу (не больше CHANGES_PAGE_LIMIT записей)
+    - wait - долгий опрос: если новых записей нет, ответ ждёт их до wait секунд
+    - если записи после since уже удалены уплотнением журнала, ответом будет код 410:
+    клиент заново забирает дерево через GET /export и продолжает с номера из заголовка X-Changes-Seq
+    """
+    if since < 0 or limit is not None and limit <= 0 or wait < 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=BAD_REQUEST_DETAIL)
-    return {'items': getLastUpdates(date, database)}
+    limit = min(limit or CHANGES_PAGE_LIMIT, CHANGES_PAGE_LIMIT)
+    deadline = time.monotonic() + min(wait, CHANGES_MAX_WAIT)
+    while True:
+        version = changes.changesVersion
+        page = await run_in_threadpool(readChangesPage, since, limit)
+        if page is None:
+            raise HTTPException(status_code=status.HTTP_410_GONE, detail=CHANGES_GONE_DETAIL)
+        if page['items'] or time.monotonic() >= deadline:
+            return page
+        await waitForChanges(version, deadline)
 
 
 @router.get('/children', name='')
-def getChildren(url:str, database=Depends(connection_db)):
+def getChildren(url:str, limit: int | None = None, cursor: str | None = None,
+                database=Depends(connection_db)):
     """
     Вводите путь -> показывает вложенные файлы. Начинать с home/
+
+    - limit включает постраничную выдачу в порядке id: в ответе появляется nextCursor,
+    который передаётся в cursor для получения следующей страницы
     """
     url_headers = url.strip().split('/')
-    response = {'url_headings': url_headers, 'items':[url_headers[-1]]}
 
     try:
+        if limit is not None and limit <= 0:
+            raise ValidateExeption("Invalid limit")
+        after = decodeIdCursor(cursor) if cursor else None
         validateUrl(url_headers, database)
     except ValidateExeption:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=BAD_REQUEST_DETAIL)
     except NotFoundExeption:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=NOT_FOUND_DETAIL)
 
-    if len(url_headers) == 1:
-        response['items'] = database.query(Item).filter(Item.parentId == None).all()
-        return response
-    last_header = url_headers[-1]
-    response['items'] = database.query(Item).filter(Item.parentId == last_header).all()
-
-    return response
+    parentId = None if len(url_headers) == 1 else url_headers[-1]
+    index = tree_index.treeIndex
+    if index is not None:
+        with index.lock:
+            rows = index.childrenRows(parentId, limit, after)
+    else:
+        rows = childrenQuery(parentId, database, limit, after).yield_per(1000)
+    return jsonResponse(encodeChildren(url_headers, rows, limit))
 
     # raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=BAD_REQUEST_DETAIL)
\ No newline at end of file
@@ -1,34 +1,56 @@
 import os
 
 from fastapi import FastAPI
-from app.handlers import router
+from app.handlers import router, queueRouter, overrideRoutes
+from app.async_handlers import makeAsyncRouter
 from app.config import VERSION, PROJECT_NAME, PROJECT_DESCRIPTION, BASE_ROUTER
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
-from app.config import DATABASE_URL
-
-def create_db():
-    engine = create_engine(DATABASE_URL)
-    session = Session(bind=engine.connect())
-    session.execute("""create table IF NOT EXISTS items(
-        id varchar(256) primary key,
-        parentId varchar(256),
-        url varchar(255) NULL,
-        size integer NULL,
-        type varchar(6) NULL,
-        updateDate varchar(256)
-    );""")
-
-    session.close()
-
-
-def get_application() -> FastAPI:
-    create_db()
+from sqlalchemy.engine import Engine
+from app.config import DATABASE_URL, DB_ASYNC, METRICS_ENABLED, IMPORT_QUEUE_ENABLED, TREE_INDEX_ENABLED
+from app.db.models import init_engine, init_async_engine, SessionLocal
+from app.db.migrations import migrate
+from app.utils.cache import clearCaches
+from app.utils.import_queue import startImportQueue, stopImportQueue
+from app.utils.tree_index import startTreeIndex, stopTreeIndex
+from app.utils.metrics import MetricsMiddleware, resetMetrics
+
+def create_db(engine: Engine):
+    """Создаёт и обновляет схему базы версионными миграциями"""
+    migrate(engine)
+
+
+def get_application(database_url: str = DATABASE_URL, async_mode: bool = DB_ASYNC,
+                    import_queue: bool = IMPORT_QUEUE_ENABLED, tree_index: bool = TREE_INDEX_ENABLED) -> FastAPI:
+    # очередь прежнего приложения пишет в прежнюю базу
+    stopImportQueue()
+    # синхронный engine нужен и в асинхронном режиме: на нём выполняются миграции
+    engine = init_engine(database_url)
+    create_db(engine)
+    # кэши и индекс относятся к прежней базе
+    clearCaches()
+    stopTreeIndex()
+    if tree_index:
+        with SessionLocal() as database:
+            startTreeIndex(database)
     application = FastAPI(title=PROJECT_NAME,
                           version=VERSION,
                           description=PROJECT_DESCRIPTION)
-    application.include_router(router, tags=[BASE_ROUTER])
+    routes = router
+    if import_queue:
+        # очередь пишет через синхронный engine и в асинхронном режиме
+        startImportQueue()
+        routes = overrideRoutes(router, queueRouter)
+        application.add_event_handler('shutdown', stopImportQueue)
+    if async_mode:
+        async_engine = init_async_engine(database_url)
+        application.include_router(makeAsyncRouter(routes), tags=[BASE_ROUTER])
+        application.add_event_handler('shutdown', async_engine.dispose)
+    else:
+        application.include_router(routes, tags=[BASE_ROUTER])
+    application.add_event_handler('shutdown', engine.dispose)
+    if METRICS_ENABLED:
+        resetMetrics()
+        application.add_middleware(MetricsMiddleware)
     return application
 
 
@@ -0,0 +1,261 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Iterable, Iterator
+
+from app.config import NODES_CACHE_ENABLED, NODES_CACHE_BACKEND, NODES_CACHE_MAX_ITEMS, \
+    NODES_CACHE_MAX_BYTES, PATH_CACHE_MAX_ITEMS
+
+
+class CacheBackend(ABC):
+    """
+    Интерфейс кэша ответов: значения - сериализованные ответы (bytes).
+    version растёт при каждой инвалидации: значение, прочитанное из базы до неё,
+    не попадает в кэш (set с устаревшей версией игнорируется).
+    """
+    enabled = True
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, version: int) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, keys: Iterable[str]) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def version(self) -> int:
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+class DisabledCache(CacheBackend):
+    """Кэш выключен: ничего не хранит"""
+    enabled = False
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, version):
+        pass
+
+    def delete(self, keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def version(self):
+        return 0
+
+    def stats(self):
+        return {'enabled': False}
+
+
+class LRUCache(CacheBackend):
+    """Кэш в памяти процесса с вытеснением давно неиспользуемых записей по числу и объёму"""
+
+    def __init__(self, maxItems: int, maxBytes: int):
+        self.maxItems = maxItems
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._version = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, version):
+        if len(value) > self.maxBytes:
+            return
+        with self.lock:
+            if version != self._version:
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self.entries[key] = value
+            self.bytes += len(value)
+            while len(self.entries) > self.maxItems or self.bytes > self.maxBytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self.lock:
+            self._version += 1
+            for key in keys:
+                old = self.entries.pop(key, None)
+                if old is not None:
+                    self.bytes -= len(old)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self._version += 1
+            self.entries.clear()
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def version(self):
+        with self.lock:
+            return self._version
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': True,
+                'items': len(self.entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+def cacheParts(cache: CacheBackend, key: str, version: int, parts: Iterable[bytes],
+               maxBytes: int = NODES_CACHE_MAX_BYTES) -> Iterator[bytes]:
+    """Пропускает куски ответа дальше и кладёт собранный ответ в кэш, если он не больше maxBytes"""
+    collected, total = ([] if cache.enabled else None), 0
+    for part in parts:
+        if collected is not None:
+            total += len(part)
+            if total > maxBytes:
+                collected = None
+            else:
+                collected.append(part)
+        yield part
+    if collected is not None:
+        cache.set(key, b''.join(collected), version)
+
+
+class PathCache:
+    """
+    Кэш проверенных путей GET /children: путь -> id элементов цепочки. Хранит только
+    существующие цепочки; запись удаляется, если изменился любой элемент цепочки.
+    """
+
+    def __init__(self, maxItems: int):
+        self.maxItems = maxItems
+        self.entries = OrderedDict()
+        # id элемента -> пути, в которые он входит
+        self.paths = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._version = 0
+        self.lock = Lock()
+
+    def get(self, path: str) -> tuple | None:
+        with self.lock:
+            ids = self.entries.get(path)
+            if ids is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return ids
+
+    def set(self, path: str, ids: tuple, version: int) -> None:
+        if not self.maxItems:
+            return
+        with self.lock:
+            if version != self._version or path in self.entries:
+                return
+            self.entries[path] = ids
+            for id in ids:
+                self.paths.setdefault(id, set()).add(path)
+            while len(self.entries) > self.maxItems:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, path: str) -> None:
+        for id in self.entries.pop(path):
+            paths = self.paths.get(id)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self.paths[id]
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self.lock:
+            self._version += 1
+            for id in ids:
+                for path in list(self.paths.get(id, ())):
+                    self._remove(path)
+
+    def clear(self) -> None:
+        with self.lock:
+            self._version += 1
+            self.entries.clear()
+            self.paths.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def version(self) -> int:
+        with self.lock:
+            return self._version
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'enabled': bool(self.maxItems),
+                'items': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+# доступные реализации; общий для нескольких процессов кэш добавляется сюда
+CACHE_BACKENDS = {
+    'memory': lambda: LRUCache(NODES_CACHE_MAX_ITEMS, NODES_CACHE_MAX_BYTES),
+}
+
+
+def createCache(enabled: bool = NODES_CACHE_ENABLED, backend: str = NODES_CACHE_BACKEND) -> CacheBackend:
+    """Создаёт кэш по настройкам"""
+    if not enabled:
+        return DisabledCache()
+    return CACHE_BACKENDS[backend]()
+
+
+# кэш ответов GET /nodes/{id}: ключ - id элемента
+nodesCache = createCache()
+# кэш путей GET /children
+pathCache = PathCache(PATH_CACHE_MAX_ITEMS)
+
+
+def invalidateItems(ids: Iterable[str]) -> None:
+    """Сбрасывает записи кэшей, зависящие от изменённых или удалённых элементов"""
+    ids = list(ids)
+    nodesCache.delete(ids)
+    pathCache.delete(ids)
+
+
+def clearCaches() -> None:
+    nodesCache.clear()
+    pathCache.clear()
@@ -0,0 +1,158 @@
+"""
+Журнал изменений для инкрементальной синхронизации. Каждая запись дерева добавляет в
+item_changes по записи на изменённый элемент (импорт, обновление даты предка) и на
+удалённое поддерево - в той же транзакции, что и сама запись. Номер seq растёт
+монотонно; клиент забирает записи после последнего полученного номера через GET /changes.
+Журнал уплотняется до CHANGES_MAX_ENTRIES последних записей.
+"""
+import asyncio
+import time
+from datetime import datetime
+from threading import Lock
+
+from sqlalchemy import func, insert, select, literal, delete
+
+from app.config import CHANGES_MAX_ENTRIES, CHANGES_POLL_INTERVAL
+from app.db.models import Item, ItemChange, SessionLocal
+from app.utils.dates import formatDate
+from app.utils.exceptions import ValidateExeption, PreconditionExeption
+from app.utils.utils import chunks
+
+# ключ pg_advisory_xact_lock: записи журнала фиксируются в порядке номеров, иначе клиент
+# мог бы пропустить меньший номер, зафиксированный позже большего
+CHANGES_LOCK_ID = 2022090102
+CHANGE_COLUMNS = ['kind', 'itemId', 'parentId', 'url', 'size', 'type', 'date']
+
+# счётчик записей процесса: долгий опрос перечитывает журнал, как только он сдвинулся
+changesVersion = 0
+# ждущие долгого опроса: (цикл событий, событие), будятся notifyChanges
+waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+waitersLock = Lock()
+
+
+def lockChanges(database) -> None:
+    if database.bind.dialect.name == 'postgresql':
+        database.execute(select(func.pg_advisory_xact_lock(CHANGES_LOCK_ID)))
+
+
+def recordChanges(itemIds, database) -> None:
+    """Добавляет в журнал текущее состояние элементов (записи UPDATE) одним INSERT ... SELECT на пачку"""
+    lockChanges(database)
+    for chunk in chunks(list(itemIds)):
+        database.execute(insert(ItemChange).from_select(CHANGE_COLUMNS, select(
+            literal('UPDATE'), Item.id, Item.parentId, Item.url, Item.size, Item.type, Item.updateDate
+        ).where(Item.id.in_(chunk))))
+    compactChanges(database)
+
+
+def recordDelete(itemId: str, date: datetime, database) -> None:
+    """Добавляет в журнал удаление элемента; вызывается до удаления строки"""
+    lockChanges(database)
+    database.execute(insert(ItemChange).from_select(CHANGE_COLUMNS, select(
+        literal('DELETE'), Item.id, Item.parentId, Item.url, Item.size, Item.type, literal(date, ItemChange.date.type)
+    ).where(Item.id == itemId)))
+
+
+def compactChanges(database) -> None:
+    """Оставляет в журнале не больше CHANGES_MAX_ENTRIES последних записей"""
+    if not CHANGES_MAX_ENTRIES:
+        return
+    lastSeq = database.query(func.max(ItemChange.seq)).scalar()
+    if lastSeq is not None and lastSeq > CHANGES_MAX_ENTRIES:
+        database.execute(delete(ItemChange).where(ItemChange.seq <= lastSeq - CHANGES_MAX_ENTRIES))
+
+
+def lastChangeSeq(database) -> int:
+    return database.query(func.max(ItemChange.seq)).scalar() or 0
+
+
+def parseIfMatch(value: str | None) -> int | None:
+    """Номер журнала из заголовка If-Match вида "12", 12 или W/"12"; без заголовка - None"""
+    if value is None:
+        return None
+    value = value.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    value = value.strip('"')
+    if not value.isdigit():
+        raise ValidateExeption("Invalid If-Match")
+    return int(value)
+
+
+def checkUnchangedSince(itemIds, since: int, database) -> None:
+    """
+    Условие If-Match: ни один из элементов не менялся после номера журнала since (в том
+    числе размером или датой из-за потомков). Если журнал после since уплотнён, проверить
+    это нельзя, и условие тоже не выполнено. Вызывается внутри транзакции записи
+    """
+    firstSeq = database.query(func.min(ItemChange.seq)).scalar()
+    if firstSeq is not None and since < firstSeq - 1:
+        raise PreconditionExeption(since)
+    for chunk in chunks(list(itemIds)):
+        changed = database.query(ItemChange.seq) \
+            .filter(ItemChange.seq > since, ItemChange.itemId.in_(chunk)).limit(1).first()
+        if changed:
+            raise PreconditionExeption(since)
+
+
+def readChanges(since: int, limit: int, database) -> dict | None:
+    """
+    Страница журнала после номера since. None - записи сразу после since уже удалены
+    уплотнением: клиенту нужна полная синхронизация через GET /export
+    """
+    firstSeq = database.query(func.min(ItemChange.seq)).scalar()
+    if firstSeq is not None and since < firstSeq - 1:
+        return None
+    rows = database.query(ItemChange).filter(ItemChange.seq > since).order_by(ItemChange.seq).limit(limit + 1).all()
+    items = [{
+        'seq': row.seq,
+        'kind': row.kind,
+        'id': row.itemId,
+        'parentId': row.parentId,
+        'url': row.url,
+        'size': row.size,
+        'type': row.type,
+        'date': formatDate(row.date)
+    } for row in rows[:limit]]
+    return {'items': items, 'lastSeq': items[-1]['seq'] if items else since, 'hasMore': len(rows) > limit}
+
+
+def readChangesPage(since: int, limit: int) -> dict | None:
+    """readChanges в своей сессии: у каждого перечитывания долгого опроса свежий снимок базы"""
+    with SessionLocal() as database:
+        return readChanges(since, limit, database)
+
+
+def notifyChanges() -> None:
+    """
+    Сообщает ждущим GET /changes о зафиксированной записи. Вызывается из любого потока:
+    события ждущих выставляются в их циклах событий через call_soon_threadsafe
+    """
+    global changesVersion
+    with waitersLock:
+        changesVersion += 1
+        pending = list(waiters)
+        waiters.clear()
+    for loop, event in pending:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # цикл событий ждущего уже закрыт
+            pass
+
+
+async def waitForChanges(version: int, deadline: float) -> None:
+    """Ждёт записи своего процесса после version, интервала перечитывания или deadline"""
+    waiter = (asyncio.get_running_loop(), asyncio.Event())
+    with waitersLock:
+        if changesVersion != version:
+            return
+        waiters.add(waiter)
+    try:
+        timeout = min(deadline, time.monotonic() + CHANGES_POLL_INTERVAL) - time.monotonic()
+        await asyncio.wait_for(waiter[1].wait(), max(timeout, 0))
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        with waitersLock:
+            waiters.discard(waiter)
@@ -0,0 +1,66 @@
+"""
+Даты API. Строка ISO 8601 разбирается один раз на входе в обработчик; дальше дата
+передаётся как datetime в UTC без tzinfo - в таком виде она хранится в базе, сравнивается
+и попадает в индексы. Наружу дата отдаётся в ISO 8601 с суффиксом Z.
+"""
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from app.utils.exceptions import ValidateExeption
+
+ISO8601 = re.compile(r'^(-?(?:[1-9][0-9]*)?[0-9]{4})-(1[0-2]|0[1-9])-(3[01]|0[1-9]|[12][0-9])'
+                     r'T(2[0-3]|[01][0-9]):([0-5][0-9]):([0-5][0-9])(\.[0-9]+)?(Z|[+-](?:2[0-3]|'
+                     r'[01][0-9]):[0-5][0-9])?$')
+DAY = timedelta(days=1)
+
+
+def toUtc(date: str) -> datetime:
+    """Переводит строку ISO 8601 в datetime UTC без tzinfo; дата без смещения считается датой UTC"""
+    if date[-1] == 'Z':
+        date = date[:-1] + '+00:00'
+    main, dot, fraction = date.partition('.')
+    if dot:
+        # fromisoformat принимает только 3 или 6 знаков после точки
+        digits = len(fraction) - len(fraction.lstrip('0123456789'))
+        date = main + '.' + fraction[:min(digits, 6)].ljust(6, '0') + fraction[digits:]
+    parsed = datetime.fromisoformat(date)
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parseDate(date: str) -> datetime:
+    """Проверяет дату из запроса на ISO 8601 и переводит её в UTC"""
+    if not isinstance(date, str) or ISO8601.match(date) is None:
+        raise ValidateExeption("Invalid date")
+    try:
+        return toUtc(date)
+    except (ValueError, OverflowError):
+        # формат верный, но такой даты нет: 2022-02-30 или смещение уводит за пределы годов 1-9999
+        raise ValidateExeption("Invalid date")
+
+
+def utcNow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def requestDate(date: str | None) -> datetime:
+    """Дата записи: переданная в запросе или текущая, если её нет"""
+    return utcNow() if date is None else parseDate(date)
+
+
+def dayWindow(date: datetime) -> tuple[datetime, datetime]:
+    """Окно /updates: сутки до даты включительно"""
+    try:
+        return date - DAY, date
+    except OverflowError:
+        raise ValidateExeption("Invalid date")
+
+
+@lru_cache(maxsize=4096)
+def formatDate(date: datetime) -> str:
+    """Переводит дату из базы в ISO 8601 с суффиксом Z (у элементов одного импорта даты совпадают)"""
+    if date.microsecond:
+        return date.strftime('%Y-%m-%dT%H:%M:%S.') + f'{date.microsecond // 1000:03d}Z'
+    return date.strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -1,7 +1,15 @@
 class ValidateExeption(Exception):
-    """Класс для обработки ошибки с элементом"""
-    pass
+    """Класс для обработки ошибки с элементом, errors - все найденные ошибки элементов"""
+
+    def __init__(self, message: str = "", errors: list[dict] | None = None):
+        super().__init__(message)
+        self.errors = errors or []
 
 class NotFoundExeption(Exception):
     """Класс для обработки ошибки с не найденным элементом"""
+    pass
+
+
+class PreconditionExeption(Exception):
+    """Класс для обработки невыполненного условия If-Match: элементы изменились после указанной версии"""
     pass
\ No newline at end of file
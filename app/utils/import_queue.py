@@ -0,0 +1,207 @@
+"""
+Очередь импортов с объединением записи. POST /imports кладёт пачку в очередь процесса,
+один поток-писатель собирает пачки за окно IMPORT_QUEUE_WINDOW_MS (или пока не наберётся
+IMPORT_QUEUE_MAX_ITEMS элементов) и записывает их одной транзакцией (app.utils.writes.runWrite).
+Каждая пачка проверяется отдельно, поэтому каждый вызывающий получает свой результат.
+Обновления предков объединяются только у идущих подряд пачек с одной датой (writeRequests).
+"""
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from queue import Queue, Empty
+from threading import Thread
+
+from app.config import IMPORT_QUEUE_WINDOW_MS, IMPORT_QUEUE_MAX_ITEMS, IMPORT_QUEUE_MAX_DEPTH
+from app.db.models import SessionLocal
+from app.forms import ItemForm
+from app.utils.cache import invalidateItems
+from app.utils.exceptions import ValidateExeption, PreconditionExeption
+from app.utils.tree_index import commitChanges
+from app.utils.metrics import IMPORT_BATCH_REQUESTS, IMPORT_BATCH_ITEMS, IMPORT_QUEUE_SECONDS
+from app.utils.utils import loadItemsWithAncestors, importItems, saveHistory
+from app.utils.changes import recordChanges, checkUnchangedSince
+from app.utils.writes import runWrite
+from app.validations import validateItems, validateNoCycles
+
+
+class ImportRequest:
+    """Пачка одного вызова POST /imports и её результат"""
+
+    def __init__(self, items: list[ItemForm], date: datetime, ifMatch: int | None = None):
+        self.items = items
+        self.date = date
+        # номер журнала из If-Match: пачка пишется, только если её элементы не менялись после него
+        self.ifMatch = ifMatch
+        self.future = Future()
+        self.queued = time.perf_counter()
+
+
+def importIds(requests: list[ImportRequest]) -> list[str]:
+    """id элементов пачек и их новых родителей для loadItemsWithAncestors"""
+    ids = {item.id for request in requests for item in request.items}
+    ids.update(item.parentId for request in requests for item in request.items if item.parentId)
+    return list(ids)
+
+
+def validateRequests(requests: list[ImportRequest], database) -> list[ImportRequest]:
+    """
+    Проверяет пачки в порядке поступления, как если бы они применялись по одной: каждая
+    следующая видит элементы принятых до неё. Отклонённые пачки получают свою ошибку,
+    возвращаются принятые.
+    """
+    # одно чтение на все пачки; принятые элементы перекрывают записи из базы
+    view = loadItemsWithAncestors(importIds(requests), database)
+    accepted, acceptedIds = [], set()
+    for request in requests:
+        ids = {item.id for item in request.items}
+        try:
+            validateItems(request.items, view)
+            validateNoCycles(request.items, view)
+            if request.ifMatch is not None:
+                # элементы, изменённые принятыми раньше пачками, в журнале ещё не видны
+                if not acceptedIds.isdisjoint(ids):
+                    raise PreconditionExeption(request.ifMatch)
+                checkUnchangedSince(ids, request.ifMatch, database)
+        except (ValidateExeption, PreconditionExeption) as error:
+            request.future.set_exception(error)
+            continue
+        acceptedIds |= ids
+        for item in request.items:
+            stored = view.get(item.id)
+            view[item.id] = {'parentId': item.parentId, 'type': item.type,
+                             'size': stored['size'] if stored else 0, 'path': None}
+        accepted.append(request)
+    return accepted
+
+
+def writeRequests(requests: list[ImportRequest], database) -> set[str]:
+    """
+    Записывает принятые пачки и возвращает id изменённых элементов. Подряд идущие пачки
+    с одной датой и без общих элементов сливаются в одну: один upsert, одно обновление
+    общих предков и одна запись истории. Остальные пишутся следом в той же транзакции.
+
+    Пачки разных дат не сливаются и не переставляются: при записи по одной дата предка -
+    дата последней пачки, а не наибольшая, и в истории предка остаётся версия на каждую
+    дату. Поэтому у пачек A(d1), B(d2), C(d1) под одной папкой три обновления предков.
+    """
+    changed = set()
+    start = 0
+    while start < len(requests):
+        # элемент из двух пачек прошёл бы через промежуточное состояние, которое при
+        # слиянии потерялось бы вместе с обновлением его промежуточных предков
+        end, ids = start, set()
+        while end < len(requests) and requests[end].date == requests[start].date \
+                and ids.isdisjoint(item.id for item in requests[end].items):
+            ids.update(item.id for item in requests[end].items)
+            end += 1
+        group = requests[start:end]
+        merged = [item for request in group for item in request.items]
+        existing = loadItemsWithAncestors(importIds(group), database)
+        groupChanged = importItems(merged, existing, group[0].date, database)
+        saveHistory(groupChanged, group[0].date, database)
+        recordChanges(groupChanged, database)
+        changed |= groupChanged
+        start = end
+    return changed
+
+
+def writeBatch(database, requests: list[ImportRequest]) -> tuple[list[ImportRequest], set[str]]:
+    """Проверка и запись пачек в транзакции записи; при повторе отклонённые уже пачки пропускаются"""
+    accepted = validateRequests([request for request in requests if not request.future.done()], database)
+    changed = writeRequests(accepted, database)
+    commitChanges(database, changed)
+    return accepted, changed
+
+
+def processRequests(requests: list[ImportRequest]) -> None:
+    """Проверяет и записывает собранные пачки одной транзакцией"""
+    with SessionLocal() as database:
+        try:
+            accepted, changed = runWrite(database, writeBatch, requests)
+        except Exception as error:
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(error)
+            return
+    invalidateItems(changed)
+    for request in accepted:
+        request.future.set_result(None)
+
+
+class ImportQueue:
+    """Очередь импортов с одним потоком-писателем"""
+
+    def __init__(self, windowMs: float = IMPORT_QUEUE_WINDOW_MS, maxItems: int = IMPORT_QUEUE_MAX_ITEMS,
+                 maxDepth: int = IMPORT_QUEUE_MAX_DEPTH):
+        self.window = windowMs / 1000
+        self.maxItems = maxItems
+        self.maxDepth = maxDepth
+        # при заполненной очереди submit ждёт, пока писатель её не разберёт
+        self.requests = Queue(maxsize=maxDepth)
+        self.thread = Thread(target=self.run, name='import-queue', daemon=True)
+        self.thread.start()
+
+    def submit(self, items: list[ItemForm], date: datetime, ifMatch: int | None = None) -> None:
+        """Ставит пачку в очередь и ждёт её записи; ошибки проверки выбрасываются вызывающему"""
+        request = ImportRequest(items, date, ifMatch)
+        self.requests.put(request)
+        request.future.result()
+
+    def collect(self, first: ImportRequest) -> tuple[list[ImportRequest], bool]:
+        """Собирает пачки за окно после первой; второй элемент - пришла ли команда остановки"""
+        batch, count = [first], len(first.items)
+        deadline = time.perf_counter() + self.window
+        while count < self.maxItems:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+            count += len(request.items)
+        return batch, False
+
+    def run(self) -> None:
+        stopped = False
+        while not stopped:
+            first = self.requests.get()
+            if first is None:
+                return
+            batch, stopped = self.collect(first)
+            now = time.perf_counter()
+            for request in batch:
+                IMPORT_QUEUE_SECONDS.observe((), now - request.queued)
+            IMPORT_BATCH_REQUESTS.observe((), len(batch))
+            IMPORT_BATCH_ITEMS.observe((), sum(len(request.items) for request in batch))
+            processRequests(batch)
+
+    def stop(self) -> None:
+        """Дописывает уже поставленные пачки и останавливает поток"""
+        self.requests.put(None)
+        self.thread.join()
+
+    def stats(self) -> dict:
+        return {'depth': self.requests.qsize(), 'window_seconds': self.window,
+                'max_items': self.maxItems, 'max_depth': self.maxDepth}
+
+
+importQueue: ImportQueue | None = None
+
+
+def startImportQueue() -> ImportQueue:
+    """Запускает очередь процесса, прежняя останавливается"""
+    global importQueue
+    stopImportQueue()
+    importQueue = ImportQueue()
+    return importQueue
+
+
+def stopImportQueue() -> None:
+    global importQueue
+    if importQueue is not None:
+        importQueue.stop()
+        importQueue = None
@@ -0,0 +1,281 @@
+"""
+Метрики сервиса в текстовом формате Prometheus без внешних зависимостей: задержки
+запросов по маршрутам, число и время SQL-запросов на запрос (события engine), журнал
+медленных запросов с самыми долгими SQL.
+"""
+import heapq
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+from app.config import SLOW_REQUEST_MS, SLOW_REQUEST_STATEMENTS
+
+logger = logging.getLogger('app.slow_requests')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500, 1000)
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500, 1000, 5000)
+INF_BUCKET = 'le="+Inf"'
+
+
+def escapeLabel(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def formatLabels(names: tuple, values: tuple, extra: str = '') -> str:
+    labels = [f'{name}="{escapeLabel(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def formatValue(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток"""
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = Lock()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.values.clear()
+
+    def header(self) -> list[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+
+    def render(self) -> list[str]:
+        with self.lock:
+            values = dict(self.values)
+        return self.header() + [f'{self.name}{formatLabels(self.labels, key)} {formatValue(value)}'
+                                for key, value in sorted(values.items())]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, labels: tuple = (), value: float = 0) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, labels: tuple, value: float) -> None:
+        with self.lock:
+            # [счётчики корзин, сумма, число наблюдений]
+            entry = self.values.setdefault(labels, [[0] * len(self.buckets), 0, 0])
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list[str]:
+        with self.lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self.values.items()}
+        lines = self.header()
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bucket, bucketCount in zip(self.buckets, counts):
+                cumulative += bucketCount
+                le = 'le="%s"' % bucket
+                lines.append(f'{self.name}_bucket{formatLabels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_bucket{formatLabels(self.labels, key, INF_BUCKET)} {count}')
+            lines.append(f'{self.name}_sum{formatLabels(self.labels, key)} {formatValue(total)}')
+            lines.append(f'{self.name}_count{formatLabels(self.labels, key)} {count}')
+        return lines
+
+
+REQUESTS = Counter('disk_http_requests_total', 'HTTP requests', ('method', 'route', 'status'))
+REQUEST_SECONDS = Histogram('disk_http_request_duration_seconds', 'HTTP request latency',
+                            ('method', 'route'))
+REQUEST_STATEMENTS = Histogram('disk_http_request_sql_statements', 'SQL statements per HTTP request',
+                               ('method', 'route'), STATEMENT_BUCKETS)
+REQUEST_SQL_SECONDS = Counter('disk_http_request_sql_seconds_total', 'Time spent in SQL by HTTP requests',
+                              ('method', 'route'))
+SLOW_REQUESTS = Counter('disk_http_slow_requests_total', 'HTTP requests slower than SLOW_REQUEST_MS',
+                        ('method', 'route'))
+SQL_STATEMENTS = Counter('disk_sql_statements_total', 'SQL statements, including ones outside requests')
+SQL_SECONDS = Counter('disk_sql_seconds_total', 'Time spent in SQL statements')
+IMPORT_BATCH_REQUESTS = Histogram('disk_import_queue_batch_requests', 'Imports merged into one transaction',
+                                  buckets=BATCH_BUCKETS)
+IMPORT_BATCH_ITEMS = Histogram('disk_import_queue_batch_items', 'Items written in one merged transaction',
+                               buckets=BATCH_BUCKETS)
+IMPORT_QUEUE_SECONDS = Histogram('disk_import_queue_wait_seconds', 'Time an import waits in the queue')
+WRITE_RETRIED = Counter('disk_write_retries_total', 'Write transactions retried after lock contention')
+
+METRICS = [REQUESTS, REQUEST_SECONDS, REQUEST_STATEMENTS, REQUEST_SQL_SECONDS, SLOW_REQUESTS,
+           SQL_STATEMENTS, SQL_SECONDS, IMPORT_BATCH_REQUESTS, IMPORT_BATCH_ITEMS, IMPORT_QUEUE_SECONDS,
+           WRITE_RETRIED]
+
+
+def resetMetrics() -> None:
+    for metric in METRICS:
+        metric.reset()
+
+
+class RequestStats:
+    """SQL-запросы текущего HTTP-запроса: число, время и самые долгие"""
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.slowest = []
+        self.lock = Lock()
+
+    def add(self, statement: str, seconds: float) -> None:
+        with self.lock:
+            self.statements += 1
+            self.seconds += seconds
+            entry = (seconds, self.statements, statement)
+            if len(self.slowest) < SLOW_REQUEST_STATEMENTS:
+                heapq.heappush(self.slowest, entry)
+            elif self.slowest and entry > self.slowest[0]:
+                heapq.heapreplace(self.slowest, entry)
+
+
+# объект статистики изменяемый: потоки пула и run_sync видят тот же экземпляр
+currentRequest: ContextVar[RequestStats | None] = ContextVar('currentRequest', default=None)
+
+
+def beforeCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    context._metricsStart = time.perf_counter()
+
+
+def afterCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - context._metricsStart
+    SQL_STATEMENTS.inc()
+    SQL_SECONDS.inc(amount=seconds)
+    stats = currentRequest.get()
+    if stats is not None:
+        stats.add(statement, seconds)
+
+
+def instrumentEngine(engine) -> None:
+    """Подписывает engine на учёт SQL-запросов"""
+    event.listen(engine, 'before_cursor_execute', beforeCursorExecute)
+    event.listen(engine, 'after_cursor_execute', afterCursorExecute)
+
+
+def findRoute(app, scope) -> str:
+    """Шаблон пути маршрута, чтобы id не попадали в метки"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: время запроса считается до отправки последнего байта, в том числе потокового"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        application = scope['app']
+        method, route = scope['method'], findRoute(application, scope)
+        stats = RequestStats()
+        token = currentRequest.set(stats)
+        statusCode = 500
+
+        async def sendWithStatus(message):
+            nonlocal statusCode
+            if message['type'] == 'http.response.start':
+                statusCode = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, sendWithStatus)
+        finally:
+            elapsed = time.perf_counter() - start
+            currentRequest.reset(token)
+            REQUESTS.inc((method, route, statusCode))
+            REQUEST_SECONDS.observe((method, route), elapsed)
+            REQUEST_STATEMENTS.observe((method, route), stats.statements)
+            REQUEST_SQL_SECONDS.inc((method, route), stats.seconds)
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                SLOW_REQUESTS.inc((method, route))
+                logger.warning('slow request %s %s %s: %.1f ms, %d statements, %.1f ms in SQL, slowest: %s',
+                               method, scope['path'], statusCode, elapsed * 1000, stats.statements,
+                               stats.seconds * 1000,
+                               '; '.join(f'{seconds * 1000:.1f} ms {" ".join(statement.split())[:200]}'
+                                         for seconds, _, statement in sorted(stats.slowest, reverse=True)))
+
+
+def cacheGauges(caches: dict[str, dict]) -> list[Metric]:
+    """Показатели кэшей по их stats()"""
+    counters = {name: Counter(f'disk_cache_{name}_total', help, ('cache',)) for name, help in (
+        ('hits', 'Cache hits'), ('misses', 'Cache misses'), ('evictions', 'Cache evictions'))}
+    items = Gauge('disk_cache_items', 'Cached entries', ('cache',))
+    hitRatio = Gauge('disk_cache_hit_ratio', 'Cache hit ratio', ('cache',))
+    for cache, stats in caches.items():
+        if not stats.get('enabled'):
+            continue
+        for name, counter in counters.items():
+            counter.inc((cache,), stats[name])
+        items.set((cache,), stats['items'])
+        lookups = stats['hits'] + stats['misses']
+        hitRatio.set((cache,), stats['hits'] / lookups if lookups else 0)
+    return list(counters.values()) + [items, hitRatio]
+
+
+def treeGauges(counts: dict[str, int], totalSize: int) -> list[Metric]:
+    """Размер дерева: число элементов по типам и суммарный размер файлов"""
+    items = Gauge('disk_tree_items', 'Items in the tree', ('type',))
+    for type, count in counts.items():
+        items.set((type,), count)
+    size = Gauge('disk_tree_size_bytes', 'Total size of all files')
+    size.set(value=totalSize)
+    return [items, size]
+
+
+def importQueueGauges(stats: dict) -> list[Metric]:
+    """Состояние очереди импортов: сколько пачек ждёт и её настройки"""
+    gauges = []
+    for name, help in (('depth', 'Imports waiting in the queue'),
+                       ('window_seconds', 'Window for merging imports'),
+                       ('max_items', 'Items limit of a merged transaction'),
+                       ('max_depth', 'Queue capacity')):
+        gauge = Gauge(f'disk_import_queue_{name}', help)
+        gauge.set(value=stats[name])
+        gauges.append(gauge)
+    return gauges
+
+
+def renderMetrics(gauges: list[Metric]) -> str:
+    """Текст для /metrics: накопленные метрики и снятые в момент запроса показатели"""
+    lines = []
+    for metric in METRICS + gauges:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
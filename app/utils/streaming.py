@@ -0,0 +1,300 @@
+from typing import Iterable, Iterator
+
+import orjson
+from fastapi import Response
+from collections import defaultdict
+
+from sqlalchemy import text, select, and_, or_, func, DateTime
+from fastapi.responses import StreamingResponse
+
+from app.config import STREAM_RESPONSES, STREAM_CHUNK_SIZE
+from app.db.models import Item
+from app.utils.dates import formatDate
+from app.utils.utils import encodeCursor, subtreeRange, childrenQuery, chunks
+
+MEDIA_TYPE = 'application/json'
+
+SUBTREE_RANGE_QUERY = text("""
+    SELECT id, url, type, "parentId", "updateDate", size FROM items
+    WHERE path > :start AND path < :end
+    ORDER BY path
+""").columns(updateDate=DateTime).execution_options(stream_results=True)
+
+SUBTREE_DEPTH_QUERY = text("""
+    SELECT id, url, type, "parentId", "updateDate", size FROM items
+    WHERE path > :start AND path < :end
+      AND length(path) - length(replace(path, '/', '')) <= :maxLevel
+    ORDER BY path
+""").columns(updateDate=DateTime).execution_options(stream_results=True)
+
+
+class JSONStreamingResponse(StreamingResponse):
+    """Потоковый JSON-ответ; исходный синхронный итератор порций доступен в chunks"""
+
+    def __init__(self, chunks: Iterator[bytes], media_type: str = MEDIA_TYPE, **kwargs):
+        self.chunks = chunks
+        super().__init__(chunks, media_type=media_type, **kwargs)
+
+
+def bufferChunks(parts: Iterable[bytes], size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Склеивает мелкие куски JSON в порции не меньше size байт"""
+    buffer = bytearray()
+    for part in parts:
+        buffer += part
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def jsonResponse(parts: Iterable[bytes], stream: bool = STREAM_RESPONSES) -> Response:
+    """Отдаёт JSON из кусков потоком или, если потоковый режим выключен, одним телом"""
+    if stream:
+        return JSONStreamingResponse(bufferChunks(parts))
+    return Response(content=b''.join(parts), media_type=MEDIA_TYPE)
+
+
+def dumpsOpen(value: dict) -> bytes:
+    """Сериализует словарь без закрывающей скобки, чтобы дописать к нему children"""
+    return orjson.dumps(value)[:-1]
+
+
+def nodeFields(id, url, type, parentId, updateDate, size) -> bytes:
+    """Поля элемента GET /nodes/{id} без children и закрывающей скобки"""
+    return dumpsOpen({
+        'id': id,
+        'url': url,
+        'type': type,
+        'parentId': parentId,
+        'date': formatDate(updateDate),
+        'size': size
+    })
+
+
+def itemFields(item) -> bytes:
+    return nodeFields(item.id, item.url, item.type, item.parentId, item.updateDate, item.size)
+
+
+def encodeArray(rows, encodeRow, limit: int | None = None, cursorOf=None) -> Iterator[bytes]:
+    """
+    Выдаёт JSON-массив из строк запроса. При limit строка сверх limit не выдаётся, а
+    генератор возвращает курсор по последней выданной строке.
+    """
+    yield b'['
+    count, last = 0, None
+    for row in rows:
+        if limit and count == limit:
+            yield b']'
+            return cursorOf(last)
+        yield (b',' if count else b'') + encodeRow(row)
+        count, last = count + 1, row
+    yield b']'
+    return None
+
+
+def encodeSubtree(folderId: str, folderPath: str, database, depth: int | None = None) -> Iterator[bytes]:
+    """
+    Выдаёт содержимое массива children папки. Поддерево читается одним запросом в порядке
+    path (обход в глубину), поэтому каждая строка сразу пишется в ответ: открытые папки лежат
+    в стеке и закрываются, когда выборка выходит из их поддерева. Папки на глубине depth
+    отдаются с children = null, их поддерево не читается.
+    """
+    start, end = subtreeRange(folderPath)
+    params = {'start': start, 'end': end}
+    query = SUBTREE_RANGE_QUERY
+    if depth is not None:
+        query = SUBTREE_DEPTH_QUERY
+        # глубина элемента - число разделителей в его пути
+        params['maxLevel'] = folderPath.count('/') + depth
+    # [id папки, были ли уже дети]
+    stack = [[folderId, False]]
+    for id, url, type, parentId, updateDate, size in database.execute(query, params):
+        while stack[-1][0] != parentId:
+            stack.pop()
+            yield b']}'
+        top = stack[-1]
+        separator = b',' if top[1] else b''
+        top[1] = True
+        fields = nodeFields(id, url, type, parentId, updateDate, size)
+        if type == 'FOLDER' and (depth is None or len(stack) < depth):
+            stack.append([id, False])
+            yield separator + fields + b',"children":['
+        else:
+            yield separator + fields + b',"children":null}'
+    yield b']}' * (len(stack) - 1)
+
+
+def encodeNode(item: Item, database, depth: int | None = None, limit: int | None = None,
+               after: str | None = None) -> Iterator[bytes]:
+    """
+    Выдаёт ответ GET /nodes/{id} кусками. depth ограничивает глубину вложенности, limit
+    включает постраничную выдачу прямых детей (с поддеревьями, начиная после id after) и поле nextCursor.
+    Размеры папок хранятся в строках, поэтому не зависят от того, сколько детей выдано.
+    """
+    head = {
+        'id': item.id,
+        'url': item.url,
+        'type': item.type,
+        'parentId': item.parentId,
+        'date': formatDate(item.updateDate),
+        'size': item.size
+    }
+    if item.type != 'FOLDER':
+        yield orjson.dumps(head)
+        return
+    if depth == 0:
+        yield dumpsOpen(head) + b',"children":null}'
+        return
+    yield dumpsOpen(head) + b',"children":'
+    if limit is None:
+        yield b'['
+        yield from encodeSubtree(item.id, item.path, database, depth)
+        yield b']}'
+        return
+
+    # страница детей ограничена limit и читается целиком до запросов по поддеревьям
+    page = childrenQuery(item.id, database, limit, after).all()
+    yield b'['
+    for number, child in enumerate(page[:limit]):
+        fields = (b',' if number else b'') + itemFields(child)
+        if child.type != 'FOLDER' or depth == 1:
+            yield fields + b',"children":null}'
+        else:
+            yield fields + b',"children":['
+            yield from encodeSubtree(child.id, child.path, database, depth - 1 if depth else None)
+            yield b']}'
+    nextCursor = encodeCursor(page[limit - 1].id) if len(page) > limit else None
+    yield b'],"nextCursor":' + orjson.dumps(nextCursor) + b'}'
+
+
+# столько диапазонов поддеревьев объединяется через OR в одном запросе пакетной выдачи
+BATCH_RANGES = 500
+BATCH_COLUMNS = (Item.id, Item.url, Item.type, Item.parentId, Item.updateDate, Item.size, Item.path)
+
+
+def coveringFolders(folders: list, depth: int | None) -> list[tuple[str, int | None]]:
+    """
+    Поддеревья, которые нужно прочитать для запрошенных папок: папка внутри другой
+    запрошенной папки читается вместе с ней. Возвращает пары (путь, предельный уровень)
+    """
+    roots = []
+    for row in sorted(folders, key=lambda row: row.path):
+        reach = None if depth is None else row.path.count('/') + depth
+        if roots and row.path.startswith(roots[-1][0]):
+            path, maxLevel = roots[-1]
+            roots[-1] = (path, None if maxLevel is None or reach is None else max(maxLevel, reach))
+        else:
+            roots.append((row.path, reach))
+    return roots
+
+
+def loadSubtrees(roots: list[tuple[str, int | None]], database) -> dict[str, list]:
+    """Дети папок всех поддеревьев roots в порядке path; по запросу на BATCH_RANGES поддеревьев"""
+    level = func.length(Item.path) - func.length(func.replace(Item.path, '/', ''))
+    children = defaultdict(list)
+    for chunk in chunks(roots, BATCH_RANGES):
+        ranges = []
+        for path, maxLevel in chunk:
+            start, end = subtreeRange(path)
+            condition = and_(Item.path > start, Item.path < end)
+            ranges.append(condition if maxLevel is None else and_(condition, level <= maxLevel))
+        for row in database.execute(select(*BATCH_COLUMNS).where(or_(*ranges)).order_by(Item.path)):
+            children[row.parentId].append(row)
+    return children
+
+
+def encodeLoadedNode(item, children: dict[str, list], depth: int | None = None) -> bytes:
+    """Ответ GET /nodes/{id} для элемента по заранее загруженным детям (см. encodeSubtree)"""
+    fields = itemFields(item)
+    if item.type != 'FOLDER':
+        return fields + b'}'
+    if depth == 0:
+        return fields + b',"children":null}'
+    parts = [fields, b',"children":[']
+    # [дети папки, уровень детей, выдан ли уже ребёнок]
+    stack = [[iter(children.get(item.id, ())), 1, False]]
+    while stack:
+        top = stack[-1]
+        child = next(top[0], None)
+        if child is None:
+            stack.pop()
+            parts.append(b']}')
+            continue
+        parts.append((b',' if top[2] else b'') + itemFields(child))
+        top[2] = True
+        if child.type == 'FOLDER' and (depth is None or top[1] < depth):
+            parts.append(b',"children":[')
+            stack.append([iter(children.get(child.id, ())), top[1] + 1, False])
+        else:
+            parts.append(b',"children":null}')
+    return b''.join(parts)
+
+
+def encodeNodesBatch(itemIds: list[str], database, depth: int | None = None) -> Iterator[bytes]:
+    """
+    Выдаёт ответ пакетного запроса узлов: {"items": [...]} в порядке itemIds, для
+    отсутствующего id - {"id", "error"}. Запрошенные элементы читаются запросом на
+    CHUNK_SIZE id, поддеревья - запросом на BATCH_RANGES непересекающихся поддеревьев:
+    вложенные запрошенные папки берутся из поддерева предка, а не читаются повторно.
+    """
+    rows = {}
+    for chunk in chunks(list(set(itemIds))):
+        for row in database.execute(select(*BATCH_COLUMNS).where(Item.id.in_(chunk))):
+            rows[row.id] = row
+    children = {}
+    if depth != 0:
+        folders = [row for row in rows.values() if row.type == 'FOLDER']
+        children = loadSubtrees(coveringFolders(folders, depth), database)
+    yield b'{"items":['
+    encoded = {}
+    for number, id in enumerate(itemIds):
+        if id not in encoded:
+            row = rows.get(id)
+            encoded[id] = encodeLoadedNode(row, children, depth) if row else \
+                orjson.dumps({'id': id, 'error': "Item not found"})
+        yield (b',' if number else b'') + encoded[id]
+    yield b']}'
+
+
+def encodeUpdates(rows, limit: int | None = None) -> Iterator[bytes]:
+    """Выдаёт ответ GET /updates кусками из строк запроса lastUpdatesQuery или индекса дерева"""
+
+    def encodeRow(item) -> bytes:
+        return orjson.dumps({
+            'id': item.id,
+            'url': item.url,
+            'date': formatDate(item.updateDate),
+            'parentId': item.parentId,
+            'size': item.size,
+            'type': item.type
+        })
+
+    yield b'{"items":'
+    nextCursor = yield from encodeArray(rows, encodeRow, limit,
+                                        lambda item: encodeCursor(item.updateDate.isoformat(), item.id))
+    if limit is None:
+        yield b'}'
+    else:
+        yield b',"nextCursor":' + orjson.dumps(nextCursor) + b'}'
+
+
+def encodeChildren(url_headers: list[str], rows, limit: int | None = None) -> Iterator[bytes]:
+    """Выдаёт ответ GET /children кусками из строк запроса childrenQuery или индекса дерева"""
+
+    def encodeRow(item) -> bytes:
+        return orjson.dumps({
+            'id': item.id,
+            'url': item.url,
+            'type': item.type,
+            'parentId': item.parentId,
+            'updateDate': formatDate(item.updateDate),
+            'size': item.size
+        })
+
+    yield b'{"url_headings":' + orjson.dumps(url_headers) + b',"items":'
+    nextCursor = yield from encodeArray(rows, encodeRow, limit, lambda item: encodeCursor(item.id))
+    if limit is None:
+        yield b'}'
+    else:
+        yield b',"nextCursor":' + orjson.dumps(nextCursor) + b'}'
@@ -0,0 +1,497 @@
+"""
+Индекс дерева в памяти процесса для чтения без базы: GET /nodes/{id}, /children и
+/updates. Элементы хранятся по номерам (slot) в столбцах array: родитель, признак папки,
+размер, дата в микросекундах; id интернированы, дети папки - array номеров в порядке
+материализованного пути. Индекс загружается при старте и обновляется после каждой
+записи в базу под той же блокировкой, что и commit, поэтому изменения применяются
+в порядке фиксации; в асинхронном режиме commit и применение дополнительно идут под
+asyncio.Lock. Записи других процессов индекс не видит.
+"""
+import asyncio
+import heapq
+import sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from functools import lru_cache
+from threading import RLock
+from typing import Iterable, Iterator, NamedTuple
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.util import await_only
+
+from app.db import models
+from app.db.models import Item
+from app.utils.exceptions import ValidateExeption, NotFoundExeption
+from app.utils.dates import formatDate
+from app.utils.utils import chunks, encodeCursor, pathSegment
+from app.utils.changes import notifyChanges
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+NO_PARENT = -1
+
+
+class IndexRow(NamedTuple):
+    """Элемент в том же виде, что и строка запроса к items"""
+    id: str
+    url: str | None
+    type: str
+    parentId: str | None
+    updateDate: datetime
+    size: int
+
+
+def toMicros(date: datetime) -> int:
+    return (date - EPOCH) // MICROSECOND
+
+
+def fromMicros(value: int) -> datetime:
+    return EPOCH + value * MICROSECOND
+
+
+@lru_cache(maxsize=4096)
+def formatMicros(value: int) -> str:
+    return formatDate(fromMicros(value))
+
+
+def removeSorted(ordered: array, slot: int, key) -> None:
+    """Удаляет номер из списка, упорядоченного по key"""
+    position = bisect_left(ordered, key(slot), key=key)
+    if position < len(ordered) and ordered[position] == slot:
+        del ordered[position]
+    else:
+        ordered.remove(slot)
+
+
+class TreeIndex:
+    """
+    Зеркало таблицы items. Удалённые номера не переиспользуются, а остаются пустыми до
+    уплотнения (compact); выборка /updates - список номеров файлов в порядке (дата, id),
+    устаревшие записи в нём пропускаются по поколению номера.
+    """
+
+    def __init__(self):
+        self.lock = RLock()
+        # блокировка commitChanges для асинхронного режима и цикл событий, к которому она привязана
+        self.asyncLock: asyncio.Lock | None = None
+        self.asyncLoop: asyncio.AbstractEventLoop | None = None
+        self.ids: list[str] = []
+        self.slots: dict[str, int] = {}
+        self.parents = array('i')
+        self.folders = bytearray()
+        self.sizes = array('q')
+        self.dates = array('q')
+        self.urls: list[str | None] = []
+        # дети папок в порядке path, у файлов None
+        self.children: list[array | None] = []
+        # те же дети в порядке id - для страниц /children и /nodes по курсору
+        self.childrenById: list[array | None] = []
+        # элементы без родителя (parentId IS NULL)
+        self.roots = array('i')
+        self.rootsById = array('i')
+        # parentId, которого нет в индексе (например "0"), по номеру элемента
+        self.missingParents: dict[int, str] = {}
+        self.generations = array('I')
+        self.byDate: list[int] = []
+        self.byDateKeys = array('q')
+        self.byDateGenerations = array('I')
+        self.removed = 0
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.slots
+
+    def alive(self, slot: int) -> bool:
+        return self.slots.get(self.ids[slot]) == slot
+
+    def childKey(self, slot: int) -> str:
+        """Порядок детей как в материализованном пути: по сегменту id"""
+        return pathSegment(self.ids[slot])
+
+    def siblings(self, slot: int) -> tuple[array, array] | None:
+        """Списки братьев элемента в порядке path и в порядке id"""
+        parent = self.parents[slot]
+        if parent != NO_PARENT:
+            # у папки, удалённой раньше в той же пачке, списков уже нет
+            return None if self.children[parent] is None else (self.children[parent], self.childrenById[parent])
+        return None if slot in self.missingParents else (self.roots, self.rootsById)
+
+    def allocate(self, id: str) -> int:
+        slot = len(self.ids)
+        id = sys.intern(id)
+        self.ids.append(id)
+        self.slots[id] = slot
+        self.parents.append(NO_PARENT)
+        self.folders.append(0)
+        self.sizes.append(0)
+        self.dates.append(0)
+        self.urls.append(None)
+        self.children.append(None)
+        self.childrenById.append(None)
+        self.generations.append(0)
+        return slot
+
+    def setParent(self, slot: int, parentId: str | None) -> None:
+        parent = self.slots.get(parentId, NO_PARENT) if parentId is not None else NO_PARENT
+        self.parents[slot] = parent
+        if parentId is not None and parent == NO_PARENT:
+            self.missingParents[slot] = parentId
+        else:
+            self.missingParents.pop(slot, None)
+
+    def parentId(self, slot: int) -> str | None:
+        parent = self.parents[slot]
+        return self.ids[parent] if parent != NO_PARENT else self.missingParents.get(slot)
+
+    def addUpdate(self, slot: int) -> None:
+        """Ставит файл в выборку /updates с новой датой; прежняя запись устаревает"""
+        self.generations[slot] += 1
+        date = self.dates[slot]
+        low = bisect_left(self.byDateKeys, date)
+        high = bisect_right(self.byDateKeys, date, low)
+        position = bisect_left(self.byDate, self.ids[slot], low, high, key=self.ids.__getitem__)
+        self.byDate.insert(position, slot)
+        self.byDateKeys.insert(position, date)
+        self.byDateGenerations.insert(position, self.generations[slot])
+
+    def setRow(self, slot: int, url, type, size, updateDate) -> bool:
+        """Записывает поля элемента; возвращает, изменилась ли дата"""
+        date = toMicros(updateDate)
+        changed = self.dates[slot] != date
+        self.urls[slot] = url
+        self.sizes[slot] = size or 0
+        self.dates[slot] = date
+        if type == 'FOLDER':
+            self.folders[slot] = 1
+            if self.children[slot] is None:
+                self.children[slot] = array('i')
+                self.childrenById[slot] = array('i')
+        else:
+            self.folders[slot] = 0
+        return changed
+
+    def load(self, rows: Iterable[tuple]) -> None:
+        """
+        Заполняет пустой индекс строками (id, parentId, url, type, size, updateDate) в порядке
+        path: родители идут раньше детей, а дети - в нужном порядке, поэтому просто дописываются.
+        """
+        for id, parentId, url, type, size, updateDate in rows:
+            slot = self.allocate(id)
+            self.setRow(slot, url, type, size, updateDate)
+            self.setParent(slot, parentId)
+            siblings = self.siblings(slot)
+            if siblings is not None:
+                for ordered in siblings:
+                    ordered.append(slot)
+        # дети пришли в порядке path, списки в порядке id сортируются один раз
+        key = self.ids.__getitem__
+        self.rootsById = array('i', sorted(self.rootsById, key=key))
+        for slot, byId in enumerate(self.childrenById):
+            if byId is not None and len(byId) > 1:
+                self.childrenById[slot] = array('i', sorted(byId, key=key))
+        files = [slot for slot in self.slots.values() if not self.folders[slot]]
+        files.sort(key=lambda slot: (self.dates[slot], self.ids[slot]))
+        self.byDate = files
+        self.byDateKeys = array('q', (self.dates[slot] for slot in files))
+        self.byDateGenerations = array('I', bytes(4 * len(files)))
+
+    def apply(self, rows: list[tuple], removedIds: Iterable[str]) -> None:
+        """Переносит изменения зафиксированной транзакции: новые строки элементов и удалённые id"""
+        for id in removedIds:
+            slot = self.slots.get(id)
+            if slot is None:
+                continue
+            self.unlink(slot)
+            del self.slots[id]
+            self.missingParents.pop(slot, None)
+            self.children[slot] = None
+            self.childrenById[slot] = None
+            self.urls[slot] = None
+            self.removed += 1
+        # сначала номера для всех новых элементов: родитель может прийти в той же пачке
+        created = {id for id, *_ in rows if id not in self.slots}
+        for id in created:
+            self.allocate(id)
+        # поля пишутся раньше связей: у новой папки к этому моменту уже есть массив детей
+        for id, parentId, url, type, size, updateDate in rows:
+            slot = self.slots[id]
+            dateChanged = self.setRow(slot, url, type, size, updateDate)
+            if type == 'FILE' and (dateChanged or id in created):
+                self.addUpdate(slot)
+        for id, parentId, *_ in rows:
+            slot = self.slots[id]
+            if id in created or self.parentId(slot) != parentId:
+                if id not in created:
+                    self.unlink(slot)
+                self.setParent(slot, parentId)
+                self.link(slot)
+        if self.removed > len(self.slots) or len(self.byDate) > 2 * len(self.slots) + 1000:
+            self.compact()
+
+    def link(self, slot: int) -> None:
+        """Вставляет элемент в списки детей родителя, сохраняя оба порядка"""
+        siblings = self.siblings(slot)
+        if siblings is not None:
+            insort(siblings[0], slot, key=self.childKey)
+            insort(siblings[1], slot, key=self.ids.__getitem__)
+
+    def unlink(self, slot: int) -> None:
+        siblings = self.siblings(slot)
+        if siblings is not None:
+            removeSorted(siblings[0], slot, self.childKey)
+            removeSorted(siblings[1], slot, self.ids.__getitem__)
+
+    def walk(self) -> Iterator[int]:
+        """Живые номера в порядке path: обход в глубину от элементов без родителя в индексе"""
+        # элементы с отсутствующим родителем в path стоят на верхнем уровне вместе с корнями
+        tops = heapq.merge(self.roots, sorted(self.missingParents, key=self.childKey), key=self.childKey)
+        stack = [iter(tops)]
+        while stack:
+            slot = next(stack[-1], None)
+            if slot is None:
+                stack.pop()
+                continue
+            yield slot
+            if self.folders[slot]:
+                stack.append(iter(self.children[slot]))
+
+    def liveRows(self) -> Iterator[tuple]:
+        """Строки для load в порядке path"""
+        for slot in self.walk():
+            yield (self.ids[slot], self.parentId(slot), self.urls[slot],
+                   'FOLDER' if self.folders[slot] else 'FILE', self.sizes[slot], fromMicros(self.dates[slot]))
+
+    def compact(self) -> None:
+        """Пересобирает индекс без удалённых номеров и устаревших записей /updates"""
+        fresh = TreeIndex()
+        fresh.load(self.liveRows())
+        locks = self.lock, self.asyncLock, self.asyncLoop
+        self.__dict__.update(fresh.__dict__)
+        self.lock, self.asyncLock, self.asyncLoop = locks
+
+    def commitLock(self) -> asyncio.Lock:
+        """asyncio.Lock текущего цикла событий; новый цикл (другой запуск приложения) получает новую"""
+        loop = asyncio.get_running_loop()
+        if self.asyncLoop is not loop:
+            self.asyncLock, self.asyncLoop = asyncio.Lock(), loop
+        return self.asyncLock
+
+    def row(self, slot: int) -> IndexRow:
+        return IndexRow(self.ids[slot], self.urls[slot], 'FOLDER' if self.folders[slot] else 'FILE',
+                        self.parentId(slot), fromMicros(self.dates[slot]), self.sizes[slot])
+
+    def fields(self, slot: int) -> bytes:
+        """Поля элемента GET /nodes/{id} без children и закрывающей скобки"""
+        return orjson.dumps({
+            'id': self.ids[slot],
+            'url': self.urls[slot],
+            'type': 'FOLDER' if self.folders[slot] else 'FILE',
+            'parentId': self.parentId(slot),
+            'date': formatMicros(self.dates[slot]),
+            'size': self.sizes[slot]
+        })[:-1]
+
+    def encodeSubtree(self, slot: int, depth: int | None = None) -> Iterator[bytes]:
+        """Содержимое массива children папки, как app.utils.streaming.encodeSubtree"""
+        # [дети, были ли уже выданы]
+        frames = [[iter(self.children[slot]), False]]
+        while frames:
+            frame = frames[-1]
+            child = next(frame[0], None)
+            if child is None:
+                frames.pop()
+                if frames:
+                    yield b']}'
+                continue
+            separator = b',' if frame[1] else b''
+            frame[1] = True
+            if self.folders[child] and (depth is None or len(frames) < depth):
+                frames.append([iter(self.children[child]), False])
+                yield separator + self.fields(child) + b',"children":['
+            else:
+                yield separator + self.fields(child) + b',"children":null}'
+
+    def childrenPage(self, slot: int | None, limit: int | None = None, after: str | None = None) -> list[int]:
+        """Дети папки (или элементы без родителя) в порядке id, после id after, не больше limit + 1"""
+        siblings = self.rootsById if slot is None else self.childrenById[slot]
+        start = bisect_right(siblings, after, key=self.ids.__getitem__) if after is not None else 0
+        return list(siblings[start:start + limit + 1] if limit else siblings[start:])
+
+    def childrenRows(self, parentId: str | None, limit: int | None = None,
+                     after: str | None = None) -> list[IndexRow]:
+        """Строки для /children; папки, удалённой после проверки пути, нет - детей тоже нет"""
+        slot = None
+        if parentId is not None:
+            slot = self.slots.get(parentId)
+            if slot is None or not self.folders[slot]:
+                return []
+        return [self.row(child) for child in self.childrenPage(slot, limit, after)]
+
+    def encodeNode(self, id: str, depth: int | None = None, limit: int | None = None,
+                   after: str | None = None) -> Iterator[bytes]:
+        """Ответ GET /nodes/{id} кусками, как app.utils.streaming.encodeNode"""
+        slot = self.slots[id]
+        head = self.fields(slot)
+        if not self.folders[slot]:
+            yield head + b'}'
+            return
+        if depth == 0:
+            yield head + b',"children":null}'
+            return
+        yield head + b',"children":['
+        if limit is None:
+            yield from self.encodeSubtree(slot, depth)
+            yield b']}'
+            return
+        page = self.childrenPage(slot, limit, after)
+        for number, child in enumerate(page[:limit]):
+            fields = (b',' if number else b'') + self.fields(child)
+            if not self.folders[child] or depth == 1:
+                yield fields + b',"children":null}'
+            else:
+                yield fields + b',"children":['
+                yield from self.encodeSubtree(child, depth - 1 if depth else None)
+                yield b']}'
+        nextCursor = encodeCursor(self.ids[page[limit - 1]]) if len(page) > limit else None
+        yield b'],"nextCursor":' + orjson.dumps(nextCursor) + b'}'
+
+    def validateUrl(self, segments: list[str]) -> None:
+        """Проверка цепочки папок пути /children, как app.validations.validateUrl"""
+        for i, id in enumerate(segments):
+            slot = self.slots.get(id)
+            if slot is None:
+                raise NotFoundExeption("Item not found")
+            if not self.folders[slot]:
+                raise ValidateExeption("Invalid item")
+            if i + 1 < len(segments):
+                next = self.slots.get(segments[i + 1])
+                if next is None:
+                    raise NotFoundExeption("Item not found")
+                if self.parents[next] != slot:
+                    raise ValidateExeption("Invalid item")
+
+    def updates(self, start: datetime, end: datetime, after: tuple[datetime, str] | None = None,
+                limit: int | None = None) -> list[IndexRow]:
+        """Файлы с датой в [start, end] в порядке (дата, id), после ключа after, не больше limit + 1"""
+        low = bisect_left(self.byDateKeys, toMicros(start))
+        high = bisect_right(self.byDateKeys, toMicros(end), low)
+        if after is not None:
+            # первая запись с ключом больше (дата, id) курсора
+            lastDate = toMicros(after[0])
+            sameLow = bisect_left(self.byDateKeys, lastDate)
+            sameHigh = bisect_right(self.byDateKeys, lastDate, sameLow)
+            low = max(low, bisect_right(self.byDate, after[1], sameLow, sameHigh, key=self.ids.__getitem__))
+        rows = []
+        for position in range(low, high):
+            slot = self.byDate[position]
+            if self.byDateGenerations[position] != self.generations[slot] or not self.alive(slot) \
+                    or self.folders[slot]:
+                continue
+            rows.append(self.row(slot))
+            if limit and len(rows) > limit:
+                break
+        return rows
+
+
+ROW_COLUMNS = (Item.id, Item.parentId, Item.url, Item.type, Item.size, Item.updateDate)
+
+treeIndex: TreeIndex | None = None
+
+
+def loadRows(ids: Iterable[str], database) -> list[tuple]:
+    """Строки элементов для TreeIndex.apply, читаются в той же транзакции, что и запись"""
+    return [tuple(row) for chunk in chunks(list(ids))
+            for row in database.execute(select(*ROW_COLUMNS).where(Item.id.in_(chunk)))]
+
+
+def loadAllRows(database) -> list[tuple]:
+    return [tuple(row) for row in database.execute(select(*ROW_COLUMNS))]
+
+
+def buildTreeIndex(database) -> TreeIndex:
+    """Загружает индекс из базы одним запросом в порядке path"""
+    index = TreeIndex()
+    index.load(database.execute(select(*ROW_COLUMNS).order_by(Item.path).execution_options(stream_results=True)))
+    return index
+
+
+def startTreeIndex(database) -> TreeIndex:
+    global treeIndex
+    treeIndex = buildTreeIndex(database)
+    return treeIndex
+
+
+def stopTreeIndex() -> None:
+    global treeIndex
+    treeIndex = None
+
+
+def commitChanges(database, changed: Iterable[str]) -> None:
+    """
+    Фиксирует транзакцию и переносит изменённые элементы в индекс. Строки читаются до
+    commit, а commit и применение идут под блокировкой индекса: следующая запись не
+    применится раньше этой. Изменённые id без строки в базе удалены. После commit
+    будятся ждущие GET /changes.
+
+    В асинхронном режиме все обработчики выполняются в потоке цикла событий, и RLock их
+    не разделяет, а commit отдаёт цикл событий: следующая запись успела бы зафиксироваться
+    и примениться раньше этой. Поэтому там commit и применение идут ещё и под
+    asyncio.Lock индекса, которую запись ждёт через await_only.
+    """
+    index = treeIndex
+    if index is None:
+        database.commit()
+        notifyChanges()
+        return
+    changed = set(changed)
+    rows = loadRows(changed, database)
+    removed = changed - {row[0] for row in rows}
+    if models.async_engine is not None and database.bind is models.async_engine.sync_engine:
+        commitLock = index.commitLock()
+        await_only(commitLock.acquire())
+        try:
+            with index.lock:
+                database.commit()
+                index.apply(rows, removed)
+        finally:
+            commitLock.release()
+    else:
+        with index.lock:
+            database.commit()
+            index.apply(rows, removed)
+    notifyChanges()
+
+
+def findIndexDrift(index: TreeIndex, database) -> list[dict]:
+    """
+    Элементы, которые в индексе и в базе различаются или есть только с одной стороны, и
+    первое расхождение порядка обхода индекса с порядком path в базе (связи и порядок детей)
+    """
+    stored = {row[0]: row for row in loadAllRows(database)}
+    order = [id for id, in database.execute(select(Item.id).order_by(Item.path))]
+    with index.lock:
+        rows = [index.row(slot) for slot in index.slots.values()]
+        walked = [index.ids[slot] for slot in index.walk()]
+        key = index.ids.__getitem__
+        # списки детей в порядке id должны совпадать со списками в порядке path
+        unordered = [None if slot is None else index.ids[slot] for slot, children, byId in
+                     [(None, index.roots, index.rootsById)] +
+                     [(slot, index.children[slot], index.childrenById[slot]) for slot in index.slots.values()
+                      if index.folders[slot]]
+                     if list(byId) != sorted(children, key=key)]
+    drift = []
+    for row in rows:
+        actual = stored.pop(row.id, None)
+        if actual is None or (actual[0], actual[2], actual[3], actual[1], actual[5], actual[4] or 0) != row:
+            drift.append({'id': row.id, 'index': tuple(row), 'database': actual})
+    drift.extend({'id': id, 'index': None, 'database': actual} for id, actual in stored.items())
+    drift.extend({'id': id, 'index': 'children order', 'database': None} for id in unordered)
+    if walked != order:
+        position = next((i for i, (a, b) in enumerate(zip(walked, order)) if a != b), min(len(walked), len(order)))
+        drift.append({'id': None, 'index': walked[position:position + 1], 'database': order[position:position + 1],
+                      'order': position})
+    return drift
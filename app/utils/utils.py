@@ -1,132 +1,474 @@
-from datetime import datetime, timedelta
+import base64
+import json
+from urllib.parse import unquote
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import text, tuple_, func, insert, select, update, bindparam, case, or_, DateTime
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.config import HISTORY_MAX_VERSIONS
 from app.forms import ItemForm
-from app.db.models import Item
-
-
-def addItem(item: ItemForm, updateDate, database) -> None:
-    """Добавляет item в базу"""
-    database.add(Item(
-        id=item.id,
-        parentId=item.parentId,
-        url=item.url,
-        size=item.size,
-        type=item.type,
-        updateDate=updateDate
-    ))
-    updateParentsDate(item.parentId, updateDate, database)
-
-
-def updateParentsDate(parentId: str | None, updateDate: str, database) -> None:
-    """Обновляет updateDate у parent в базе"""
-    parent = database.query(Item).filter(Item.id == parentId).one_or_none()
-    if parent:
-        database.query(Item).filter(Item.id == parentId).update({
-            'id': parent.id,
-            'updateDate': updateDate
-        }, synchronize_session="fetch")
-        if parent.parentId:
-            updateParentsDate(parent.parentId, updateDate, database)
-
-
-def findFoldersInImports(items: list):
-    """Ищет папки в списке items"""
-    folders = []
+from app.db.models import Item, ItemHistory
+from app.utils.exceptions import ValidateExeption
+from app.utils.dates import dayWindow, formatDate
+
+
+# столько id передаётся в одном IN, чтобы не упереться в лимит параметров SQLite
+CHUNK_SIZE = 10000
+# parentId элементов верхнего уровня помимо null: "0" и пустая строка означают отсутствие родителя
+TOP_LEVEL_PARENTS = ('', '0')
+
+
+def chunks(values: list, size: int = CHUNK_SIZE):
+    """Делит список на части не длиннее size"""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def isTopLevel(parentId: str | None) -> bool:
+    """Элемент без родителя: parentId null, "0" или пустой"""
+    return parentId is None or parentId in TOP_LEVEL_PARENTS
+
+
+def topLevelFilter():
+    """Условие isTopLevel для запроса к items"""
+    return or_(Item.parentId == None, Item.parentId.in_(TOP_LEVEL_PARENTS))
+
+
+def pathSegment(item_id: str) -> str:
+    """
+    Часть материализованного пути для элемента. Путь - это сегменты всех предков
+    и самого элемента от корня: /root/folder/item/. '%' и '/' в id экранируются,
+    поэтому путь папки является префиксом путей ровно её потомков.
+    """
+    return item_id.replace('%', '%25').replace('/', '%2F') + '/'
+
+
+def pathIds(path: str) -> list[str]:
+    """Возвращает id элементов пути от корня до самого элемента"""
+    return [unquote(segment) for segment in path[1:-1].split('/')]
+
+
+def subtreeRange(path: str) -> tuple[str, str]:
+    """Границы [path, end) путей поддерева: все строки с префиксом path и только они"""
+    return path, path[:-1] + chr(ord('/') + 1)
+
+
+def loadItemsWithAncestors(itemIds: list[str], database) -> dict[str, dict]:
+    """
+    Загружает существующие элементы и всех их предков: первый запрос читает сами
+    элементы, второй - предков, id которых известны из их путей
+    """
+    existing = {}
+
+    def load(ids):
+        for chunk in chunks(ids):
+            rows = database.query(Item.id, Item.parentId, Item.type, Item.size, Item.path, Item.updateDate,
+                                  Item.fileCount, Item.folderCount, Item.maxDepth, Item.newestUpdate) \
+                .filter(Item.id.in_(chunk))
+            for id, parentId, type, size, path, updateDate, fileCount, folderCount, maxDepth, newest in rows:
+                existing[id] = {'parentId': parentId, 'type': type, 'size': size or 0, 'path': path,
+                                'updateDate': updateDate, 'fileCount': fileCount or 0,
+                                'folderCount': folderCount or 0, 'maxDepth': maxDepth or 0,
+                                'newestUpdate': newest}
+
+    load(itemIds)
+    ancestors = {id for node in list(existing.values()) for id in pathIds(node['path'])}
+    load(list(ancestors - existing.keys()))
+    return existing
+
+
+def upsertStatement(database):
+    """INSERT ... ON CONFLICT DO UPDATE для items на диалекте текущей базы"""
+    dialectInsert = postgresql.insert if database.bind.dialect.name == 'postgresql' else sqlite.insert
+    statement = dialectInsert(Item)
+    return statement.on_conflict_do_update(index_elements=['id'], set_={
+        column: statement.excluded[column] for column in ('parentId', 'url', 'size', 'type', 'updateDate', 'path',
+                                                          'fileCount', 'folderCount', 'maxDepth', 'newestUpdate')
+    })
+
+
+STATS_FIELDS = ('fileCount', 'folderCount', 'maxDepth', 'newestUpdate')
+
+
+def itemStats(node: dict, updateDate: datetime | None = None) -> tuple:
+    """
+    Вклад элемента в агрегаты родителя: файлов, папок, глубина самого элемента (у файла 0)
+    и последняя дата файла. updateDate - дата файла, если она меняется
+    """
+    if node['type'] == 'FILE':
+        return 1, 0, 0, updateDate or node['updateDate']
+    return node['fileCount'], node['folderCount'] + 1, node['maxDepth'], node['newestUpdate']
+
+
+def markStale(parentId: str | None, depth: int | None, newest: datetime | None,
+              nodes: dict[str, dict], stale: set) -> None:
+    """
+    Отмечает предков, у которых maxDepth или newestUpdate могли уменьшиться, когда из-под
+    parentId уходит элемент глубины depth с последней датой newest. Подъём по каждому
+    агрегату прекращается на первом предке, чей максимум набран другой веткой.
+    """
+    visited = set()
+    while parentId in nodes and parentId not in visited and (depth is not None or newest is not None):
+        visited.add(parentId)
+        node = nodes[parentId]
+        if depth is not None:
+            depth = depth + 1 if node['maxDepth'] <= depth + 1 else None
+        if newest is not None:
+            newest = newest if node['newestUpdate'] is not None and node['newestUpdate'] <= newest else None
+        if depth is None and newest is None:
+            break
+        stale.add(parentId)
+        parentId = node['parentId']
+
+
+def refreshFolderStats(paths: dict[str, str], database) -> None:
+    """
+    Пересчитывает maxDepth и newestUpdate папок (id -> путь) по их детям, от глубоких
+    уровней к верхним, по запросу на уровень: у детей значения к этому моменту верные
+    """
+    table = Item.__table__
+    levels = defaultdict(list)
+    for id, path in paths.items():
+        levels[path.count('/')].append(id)
+    for level in sorted(levels, reverse=True):
+        for chunk in chunks(levels[level]):
+            stats = {id: (0, None) for id in chunk}
+            rows = database.query(
+                Item.parentId,
+                func.max(case((Item.type == 'FILE', 1), else_=Item.maxDepth + 1)),
+                func.max(case((Item.type == 'FILE', Item.updateDate), else_=Item.newestUpdate), type_=DateTime)
+            ).filter(Item.parentId.in_(chunk)).group_by(Item.parentId)
+            for parentId, maxDepth, newest in rows:
+                stats[parentId] = (maxDepth, newest)
+            database.execute(update(table).where(table.c.id == bindparam('_id'))
+                             .values(maxDepth=bindparam('maxDepth'), newestUpdate=bindparam('newestUpdate')),
+                             [{'_id': id, 'maxDepth': maxDepth, 'newestUpdate': newest}
+                              for id, (maxDepth, newest) in stats.items()])
+
+
+def importItems(items: list[ItemForm], existing: dict[str, dict], updateDate: datetime, database) -> set[str]:
+    """
+    Импортирует пачку элементов набором множественных операций и возвращает id всех
+    изменённых элементов. Размеры, даты и пути считаются в памяти по existing из
+    loadItemsWithAncestors, затем пишутся одним upsert, одним обновлением предков и
+    одним обновлением путей на каждую перенесённую папку. Так же считаются агрегаты
+    папок; максимумы, которые могли уменьшиться, пересчитываются по детям в конце.
+    """
+    nodes = existing
+    changed = set()
+    movedFolders = {}
+    stale = set()
+
+    def updateParents(parentId, sizeDelta, fileDelta=0, folderDelta=0, depth=None, newest=None):
+        visited = set()
+        while parentId in nodes and parentId not in visited:
+            visited.add(parentId)
+            node = nodes[parentId]
+            node['size'] += sizeDelta
+            node['fileCount'] += fileDelta
+            node['folderCount'] += folderDelta
+            if depth is not None:
+                depth += 1
+                node['maxDepth'] = max(node['maxDepth'], depth)
+            if newest is not None and (node['newestUpdate'] is None or node['newestUpdate'] < newest):
+                node['newestUpdate'] = newest
+            changed.add(parentId)
+            parentId = node['parentId']
+
+    # 1. вклады перенесённых элементов и файлов вычитаются из сохранённых цепочек предков,
+    # от глубоких элементов к верхним: вклад перенесённой папки к этому моменту уже без
+    # вложенных в неё перенесённых элементов, и ни один вклад не вычитается дважды
+    existingItems = sorted((item for item in items if item.id in nodes),
+                           key=lambda item: -nodes[item.id]['path'].count('/'))
+    detached = set()
+    for item in existingItems:
+        existsItem = nodes[item.id]
+        moved = existsItem['parentId'] != item.parentId
+        if not moved and existsItem['type'] != 'FILE':
+            continue
+        oldFiles, oldFolders, oldDepth, oldNewest = itemStats(existsItem)
+        if moved:
+            markStale(existsItem['parentId'], oldDepth, oldNewest, nodes, stale)
+            if existsItem['type'] == 'FOLDER':
+                movedFolders[item.id] = existsItem['path']
+        elif existsItem['updateDate'] > updateDate:
+            # файл перезаписан более старой датой
+            markStale(existsItem['parentId'], None, existsItem['updateDate'], nodes, stale)
+        updateParents(existsItem['parentId'], -existsItem['size'], -oldFiles, -oldFolders)
+        detached.add(item.id)
+
+    # 2. все новые parentId применяются сразу; вклады фиксируются до добавления в предков
+    attached = []
     for item in items:
-        if item.type == 'FOLDER':
-            folders.append(item.id)
-    return folders
+        existsItem = nodes.get(item.id)
+        if existsItem and existsItem['type'] == 'FOLDER':
+            # размер папки - это сумма вложенных элементов, он не импортируется
+            node = dict(existsItem, parentId=item.parentId)
+        else:
+            node = {'parentId': item.parentId, 'type': item.type, 'size': item.size if item.type == 'FILE' else 0,
+                    'updateDate': updateDate, 'fileCount': 0, 'folderCount': 0, 'maxDepth': 0,
+                    'newestUpdate': None}
+        if not existsItem or item.id in detached:
+            attached.append((item.parentId, node['size'], *itemStats(node), item.id))
+        nodes[item.id] = node
+        changed.add(item.id)
+
+    # 3. вклады добавляются в итоговые цепочки предков
+    for parentId, size, files, folders, depth, newest, id in attached:
+        updateParents(parentId, size, files, folders, depth, newest)
+        if id in stale:
+            # максимумы папки ещё будут пересчитаны, они могли уже уменьшиться
+            markStale(parentId, depth, newest, nodes, stale)
 
+    paths = {}
 
-def updateItem(item: ItemForm, updateDate, database) -> None:
-    """Обновляет item в базе"""
-    database.query(Item).filter(Item.id == item.id).update({
+    def countPath(id):
+        chain = []
+        while id in nodes and id not in paths:
+            chain.append(id)
+            id = nodes[id]['parentId']
+        path = paths.get(id, '/')
+        for chainId in reversed(chain):
+            path = paths[chainId] = path + pathSegment(chainId)
+        return path
+
+    # поддеревья перенесённых папок переписываются от глубоких к верхним, чтобы
+    # вложенный перенос не был перезаписан переносом предка
+    for id, oldPath in sorted(movedFolders.items(), key=lambda moved: -len(moved[1])):
+        start, end = subtreeRange(oldPath)
+        database.execute(text("""UPDATE items SET path = :new || substr(path, :cut)
+            WHERE path > :start AND path < :end"""),
+            {'new': countPath(id), 'cut': len(oldPath) + 1, 'start': start, 'end': end})
+
+    importIds = {item.id for item in items}
+    database.execute(upsertStatement(database), [{
         'id': item.id,
         'parentId': item.parentId,
         'url': item.url,
-        'size': item.size,
+        'size': nodes[item.id]['size'],
         'type': item.type,
-        'updateDate': updateDate},
-        synchronize_session="fetch")
+        'updateDate': updateDate,
+        'path': countPath(item.id),
+        **folderStats(nodes[item.id])
+    } for item in items])
+    parents = [{'_id': id, 'size': nodes[id]['size'], 'updateDate': updateDate, **folderStats(nodes[id])}
+               for id in changed - importIds]
+    if parents:
+        database.execute(update(Item.__table__).where(Item.__table__.c.id == bindparam('_id'))
+                         .values(size=bindparam('size'), updateDate=bindparam('updateDate'),
+                                 **{field: bindparam(field) for field in STATS_FIELDS}), parents)
+    if stale:
+        refreshFolderStats({id: countPath(id) for id in stale}, database)
+    return changed
+
+
+def folderStats(node: dict) -> dict:
+    """Значения столбцов агрегатов для строки items; у файлов они пустые"""
+    if node['type'] == 'FILE':
+        return dict.fromkeys(STATS_FIELDS)
+    return {field: node[field] for field in STATS_FIELDS}
+
+
+def getFolderStats(itemIds: list[str], database) -> list[dict]:
+    """
+    Агрегаты папок в порядке itemIds по сохранённым значениям, без обхода поддеревьев.
+    Для отсутствующего элемента и файла вместо агрегатов - поле error
+    """
+    rows = {}
+    for chunk in chunks(list(set(itemIds))):
+        for row in database.query(Item.id, Item.type, Item.size, Item.fileCount, Item.folderCount,
+                                  Item.maxDepth, Item.newestUpdate).filter(Item.id.in_(chunk)):
+            rows[row.id] = row
+    ans = []
+    for id in itemIds:
+        row = rows.get(id)
+        if row is None:
+            ans.append({'id': id, 'error': "Item not found"})
+        elif row.type != 'FOLDER':
+            ans.append({'id': id, 'error': "Item is not a folder"})
+        else:
+            ans.append({
+                'id': id,
+                'size': row.size,
+                'fileCount': row.fileCount,
+                'folderCount': row.folderCount,
+                'maxDepth': row.maxDepth,
+                'newestUpdate': formatDate(row.newestUpdate) if row.newestUpdate else None
+            })
+    return ans
+
+
+def encodeCursor(*values) -> str:
+    """Упаковывает ключ сортировки последнего элемента страницы в непрозрачный курсор"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
 
 
-def getDateAndYesterday(date: str) -> tuple[datetime, datetime]:
-    """Возвращает дату и дату-24ч в datetime"""
-    if date[-1] == 'Z':
-        date = date[:-1]
-    dateStr = date.split('T')[0] + ' ' + date.split('T')[1]
+def decodeCursor(cursor: str) -> list:
+    """Распаковывает курсор, полученный из encodeCursor"""
     try:
-        date_datetime = datetime.strptime(dateStr, "%Y-%m-%d %H:%M:%S.%f")
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
     except ValueError:
-        date_datetime = datetime.strptime(dateStr, "%Y-%m-%d %H:%M:%S")
-    yesterday = date_datetime - timedelta(days=1)
-    return date_datetime, yesterday
+        raise ValidateExeption("Invalid cursor")
+
+
+def decodeIdCursor(cursor: str) -> str:
+    """Распаковывает курсор страницы детей: id последнего выданного элемента"""
+    values = decodeCursor(cursor)
+    if not isinstance(values, list) or len(values) != 1 or not isinstance(values[0], str):
+        raise ValidateExeption("Invalid cursor")
+    return values[0]
 
 
-def checkForDay(date: datetime, yesterday: datetime, item_date: str) -> bool:
-    """Проверят, лежит ли дата в диапазоне 24ч"""
-    if item_date[-1] == 'Z':
-        item_date = item_date[:-1]
-    item_date_str = item_date.split('T')[0] + ' ' + item_date.split('T')[1]
+def childrenQuery(parentId: str | None, database, limit: int | None = None, after: str | None = None):
+    """
+    Запрос детей папки (при parentId=None - элементов без родителя) в порядке id по индексу
+    (parentId, id). Страница начинается после id after; при limit выбирается одна лишняя строка.
+    """
+    query = database.query(Item).filter(Item.parentId == parentId).order_by(Item.id)
+    if after is not None:
+        query = query.filter(Item.id > after)
+    if limit:
+        query = query.limit(limit + 1)
+    return query
+
+
+def decodeUpdatesCursor(cursor: str) -> tuple[datetime, str]:
+    """Распаковывает курсор /updates: дата и id последнего выданного файла"""
     try:
-        item_date_datetime = datetime.strptime(item_date_str, "%Y-%m-%d %H:%M:%S.%f")
-    except ValueError:
-        item_date_datetime = datetime.strptime(item_date_str, "%Y-%m-%d %H:%M:%S")
-    return yesterday <= item_date_datetime <= date
+        lastDate, lastId = decodeCursor(cursor)
+        if not isinstance(lastId, str):
+            raise TypeError(lastId)
+        return datetime.fromisoformat(lastDate), lastId
+    except (TypeError, ValueError):
+        raise ValidateExeption("Invalid cursor")
 
 
-def getLastUpdates(date: str, database) -> list[dict]:
-    """Возвращает список элементов, которые были обновлены за последние 24ч"""
-    ans = []
-    date_d, yesterday = getDateAndYesterday(date)
-    items = database.query(Item).all()
-    for item in items:
-        if checkForDay(date_d, yesterday, item.updateDate):
-            ans.append({
-                'id': item.id,
-                'url': item.url,
-                'date': item.updateDate,
-                'parentId': item.parentId,
-                'size': item.size,
-                'type': item.type
-            })
-    return ans
+def lastUpdatesQuery(date: datetime, database, limit: int | None = None, cursor: str | None = None):
+    """
+    Запрос файлов, обновлённых за последние 24ч, в порядке (updateDate, id).
+    Окно отбирается в базе по индексу (type, updateDate); при limit выбирается одна лишняя строка.
+    """
+    yesterday, date_d = dayWindow(date)
+    query = database.query(Item.id, Item.url, Item.updateDate, Item.parentId, Item.size, Item.type) \
+        .filter(Item.type == 'FILE', Item.updateDate >= yesterday, Item.updateDate <= date_d) \
+        .order_by(Item.updateDate, Item.id)
+    if cursor:
+        lastDate, lastId = decodeUpdatesCursor(cursor)
+        query = query.filter(tuple_(Item.updateDate, Item.id) > tuple_(lastDate, lastId))
+    if limit:
+        # лишняя строка показывает, что есть следующая страница
+        query = query.limit(limit + 1)
+    return query
 
 
-def deletingChildrenOfFolder(item_id: str, database) -> None:
-    """Удаляет элементы, вложенные в папку"""
-    children = database.query(Item).filter(Item.parentId == item_id).all()
-    for i in range(len(children)):
-        if children[i].type == 'FOLDER':
-            deletingChildrenOfFolder(children[i].id, database)
-        database.query(Item).filter(Item.id == children[i].id).delete()
-
-
-def countSize(response: dict) -> dict:
-    size = 0
-    for i in response['children']:
-        if i.get('type') == 'FOLDER':
-            countSize(i)
-        if i.get('size'):
-            size += i.get('size')
-        response['size'] = size
-    return response
-
-
-
-def checkFolderForChildren(ans: list, item_id: str, database) -> list:
-    """Возвращает элементы, вложенные в папку"""
-    children = database.query(Item).filter(Item.parentId == item_id).all()
-    for i in range(len(children)):
-        ans.append({
-            'id': children[i].id,
-            'url': children[i].url,
-            'type': children[i].type,
-            'parentId': children[i].parentId,
-            'date': children[i].updateDate,
-            'size': children[i].size,
-            'children': None
-        })
-        if children[i].type == 'FOLDER':
-            ans[i]['children'] = []
-            checkFolderForChildren(ans[i]['children'], children[i].id, database)
-    return ans
+def countTree(database) -> tuple[dict[str, int], int]:
+    """
+    Число элементов по типам и суммарный размер файлов. Считается по строкам верхнего уровня
+    (индекс по parentId) из сохранённых агрегатов папок, без прохода по всей таблице
+    """
+    counts, totalSize = {'FILE': 0, 'FOLDER': 0}, 0
+    rows = database.query(Item.type, func.count(), func.sum(Item.size), func.sum(Item.fileCount),
+                          func.sum(Item.folderCount)).filter(topLevelFilter()).group_by(Item.type)
+    for type, count, size, files, folders in rows:
+        counts[type] += count
+        counts['FILE'] += files or 0
+        counts['FOLDER'] += folders or 0
+        totalSize += size or 0
+    return counts, totalSize
+
+
+def updateParents(parents: list[str], updateDate: datetime, sizeDelta: int, database,
+                  fileDelta: int = 0, folderDelta: int = 0) -> None:
+    """Обновляет updateDate, суммарный размер и число файлов и папок у предков одним UPDATE"""
+    table = Item.__table__
+    for chunk in chunks(parents):
+        database.execute(update(table).where(table.c.id.in_(chunk))
+                         .values(size=table.c.size + sizeDelta, updateDate=updateDate,
+                                 fileCount=table.c.fileCount + fileDelta,
+                                 folderCount=table.c.folderCount + folderDelta))
+
+
+def deleteSubtree(path: str, database) -> None:
+    """Удаляет поддерево по диапазону путей вместе с историей, по запросу на таблицу"""
+    start, end = subtreeRange(path)
+    database.execute(text("""DELETE FROM item_history WHERE "itemId" IN
+        (SELECT id FROM items WHERE path >= :start AND path < :end)"""), {'start': start, 'end': end})
+    database.execute(text("DELETE FROM items WHERE path >= :start AND path < :end"),
+                     {'start': start, 'end': end})
+
+
+def removeItem(item_id: str, updateDate: datetime, database) -> list[str]:
+    """
+    Удаляет элемент с поддеревом и переносит изменение размера и даты на предков.
+    Возвращает id удалённых элементов и предков
+    """
+    nodes = loadItemsWithAncestors([item_id], database)
+    existsItem = nodes[item_id]
+    parents = pathIds(existsItem['path'])[:-1]
+    start, end = subtreeRange(existsItem['path'])
+    deleted = [row.id for row in database.query(Item.id).filter(Item.path >= start, Item.path < end)]
+    files, folders, depth, newest = itemStats(existsItem)
+    stale = set()
+    markStale(existsItem['parentId'], depth, newest, nodes, stale)
+    updateParents(parents, updateDate, -existsItem['size'], database, -files, -folders)
+    deleteSubtree(existsItem['path'], database)
+    if stale:
+        refreshFolderStats({id: nodes[id]['path'] for id in stale}, database)
+    saveHistory(parents, updateDate, database)
+    return deleted + parents
+
+
+def saveHistory(itemIds, date: datetime, database) -> None:
+    """
+    Записывает текущее состояние элементов в историю пачками INSERT ... SELECT.
+    Версия с той же датой заменяется, лишние старые версии удаляются.
+    """
+    database.flush()
+    for chunk in chunks(list(itemIds)):
+        database.query(ItemHistory) \
+            .filter(ItemHistory.itemId.in_(chunk), ItemHistory.date == date) \
+            .delete(synchronize_session=False)
+        database.execute(insert(ItemHistory).from_select(
+            ['itemId', 'parentId', 'url', 'size', 'type', 'date'],
+            select(Item.id, Item.parentId, Item.url, Item.size, Item.type, Item.updateDate)
+            .where(Item.id.in_(chunk))
+        ))
+        compactHistory(chunk, database)
+
+
+def compactHistory(itemIds: list[str], database) -> None:
+    """Оставляет у каждого элемента не больше HISTORY_MAX_VERSIONS последних версий"""
+    if not HISTORY_MAX_VERSIONS:
+        return
+    crowded = database.query(ItemHistory.itemId) \
+        .filter(ItemHistory.itemId.in_(itemIds)) \
+        .group_by(ItemHistory.itemId) \
+        .having(func.count() > HISTORY_MAX_VERSIONS)
+    for (itemId,) in crowded.all():
+        oldestKept = database.query(ItemHistory.date) \
+            .filter(ItemHistory.itemId == itemId) \
+            .order_by(ItemHistory.date.desc()) \
+            .offset(HISTORY_MAX_VERSIONS - 1).limit(1).scalar()
+        database.query(ItemHistory) \
+            .filter(ItemHistory.itemId == itemId, ItemHistory.date < oldestKept) \
+            .delete(synchronize_session=False)
+
+
+def getHistory(item_id: str, database, dateStart: datetime | None = None,
+               dateEnd: datetime | None = None) -> list[dict]:
+    """Возвращает версии элемента за полуинтервал [dateStart, dateEnd)"""
+    query = database.query(ItemHistory).filter(ItemHistory.itemId == item_id)
+    if dateStart:
+        query = query.filter(ItemHistory.date >= dateStart)
+    if dateEnd:
+        query = query.filter(ItemHistory.date < dateEnd)
+    return [{
+        'id': version.itemId,
+        'url': version.url,
+        'date': formatDate(version.date),
+        'parentId': version.parentId,
+        'size': version.size,
+        'type': version.type
+    } for version in query.order_by(ItemHistory.date)]
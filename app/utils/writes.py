@@ -0,0 +1,97 @@
+"""
+Координация записи. Импорт и удаление читают элементы и их предков, считают размеры,
+агрегаты и даты в памяти и пишут результат, поэтому записи над общим поддеревом должны
+идти по очереди: иначе вторая запишет размеры, посчитанные до первой. Транзакция записи
+начинается с BEGIN IMMEDIATE (в PostgreSQL - с общей pg_advisory_xact_lock), так что
+чтение идёт уже под блокировкой записи. В процессе записи в SQLite дополнительно идут по
+одной через writeLock и не ждут друг друга в busy_timeout. Конфликт блокировок
+(database is locked, deadlock) откатывает транзакцию, и запись повторяется с паузой.
+Восстановление снимка идёт через ту же транзакцию записи.
+"""
+import asyncio
+import random
+import time
+from contextlib import nullcontext
+from threading import Lock
+
+from sqlalchemy import text, select, func
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.util import await_only
+
+from app.config import WRITE_SERIALIZE, WRITE_RETRIES, WRITE_RETRY_BASE_MS
+from app.db import models
+from app.utils.metrics import WRITE_RETRIED
+
+# ключ pg_advisory_xact_lock для записи дерева
+WRITE_LOCK_ID = 2022090103
+# коды PostgreSQL, после которых транзакцию можно повторить: serialization_failure,
+# deadlock_detected, lock_not_available
+RETRY_PGCODES = {'40001', '40P01', '55P03'}
+
+writeLock = Lock()
+
+
+def processLock(bind):
+    """
+    Блокировка записи процесса для engine. Только для общего синхронного engine SQLite:
+    в асинхронном режиме обработчик выполняется в цикле событий, и ожидание блокировки
+    остановило бы его; там записи упорядочивает BEGIN IMMEDIATE
+    """
+    if WRITE_SERIALIZE and bind is models.engine and bind.dialect.name == 'sqlite':
+        return writeLock
+    return nullcontext()
+
+
+def beginWrite(database) -> None:
+    """Начинает транзакцию записи сразу с блокировкой, до первого чтения"""
+    dialect = database.bind.dialect.name
+    if dialect == 'sqlite':
+        database.execute(text('BEGIN IMMEDIATE'))
+    elif dialect == 'postgresql':
+        database.execute(select(func.pg_advisory_xact_lock(WRITE_LOCK_ID)))
+
+
+def isLockContention(error: DBAPIError) -> bool:
+    pgcode = getattr(error.orig, 'pgcode', None) or getattr(error.orig, 'sqlstate', None)
+    return pgcode in RETRY_PGCODES or 'database is locked' in str(error.orig)
+
+
+def retryDelay(attempt: int) -> float:
+    """Экспоненциальная пауза со случайным разбросом, чтобы повторы не совпадали"""
+    return WRITE_RETRY_BASE_MS / 1000 * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+def pause(database, delay: float) -> None:
+    """
+    Пауза перед повтором. В асинхронном режиме runWrite выполняется через run_sync в потоке
+    цикла событий: там пауза ждёт asyncio.sleep через await_only, как запросы к базе ждут
+    асинхронный драйвер, и остальные запросы в это время обслуживаются
+    """
+    if models.async_engine is not None and database.bind is models.async_engine.sync_engine:
+        await_only(asyncio.sleep(delay))
+    else:
+        time.sleep(delay)
+
+
+def runWrite(database, write, *args):
+    """
+    Выполняет write(database, *args) в транзакции записи и возвращает её результат; write
+    сам фиксирует транзакцию. При ошибке транзакция откатывается, при конфликте
+    блокировок - повторяется до WRITE_RETRIES раз
+    """
+    attempt = 0
+    while True:
+        try:
+            with processLock(database.bind):
+                beginWrite(database)
+                return write(database, *args)
+        except DBAPIError as error:
+            database.rollback()
+            if attempt >= WRITE_RETRIES or not isLockContention(error):
+                raise
+        except BaseException:
+            database.rollback()
+            raise
+        WRITE_RETRIED.inc()
+        pause(database, retryDelay(attempt))
+        attempt += 1
@@ -1,63 +1,116 @@
-import re
-
 from app.db.models import Item
 from app.forms import ItemForm
 from app.utils.exceptions import ValidateExeption, NotFoundExeption
-from app.utils.utils import findFoldersInImports
+from app.utils.utils import chunks, TOP_LEVEL_PARENTS
+from app.utils.cache import pathCache
+from app.utils import tree_index
 
 
-def validateDate(s: str) -> bool:
-    """Проверяет соответствует ли дата фомату ISO8601"""
-    regular = r'^(-?(?:[1-9][0-9]*)?[0-9]{4})-(1[0-2]|0[1-9])-(3[01]|0[1-9]|[12][0-9])' \
-            r'T(2[0-3]|[01][0-9]):([0-5][0-9]):([0-5][0-9])(\.[0-9]+)?(Z|[+-](?:2[0-3]|' \
-            r'[01][0-9]):[0-5][0-9])?$'
-    match_iso8601 = re.compile(regular).match
-    try:
-        if match_iso8601(s) is not None:
-            return True
-    except:
-        pass
-    raise ValidateExeption("Invalid date")
+# parentId элементов верхнего уровня (см. isTopLevel) - для проверки одним поиском в множестве
+TOP_LEVEL_IDS = frozenset((None, *TOP_LEVEL_PARENTS))
 
 
-def validateFile(item: ItemForm) -> bool:
-    """Валидация файла"""
-    if item.url != None and (len(item.url) <= 255):
-        if item.size and item.size > 0:
-            return True
-    raise ValidateExeption("Invalid file")
+def checkFile(item: ItemForm) -> str | None:
+    """Возвращает ошибку полей файла или None"""
+    if item.url is None or len(item.url) > 255:
+        return "Invalid file url"
+    if not item.size or item.size <= 0:
+        return "Invalid file size"
+    return None
 
 
-def validateFolder(item: ItemForm) -> bool:
-    """Валидация папки"""
-    if not item.url:
-        if not item.size:
-            return True
-    raise ValidateExeption("Invalid folder")
+def checkFolder(item: ItemForm) -> str | None:
+    """Возвращает ошибку полей папки или None"""
+    if item.url:
+        return "Folder url must be null"
+    if item.size:
+        return "Folder size must be null"
+    return None
 
 
-def validateItems(items: list[ItemForm], database) -> bool:
-    """Валидация данных"""
-    # проверка id на уникальность
-    item_id_set = set([item.id for item in items])
-    if len(item_id_set) != len(items):
-        raise ValidateExeption("Invalid item")
-    importFolders = findFoldersInImports(items)
+def validateItems(items: list[ItemForm], existing: dict[str, dict]) -> bool:
+    """
+    Валидация пачки за один проход, existing - уже загруженные из базы элементы и их предки.
+    Собирает все ошибки и выбрасывает их вместе в ValidateExeption.errors.
+    """
+    # типы элементов после импорта: элементы пачки перекрывают записи из базы
+    batchTypes = {item.id: item.type for item in items}
+    # родитель должен быть папкой в пачке или в базе; проверяется один раз на каждый parentId
+    parentErrors = {}
+    for parentId in {item.parentId for item in items}:
+        if parentId in TOP_LEVEL_IDS:
+            parentErrors[parentId] = None
+        elif parentId in batchTypes:
+            parentErrors[parentId] = None if batchTypes[parentId] == 'FOLDER' else "Parent is not a folder"
+        elif parentId in existing:
+            parentErrors[parentId] = None if existing[parentId]['type'] == 'FOLDER' else "Parent is not a folder"
+        else:
+            parentErrors[parentId] = "Parent not found"
+    errors = []
+    # повторы id ищутся, только если они есть; ошибкой считается каждое повторное вхождение
+    findDuplicates = len(batchTypes) != len(items)
+    seen = set()
     for item in items:
-        if item.id:
-            # проверка существования поля parent
-            parent = database.query(Item).filter(Item.id == item.parentId).one_or_none()
-            if not item.parentId or item.parentId == "0" or parent or (item.parentId in importFolders):
-                if item.type == 'FILE':
-                    if validateFile(item):
-                        continue
-                elif item.type == 'FOLDER':
-                    if validateFolder(item):
-                        continue
-            raise ValidateExeption("Invalid item")
-        raise ValidateExeption("Invalid item")
+        id, type = item.id, item.type
+        if not id:
+            errors.append({'id': id, 'error': "Empty id"})
+            continue
+        if findDuplicates:
+            if id in seen:
+                errors.append({'id': id, 'error': "Duplicate id"})
+            seen.add(id)
+        if type == 'FILE':
+            error = checkFile(item)
+        elif type == 'FOLDER':
+            error = checkFolder(item) if item.url or item.size else None
+        else:
+            error = "Invalid type"
+        if error:
+            errors.append({'id': id, 'error': error})
+        if id in existing and existing[id]['type'] != type:
+            errors.append({'id': id, 'error': "Type change is not allowed"})
+        if parentErrors[item.parentId]:
+            errors.append({'id': id, 'error': parentErrors[item.parentId]})
+    if errors:
+        raise ValidateExeption("Invalid items", errors)
+    return True
+
+
+def validateNoCycles(items: list[ItemForm], existing: dict[str, dict]) -> bool:
+    """
+    Проверяет, что импорт не создаёт циклов из ссылок parentId. От элемента цепочка
+    родителей проходится до уже проверенного элемента; элемент, встреченный повторно в той
+    же цепочке, означает цикл. Цикл в сохранённом дереве невозможен, поэтому от элементов,
+    которые не меняют родителя, цепочки не начинаются, а элемент, чей родитель уже проверен
+    или отсутствует, проверяется без обхода.
+    """
+    # родители из пачки перекрывают родителей из базы
+    parents = {item.id: item.parentId for item in items}
+    # id -> номер цепочки, в которой элемент пройден
+    seen = {}
+    for number, item in enumerate(items):
+        id, parentId = item.id, item.parentId
+        if id in seen:
+            continue
+        if parentId in TOP_LEVEL_IDS or parentId in seen:
+            seen[id] = number
+            continue
+        if id in existing and existing[id]['parentId'] == parentId:
+            continue
+        while id not in seen:
+            seen[id] = number
+            if id in parents:
+                id = parents[id]
+            elif id in existing:
+                id = existing[id]['parentId']
+            else:
+                break
+        else:
+            if seen[id] == number:
+                raise ValidateExeption("Invalid item")
     return True
 
+
 def validateUrl(url_headers:list[str], database):
     if url_headers[-1] == "":
         url_headers.pop(-1)
@@ -67,22 +120,29 @@ def validateUrl(url_headers:list[str], database):
     if "" in url_headers:
         raise ValidateExeption("Invalid item")
 
-    for i in range(1, len(url_headers)):
-        item = database.query(Item).filter(Item.id == url_headers[i]).one_or_none()
-        if item:
-            if item.type == 'FOLDER':
-                if i + 1 < len(url_headers):
-                    next_item = database.query(Item).filter(Item.id == url_headers[i+1]).one_or_none()
-                    if next_item:
-                        if item.id == next_item.parentId:
-                            continue
-                        else:
-                            raise ValidateExeption("Invalid item")
-                    else:
-                        raise NotFoundExeption("Item not found")   
-                else:
-                    continue
-            else:
+    segments = url_headers[1:]
+    if tree_index.treeIndex is not None:
+        with tree_index.treeIndex.lock:
+            tree_index.treeIndex.validateUrl(segments)
+        return
+    path = '/'.join(segments)
+    if not segments or pathCache.get(path) is not None:
+        return
+    # версия берётся до чтения, чтобы не закэшировать цепочку, изменённую во время проверки
+    version = pathCache.version()
+    # вся цепочка читается одним запросом и проверяется в памяти в порядке сегментов
+    items = {item.id: item for chunk in chunks(list(set(segments))) for item in
+             database.query(Item.id, Item.parentId, Item.type).filter(Item.id.in_(chunk))}
+    for i, id in enumerate(segments):
+        item = items.get(id)
+        if not item:
+            raise NotFoundExeption("Item not found")
+        if item.type != 'FOLDER':
+            raise ValidateExeption("Invalid item")
+        if i + 1 < len(segments):
+            next_item = items.get(segments[i + 1])
+            if not next_item:
+                raise NotFoundExeption("Item not found")
+            if next_item.parentId != item.id:
                 raise ValidateExeption("Invalid item")
-        else:
-            raise NotFoundExeption("Item not found")
\ No newline at end of file
+    pathCache.set(path, tuple(segments), version)
@@ -0,0 +1,5 @@
+"""
+Нагрузочные замеры сервиса. Запускаются как модули, например:
+
+    python -m benchmarks.nodes_load
+"""
@@ -0,0 +1,96 @@
+"""
+Сравнивает каскадное удаление для DELETE /delete/{id}: прежний рекурсивный
+обход (запрос на каждую папку и DELETE на каждый элемент) и удаление
+поддерева одним запросом на таблицу по диапазону материализованного пути.
+
+    python -m benchmarks.cascade_delete --sizes 1000 10000 50000
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.db.models import Item, ItemHistory, init_engine
+from app.main import create_db
+from app.utils.dates import parseDate
+from app.utils.utils import removeItem, saveHistory
+from benchmarks.common import temp_database_url, generate_tree, insert_items
+
+
+def legacy_deleting_children_of_folder(item_id: str, database) -> list[str]:
+    """Прежняя реализация: рекурсивный обход и DELETE на каждый вложенный элемент"""
+    deleted = []
+    children = database.query(Item).filter(Item.parentId == item_id).all()
+    for i in range(len(children)):
+        if children[i].type == 'FOLDER':
+            deleted += legacy_deleting_children_of_folder(children[i].id, database)
+        database.query(Item).filter(Item.id == children[i].id).delete()
+        deleted.append(children[i].id)
+    return deleted
+
+
+def legacy_update_parents(parentId: str | None, updateDate: datetime, sizeDelta: int, database) -> list[str]:
+    """Прежняя реализация: запрос и UPDATE на каждого предка"""
+    parents = []
+    while parentId:
+        parent = database.query(Item).filter(Item.id == parentId).one_or_none()
+        if not parent:
+            break
+        parent.updateDate = updateDate
+        parent.size = (parent.size or 0) + sizeDelta
+        parents.append(parent.id)
+        parentId = parent.parentId
+    return parents
+
+
+def legacy_delete_item(item_id: str, updateDate: datetime, database) -> None:
+    """Прежний обработчик удаления без commit"""
+    existsFile = database.query(Item).filter(Item.id == item_id).one_or_none()
+    deleted = [item_id]
+    if existsFile.type == 'FOLDER':
+        deleted += legacy_deleting_children_of_folder(item_id, database)
+    parents = legacy_update_parents(existsFile.parentId, updateDate, -(existsFile.size or 0), database)
+    database.query(Item).filter(Item.id == item_id).delete()
+    for deletedId in deleted:
+        database.query(ItemHistory).filter(ItemHistory.itemId == deletedId).delete()
+    saveHistory(parents, updateDate, database)
+
+
+def measure(delete, size: int) -> dict:
+    engine = init_engine(temp_database_url())
+    create_db(engine)
+    root_id, items = generate_tree(size)
+    insert_items(engine, items)
+    # удаляется первая вложенная папка - примерно десятая часть дерева
+    target = next(item['id'] for item in items if item['parentId'] == root_id and item['type'] == 'FOLDER')
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    with Session(engine) as database:
+        start = time.perf_counter()
+        delete(target, parseDate('2022-02-02T12:00:00Z'), database)
+        database.commit()
+        elapsed = time.perf_counter() - start
+    engine.dispose()
+    return {'statements': statements, 'seconds': round(elapsed, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(json.dumps({'items': size, 'set_based': measure(removeItem, size),
+                          'legacy': measure(legacy_delete_item, size)}))
+
+
+if __name__ == '__main__':
+    main()
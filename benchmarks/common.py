@@ -0,0 +1,217 @@
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app.db.models import Item
+from app.main import get_application
+from app.utils.dates import parseDate
+from app.utils.utils import pathSegment
+
+
+def temp_database_url() -> str:
+    """Возвращает url новой базы SQLite во временной папке"""
+    path = os.path.join(tempfile.mkdtemp(prefix='disk-bench-'), 'bench.db')
+    return f'sqlite:///{path}'
+
+
+def make_client(database_url: str) -> TestClient:
+    """Поднимает приложение на отдельной базе и возвращает клиент к нему"""
+    return TestClient(get_application(database_url))
+
+
+def generate_tree(count: int, fanout: int = 10, file_size: int = 128) -> tuple[str, list[dict]]:
+    """
+    Генерирует сбалансированное дерево из count элементов в формате ImportForm.items.
+    Возвращает id корня и элементы в порядке родитель-раньше-ребёнка.
+    """
+    root_id = str(uuid.uuid4())
+    items = [{'id': root_id, 'type': 'FOLDER', 'parentId': None}]
+    folders = [root_id]
+    cursor = 0
+    while len(items) < count:
+        parent_id = folders[cursor // fanout]
+        cursor += 1
+        # каждый второй ребёнок - папка, чтобы дерево росло вглубь
+        if cursor % 2:
+            item_id = str(uuid.uuid4())
+            items.append({'id': item_id, 'type': 'FOLDER', 'parentId': parent_id})
+            folders.append(item_id)
+        else:
+            items.append({'id': str(uuid.uuid4()), 'type': 'FILE', 'parentId': parent_id,
+                          'url': '/file/bench', 'size': file_size})
+    return root_id, items
+
+
+def file_sizes(distribution: str, mean: int, rng: random.Random):
+    """Возвращает функцию, выдающую размеры файлов: fixed, uniform (1..2*mean) или lognormal"""
+    if distribution == 'fixed':
+        return lambda: mean
+    if distribution == 'uniform':
+        return lambda: rng.randint(1, 2 * mean)
+    if distribution == 'lognormal':
+        sigma = 1.0
+        mu = math.log(mean) - sigma ** 2 / 2
+        return lambda: max(1, int(rng.lognormvariate(mu, sigma)))
+    raise ValueError(f'unknown size distribution: {distribution}')
+
+
+def generate_synthetic_tree(count: int, fanout: int = 10, depth: int = 8, folder_ratio: float = 0.3,
+                            size_distribution: str = 'lognormal', mean_size: int = 4096,
+                            seed: int = 0) -> tuple[str, list[dict]]:
+    """
+    Генерирует воспроизводимое дерево из count элементов в формате ImportForm.items.
+    Папки заполняются в ширину, у каждой не больше fanout детей (пока хватает места),
+    уровень папок не глубже depth; доля папок - folder_ratio, размеры файлов берутся
+    из распределения size_distribution со средним mean_size.
+    Возвращает id корня и элементы в порядке родитель-раньше-ребёнка.
+    """
+    rng = random.Random(seed)
+    next_size = file_sizes(size_distribution, mean_size, rng)
+    root_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    items = [{'id': root_id, 'type': 'FOLDER', 'parentId': None}]
+    # (id папки, уровень, число детей)
+    open_folders = [[root_id, 1, 0]]
+    all_folders = list(open_folders)
+    cursor = 0
+    while len(items) < count:
+        if cursor >= len(open_folders):
+            # все папки заполнены: следующий круг по всем папкам сверх fanout
+            open_folders, cursor = all_folders, 0
+        folder = open_folders[cursor]
+        item_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        if folder[1] < depth and rng.random() < folder_ratio:
+            items.append({'id': item_id, 'type': 'FOLDER', 'parentId': folder[0]})
+            child = [item_id, folder[1] + 1, 0]
+            all_folders.append(child)
+            if open_folders is not all_folders:
+                open_folders.append(child)
+        else:
+            items.append({'id': item_id, 'type': 'FILE', 'parentId': folder[0],
+                          'url': f'/file/{item_id[:8]}', 'size': next_size()})
+        folder[2] += 1
+        if folder[2] % fanout == 0:
+            cursor += 1
+    return root_id, items
+
+
+def import_items(client: TestClient, items: list[dict], date: str = '2022-02-01T12:00:00Z',
+                 batch_size: int = 1000) -> None:
+    """Импортирует элементы пачками"""
+    for start in range(0, len(items), batch_size):
+        response = client.post('/imports', json={'items': items[start:start + batch_size],
+                                                 'updateDate': date})
+        assert response.status_code == 200, response.text
+
+
+def generate_shape(shape: str, count: int, fanout: int = 10, depth: int = 500) -> tuple[str, list[dict]]:
+    """
+    Генерирует дерево заданной формы:
+    wide - все элементы лежат в корне,
+    deep - цепочка из depth папок, файлы распределены по уровням,
+    balanced - дерево с ветвлением fanout.
+    """
+    if shape == 'balanced':
+        return generate_tree(count, fanout)
+    root_id = str(uuid.uuid4())
+    items = [{'id': root_id, 'type': 'FOLDER', 'parentId': None}]
+    if shape == 'wide':
+        items += [{'id': str(uuid.uuid4()), 'type': 'FILE', 'parentId': root_id,
+                   'url': '/file/bench', 'size': 128} for _ in range(count - 1)]
+        return root_id, items
+    chain = [root_id]
+    for _ in range(min(depth, count // 2) - 1):
+        items.append({'id': str(uuid.uuid4()), 'type': 'FOLDER', 'parentId': chain[-1]})
+        chain.append(items[-1]['id'])
+    for index in range(count - len(items)):
+        items.append({'id': str(uuid.uuid4()), 'type': 'FILE', 'parentId': chain[index % len(chain)],
+                      'url': '/file/bench', 'size': 128})
+    return root_id, items
+
+
+def insert_items(engine, items: list[dict], date: str = '2022-02-01T12:00:00Z') -> None:
+    """
+    Записывает элементы напрямую в таблицу, минуя /imports (размеры и агрегаты папок не считаются).
+    Элементы должны идти в порядке родитель-раньше-ребёнка.
+    """
+    paths = {None: '/'}
+    rows = []
+    for item in items:
+        paths[item['id']] = paths[item['parentId']] + pathSegment(item['id'])
+        rows.append({'id': item['id'], 'parentId': item['parentId'], 'url': item.get('url'),
+                     'size': item.get('size', 0), 'type': item['type'], 'updateDate': parseDate(date),
+                     'path': paths[item['id']]})
+    with engine.begin() as connection:
+        connection.execute(Item.__table__.insert(), rows)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(database_url: str, port: int, async_mode: bool = False) -> None:
+    """Запускает uvicorn с приложением на отдельной базе (цель для multiprocessing.Process)"""
+    import uvicorn
+    uvicorn.run(get_application(database_url, async_mode), host='127.0.0.1', port=port, log_level='warning')
+
+
+def start_server(database_url: str, async_mode: bool = False,
+                 env: dict | None = None) -> tuple[multiprocessing.Process, str]:
+    """
+    Поднимает сервер в отдельном процессе и ждёт, пока он начнёт отвечать.
+    env - настройки из app.config для сервера: процесс тогда запускается заново (spawn)
+    и читает их из окружения при импорте приложения.
+    """
+    port = free_port()
+    context = multiprocessing.get_context('spawn' if env else None)
+    process = context.Process(target=serve, args=(database_url, port, async_mode), daemon=True)
+    saved = dict(os.environ)
+    os.environ.update(env or {})
+    try:
+        process.start()
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(200):
+        try:
+            urllib.request.urlopen(f'{base_url}/openapi.json')
+            return process, base_url
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError('server did not start')
+
+
+def http_request(base_url: str, path: str, method: str = 'GET', data: dict | None = None) -> int:
+    """Выполняет запрос к серверу и возвращает код ответа"""
+    body = json.dumps(data).encode() if data is not None else None
+    request = urllib.request.Request(f'{base_url}{path}', data=body, method=method,
+                                     headers={'Content-Type': 'application/json'} if body else {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def percentiles(latencies: list[float]) -> dict:
+    """p50/p95/p99 в миллисекундах"""
+    if len(latencies) < 2:
+        return {'count': len(latencies)}
+    points = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {'count': len(latencies), 'p50_ms': round(points[49] * 1000, 2),
+            'p95_ms': round(points[94] * 1000, 2), 'p99_ms': round(points[98] * 1000, 2)}
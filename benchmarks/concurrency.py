@@ -0,0 +1,73 @@
+"""
+Смешанная нагрузка читателей и писателей на сервер uvicorn в синхронном и
+асинхронном режимах. Для каждого режима выводит p50/p95/p99 по чтениям
+(GET /nodes/{id}, GET /updates) и записям (POST /imports, DELETE /delete/{id}).
+
+    python -m benchmarks.concurrency --readers 8 --writers 2 --seconds 10
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+
+from benchmarks.common import temp_database_url, start_server, http_request, generate_tree, percentiles
+
+DATE = '2022-02-01T12:00:00Z'
+
+
+def run_mode(async_mode: bool, args) -> dict:
+    process, base_url = start_server(temp_database_url(), async_mode)
+    try:
+        root_id, items = generate_tree(args.items)
+        assert http_request(base_url, '/imports', 'POST', {'items': items, 'updateDate': DATE}) == 200
+        folders = [item['id'] for item in items if item['type'] == 'FOLDER']
+        reads, writes = [], []
+        deadline = time.perf_counter() + args.seconds
+
+        def reader(index):
+            while time.perf_counter() < deadline:
+                path = f'/nodes/{folders[index % len(folders)]}' if index % 2 else f'/updates?date={DATE}'
+                start = time.perf_counter()
+                assert http_request(base_url, path) == 200
+                reads.append(time.perf_counter() - start)
+                index += 1
+
+        def writer(index):
+            while time.perf_counter() < deadline:
+                parent = folders[index % len(folders)]
+                batch = [{'id': str(uuid.uuid4()), 'type': 'FILE', 'parentId': parent,
+                          'url': '/file/bench', 'size': 64} for _ in range(args.batch)]
+                start = time.perf_counter()
+                assert http_request(base_url, '/imports', 'POST', {'items': batch, 'updateDate': DATE}) == 200
+                assert http_request(base_url, f'/delete/{batch[0]["id"]}?date={DATE}', 'DELETE') == 200
+                writes.append(time.perf_counter() - start)
+                index += 1
+
+        threads = [threading.Thread(target=reader, args=(index,)) for index in range(args.readers)]
+        threads += [threading.Thread(target=writer, args=(index,)) for index in range(args.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {'mode': 'async' if async_mode else 'sync', 'reads': percentiles(reads),
+                'writes': percentiles(writes)}
+    finally:
+        process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    for async_mode in (False, True):
+        print(json.dumps(run_mode(async_mode, args)))
+
+
+if __name__ == '__main__':
+    main()
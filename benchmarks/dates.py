@@ -0,0 +1,62 @@
+"""
+Пропускная способность разбора дат запроса: parseDate (проверка ISO 8601 и перевод в UTC
+за один проход) в сравнении с прежним путём - отдельной проверкой выражением и разбором
+через split('T') и strptime, как в getDateAndYesterday и checkForDay. Замеряются даты
+с Z, со смещением и с дробной частью секунд.
+
+    python -m benchmarks.dates --calls 100000
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from app.utils.dates import ISO8601, parseDate
+from app.utils.exceptions import ValidateExeption
+
+DATES = {'utc': '2022-02-01T12:00:00Z',
+         'fraction': '2022-02-01T12:00:00.123Z',
+         'offset': '2022-02-01T15:00:00+03:00'}
+
+
+def legacy_parse_date(date: str) -> datetime:
+    """Прежний путь: проверка выражением и разбор строки; смещение не учитывалось"""
+    if ISO8601.match(date) is None:
+        raise ValidateExeption("Invalid date")
+    if date[-1] == 'Z':
+        date = date[:-1]
+    dateStr = date.split('T')[0] + ' ' + date.split('T')[1]
+    try:
+        return datetime.strptime(dateStr, "%Y-%m-%d %H:%M:%S.%f")
+    except ValueError:
+        return datetime.strptime(dateStr, "%Y-%m-%d %H:%M:%S")
+
+
+def throughput(function, date: str, calls: int) -> float | None:
+    """Разборов в секунду, лучший из трёх прогонов"""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        try:
+            for _ in range(calls):
+                function(date)
+        except ValueError:
+            return None
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(calls / best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=100000)
+    args = parser.parse_args()
+
+    for name, date in DATES.items():
+        # None - прежний путь такую дату не разбирал
+        print(json.dumps({'date': name, 'parse_date_per_s': throughput(parseDate, date, args.calls),
+                          'legacy_per_s': throughput(legacy_parse_date, date, args.calls)}))
+
+
+if __name__ == '__main__':
+    main()
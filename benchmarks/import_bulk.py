@@ -0,0 +1,52 @@
+"""
+Замер POST /imports по размерам пачки: число SQL-запросов на импорт и
+пропускная способность (элементов в секунду) для вставки новых элементов
+и повторного импорта тех же элементов (обновление).
+
+    python -m benchmarks.import_bulk --sizes 100 1000 5000
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import event
+
+from app.db import models
+from benchmarks.common import temp_database_url, make_client, generate_tree
+
+
+def measure_import(client, items: list[dict], date: str) -> dict:
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(models.engine, 'before_cursor_execute', count)
+    start = time.perf_counter()
+    response = client.post('/imports', json={'items': items, 'updateDate': date})
+    elapsed = time.perf_counter() - start
+    event.remove(models.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200, response.text
+    return {'statements': statements, 'seconds': round(elapsed, 4),
+            'items_per_second': round(len(items) / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--fanout', type=int, default=10)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        client = make_client(temp_database_url())
+        _, items = generate_tree(size, args.fanout)
+        print(json.dumps({
+            'items': size,
+            'insert': measure_import(client, items, '2022-02-01T12:00:00Z'),
+            'update': measure_import(client, items, '2022-02-02T12:00:00Z'),
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+POST /nodes/batch против N последовательных GET /nodes/{id} на реальном сервере:
+время на набор id и число SQL-запросов (в процессе, через TestClient). Набор - случайные
+папки и файлы дерева, часть из них вложена друг в друга; --depth ограничивает глубину.
+
+    python -m benchmarks.nodes_batch --size 100000 --ids 10 50 200 --depth 2
+"""
+import argparse
+import json
+import random
+import time
+
+from sqlalchemy import event
+
+from app.db import models
+from app.db.models import init_engine
+from app.main import create_db
+from benchmarks.common import temp_database_url, generate_synthetic_tree, insert_items, make_client, \
+    start_server, http_request
+
+
+def count_statements(function) -> int:
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(models.engine, 'before_cursor_execute', count)
+    try:
+        function()
+    finally:
+        event.remove(models.engine, 'before_cursor_execute', count)
+    return statements
+
+
+def best_of(function, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--ids', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--depth', type=int, default=2, help='-1 - без ограничения')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    depth = None if args.depth < 0 else args.depth
+    query = '' if depth is None else f'?depth={depth}'
+    _, items = generate_synthetic_tree(args.size, seed=args.seed)
+    database_url = temp_database_url()
+    engine = init_engine(database_url)
+    create_db(engine)
+    insert_items(engine, items)
+    engine.dispose()
+
+    rng = random.Random(args.seed)
+    client = make_client(database_url)
+    process, base_url = start_server(database_url)
+    try:
+        for count in args.ids:
+            ids = [item['id'] for item in rng.sample(items, count)]
+
+            def sequential():
+                for id in ids:
+                    assert http_request(base_url, f'/nodes/{id}{query}') == 200
+
+            def batch():
+                assert http_request(base_url, '/nodes/batch', 'POST', {'ids': ids, 'depth': depth}) == 200
+
+            sequential_s, batch_s = best_of(sequential, args.repeat), best_of(batch, args.repeat)
+            print(json.dumps({
+                'ids': count, 'depth': depth,
+                'sequential_ms': round(sequential_s * 1000, 1), 'batch_ms': round(batch_s * 1000, 1),
+                'speedup': round(sequential_s / batch_s, 1),
+                'sequential_statements': count_statements(
+                    lambda: [client.get(f'/nodes/{id}{query}') for id in ids]),
+                'batch_statements': count_statements(
+                    lambda: client.post('/nodes/batch', json={'ids': ids, 'depth': depth})),
+            }))
+    finally:
+        process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Сравнивает RPS на GET /nodes/{id} для старого подключения к базе
+(новый engine на каждый запрос) и общего пула соединений.
+
+    python -m benchmarks.nodes_load --items 10 --requests 2000 --threads 4
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.db.models import connection_db
+from benchmarks.common import temp_database_url, make_client, generate_tree, import_items
+
+
+def legacy_connection_db_factory(database_url: str):
+    """Воспроизводит прежний connection_db: engine и соединение на каждый запрос"""
+    def legacy_connection_db():
+        engine = create_engine(database_url, connect_args={})
+        return Session(bind=engine.connect())
+    return legacy_connection_db
+
+
+def measure_rps(client, path: str, requests: int, threads: int) -> float:
+    def worker(count):
+        for _ in range(count):
+            assert client.get(path).status_code == 200
+    per_thread = requests // threads
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(worker, [per_thread] * threads))
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    database_url = temp_database_url()
+    client = make_client(database_url)
+    root_id, items = generate_tree(args.items)
+    import_items(client, items)
+    path = f'/nodes/{root_id}'
+
+    client.app.dependency_overrides[connection_db] = legacy_connection_db_factory(database_url)
+    before = measure_rps(client, path, args.requests, args.threads)
+    client.app.dependency_overrides.clear()
+    after = measure_rps(client, path, args.requests, args.threads)
+
+    print(json.dumps({
+        'items': args.items,
+        'requests': args.requests,
+        'threads': args.threads,
+        'rps_engine_per_request': round(before, 1),
+        'rps_pooled': round(after, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
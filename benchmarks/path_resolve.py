@@ -0,0 +1,88 @@
+"""
+Сравнивает проверку пути GET /children (validateUrl) на цепочках папок разной глубины:
+прежнюю (по два запроса на сегмент), новую без кэша (один запрос на всю цепочку) и
+новую с кэшем путей. Для каждой глубины выводит число запросов и задержки.
+
+    python -m benchmarks.path_resolve --depths 1 10 50 100 500
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.db.models import Item, init_engine
+from app.main import create_db
+from app.utils.cache import pathCache
+from app.utils.exceptions import ValidateExeption, NotFoundExeption
+from app.validations import validateUrl
+from benchmarks.common import temp_database_url, insert_items, percentiles
+
+
+def legacy_validate_url(url_headers: list[str], database):
+    """Прежняя реализация: каждый сегмент и его следующий элемент читаются отдельными запросами"""
+    if url_headers[-1] == "":
+        url_headers.pop(-1)
+    if not (url_headers and url_headers[0].lower() == 'home'):
+        raise ValidateExeption("Invalid item")
+    if "" in url_headers:
+        raise ValidateExeption("Invalid item")
+    for i in range(1, len(url_headers)):
+        item = database.query(Item).filter(Item.id == url_headers[i]).one_or_none()
+        if not item:
+            raise NotFoundExeption("Item not found")
+        if item.type != 'FOLDER':
+            raise ValidateExeption("Invalid item")
+        if i + 1 < len(url_headers):
+            next_item = database.query(Item).filter(Item.id == url_headers[i + 1]).one_or_none()
+            if not next_item:
+                raise NotFoundExeption("Item not found")
+            if item.id != next_item.parentId:
+                raise ValidateExeption("Invalid item")
+
+
+def measure(engine, validate, url_headers: list[str], repeat: int, cached: bool) -> dict:
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    latencies = []
+    with Session(engine) as database:
+        event.listen(engine, 'before_cursor_execute', count)
+        for _ in range(repeat):
+            if not cached:
+                pathCache.clear()
+            start = time.perf_counter()
+            validate(list(url_headers), database)
+            latencies.append(time.perf_counter() - start)
+        event.remove(engine, 'before_cursor_execute', count)
+    return {'queries_per_call': round(statements / repeat, 2), **percentiles(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 10, 50, 100, 500])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    engine = init_engine(temp_database_url())
+    create_db(engine)
+    chain = [f'folder-{level}' for level in range(max(args.depths))]
+    insert_items(engine, [{'id': id, 'type': 'FOLDER', 'parentId': chain[level - 1] if level else None}
+                          for level, id in enumerate(chain)])
+
+    for depth in args.depths:
+        url_headers = ['home'] + chain[:depth]
+        result = {'depth': depth,
+                  'legacy': measure(engine, legacy_validate_url, url_headers, args.repeat, cached=False),
+                  'single_query': measure(engine, validateUrl, url_headers, args.repeat, cached=False),
+                  'cached': measure(engine, validateUrl, url_headers, args.repeat, cached=True)}
+        print(json.dumps(result))
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Выгрузка и восстановление снимка (app.db.snapshot) на синтетическом дереве: время и
+скорость export и restore, объём снимка и пик памяти Python во время восстановления
+(tracemalloc), который не должен расти с размером дерева. Для сравнения то же дерево
+загружается через POST /imports пачками (--replay-limit ограничивает число элементов).
+
+    python -m benchmarks.snapshot --size 1000000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from app.db.models import init_engine
+from app.db.snapshot import exportLines, restoreSnapshot
+from app.main import create_db
+from benchmarks.common import temp_database_url, generate_synthetic_tree, insert_items, make_client, \
+    import_items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay-limit', type=int, default=100000, help='элементов для замера /imports')
+    parser.add_argument('--skip-memory', action='store_true', help='не замерять память (tracemalloc замедляет)')
+    args = parser.parse_args()
+
+    _, items = generate_synthetic_tree(args.size, seed=args.seed)
+    engine = init_engine(temp_database_url())
+    create_db(engine)
+    insert_items(engine, items)
+
+    path = os.path.join(tempfile.mkdtemp(prefix='disk-bench-'), 'snapshot.ndjson')
+    start = time.perf_counter()
+    with engine.connect() as database, open(path, 'wb') as output:
+        output.writelines(exportLines(database))
+    export = time.perf_counter() - start
+    engine.dispose()
+
+    result = {'items': args.size, 'snapshot_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+              'export_s': round(export, 2), 'export_items_per_s': round(args.size / export)}
+
+    engine = init_engine(temp_database_url())
+    create_db(engine)
+    start = time.perf_counter()
+    with open(path, 'rb') as lines:
+        restoreSnapshot(lines, engine)
+    restore = time.perf_counter() - start
+    result.update({'restore_s': round(restore, 2), 'restore_items_per_s': round(args.size / restore)})
+    engine.dispose()
+
+    if not args.skip_memory:
+        engine = init_engine(temp_database_url())
+        create_db(engine)
+        tracemalloc.start()
+        with open(path, 'rb') as lines:
+            restoreSnapshot(lines, engine, replace=True)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['restore_peak_traced_mb'] = round(peak / 2 ** 20, 1)
+        engine.dispose()
+
+    if args.replay_limit:
+        replay = items[:args.replay_limit]
+        client = make_client(temp_database_url())
+        start = time.perf_counter()
+        import_items(client, replay)
+        elapsed = time.perf_counter() - start
+        result['imports_items_per_s'] = round(len(replay) / elapsed)
+    os.remove(path)
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
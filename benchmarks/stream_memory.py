@@ -0,0 +1,134 @@
+"""
+Сравнивает выдачу GET /nodes/{id} для большого дерева: ответ одним телом и потоковый
+(STREAM_RESPONSES). Для каждого режима поднимается отдельный сервер и измеряются время
+до первого байта, полное время, объём ответа и пиковый RSS процесса сервера (VmHWM).
+Для сравнения в этом же процессе замеряется прежний путь: вложенные словари,
+jsonable_encoder и json.dumps (tracemalloc).
+
+    python -m benchmarks.stream_memory --size 1000000
+"""
+import argparse
+import http.client
+import json
+import time
+import tracemalloc
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text, DateTime
+from sqlalchemy.orm import Session
+
+from app.db.models import Item, init_engine
+from app.main import create_db
+from app.utils.dates import formatDate
+from benchmarks.common import temp_database_url, generate_tree, insert_items, start_server
+
+
+LEGACY_SUBTREE_QUERY = text("""
+    SELECT id, url, type, "parentId", "updateDate", size FROM items
+    WHERE path > (SELECT path FROM items WHERE id = :item_id)
+      AND path < (SELECT substr(path, 1, length(path) - 1) || '0' FROM items WHERE id = :item_id)
+    ORDER BY path
+""").columns(updateDate=DateTime)
+
+
+def legacy_check_folder_for_children(ans: list, item_id: str, database) -> list:
+    """Прежняя реализация: поддерево одним запросом, собранное во вложенные словари"""
+    children = defaultdict(list, {item_id: ans})
+    for id, url, type, parentId, updateDate, size in database.execute(LEGACY_SUBTREE_QUERY, {'item_id': item_id}):
+        children[parentId].append({
+            'id': id,
+            'url': url,
+            'type': type,
+            'parentId': parentId,
+            'date': formatDate(updateDate),
+            'size': size,
+            'children': children[id] if type == 'FOLDER' else None
+        })
+    return ans
+
+
+def peak_rss(pid: int) -> int:
+    """Пиковый RSS процесса в байтах"""
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def fetch(base_url: str, path: str) -> dict:
+    """Читает ответ и замеряет время до первого байта тела и полное время"""
+    address = urlparse(base_url)
+    connection = http.client.HTTPConnection(address.hostname, address.port, timeout=600)
+    start = time.perf_counter()
+    connection.request('GET', path)
+    response = connection.getresponse()
+    size = len(response.read(1))
+    first_byte = time.perf_counter() - start
+    while chunk := response.read(65536):
+        size += len(chunk)
+    total = time.perf_counter() - start
+    connection.close()
+    return {'status': response.status, 'ttfb_ms': round(first_byte * 1000, 1),
+            'total_ms': round(total * 1000, 1), 'bytes': size}
+
+
+def measure_server(database_url: str, root_id: str, stream: bool) -> dict:
+    # кэш выключен, чтобы не учитывать собранную для него копию ответа, а mmap - чтобы
+    # прочитанные страницы базы не попадали в RSS
+    process, base_url = start_server(database_url, env={'STREAM_RESPONSES': str(stream),
+                                                        'NODES_CACHE_ENABLED': 'False',
+                                                        'SQLITE_MMAP_SIZE': '0'})
+    try:
+        rss_before = peak_rss(process.pid)
+        result = fetch(base_url, f'/nodes/{root_id}')
+        result['peak_rss_mb'] = round(peak_rss(process.pid) / 2 ** 20, 1)
+        result['rss_before_mb'] = round(rss_before / 2 ** 20, 1)
+        return result
+    finally:
+        process.terminate()
+        process.join()
+
+
+def measure_legacy(engine, root_id: str) -> dict:
+    """Прежний путь: дерево словарей, jsonable_encoder и сериализация целиком"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    with Session(engine) as database:
+        item = database.get(Item, root_id)
+        response = {'id': item.id, 'url': item.url, 'type': item.type, 'parentId': item.parentId,
+                    'date': formatDate(item.updateDate), 'size': item.size, 'children': []}
+        legacy_check_folder_for_children(response['children'], root_id, database)
+        body = json.dumps(jsonable_encoder(response), ensure_ascii=False, separators=(',', ':')).encode()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'total_ms': round(elapsed * 1000, 1), 'bytes': len(body), 'peak_traced_mb': round(peak / 2 ** 20, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--skip-legacy', action='store_true', help='не замерять прежний путь')
+    args = parser.parse_args()
+
+    database_url = temp_database_url()
+    engine = init_engine(database_url)
+    create_db(engine)
+    root_id, items = generate_tree(args.size)
+    insert_items(engine, items)
+    del items
+
+    result = {'items': args.size,
+              'buffered': measure_server(database_url, root_id, stream=False),
+              'stream': measure_server(database_url, root_id, stream=True)}
+    if not args.skip_legacy:
+        result['legacy'] = measure_legacy(engine, root_id)
+    print(json.dumps(result))
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
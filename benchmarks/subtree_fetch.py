@@ -0,0 +1,92 @@
+"""
+Сравнивает получение поддерева для GET /nodes/{id}: прежний обход по одному
+запросу на папку и текущий путь encodeNode - единый запрос (диапазон по индексу материализованного пути)
+с выдачей ответа кусками. Для каждой формы и размера дерева
+выводит число запросов, время и пиковую память (tracemalloc).
+
+    python -m benchmarks.subtree_fetch --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.db.models import Item, init_engine
+from app.main import create_db
+from app.utils.streaming import encodeNode
+from benchmarks.common import temp_database_url, generate_shape, insert_items
+
+
+def legacy_check_folder_for_children(ans: list, item_id: str, database) -> list:
+    """Прежняя реализация: один запрос и гидратация Item на каждую папку"""
+    children = database.query(Item).filter(Item.parentId == item_id).all()
+    for i in range(len(children)):
+        ans.append({
+            'id': children[i].id,
+            'url': children[i].url,
+            'type': children[i].type,
+            'parentId': children[i].parentId,
+            'date': children[i].updateDate,
+            'size': children[i].size,
+            'children': None
+        })
+        if children[i].type == 'FOLDER':
+            ans[i]['children'] = []
+            legacy_check_folder_for_children(ans[i]['children'], children[i].id, database)
+    return ans
+
+
+def fetch_subtree(ans: list, item_id: str, database) -> list:
+    """Текущий путь GET /nodes/{id}: всё поддерево одним запросом по диапазону path, ответ кусками"""
+    ans.extend(encodeNode(database.get(Item, item_id), database))
+    return ans
+
+
+def measure(engine, fetch, root_id: str) -> dict:
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    with Session(engine) as database:
+        tracemalloc.start()
+        start = time.perf_counter()
+        fetch([], root_id, database)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    event.remove(engine, 'before_cursor_execute', count)
+    return {'queries': statements, 'seconds': round(elapsed, 4), 'peak_mb': round(peak / 2 ** 20, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--shapes', nargs='+', default=['wide', 'deep', 'balanced'])
+    parser.add_argument('--legacy-limit', type=int, default=100000,
+                        help='не запускать прежний обход на деревьях больше этого размера')
+    args = parser.parse_args()
+
+    results = []
+    for shape in args.shapes:
+        for size in args.sizes:
+            engine = init_engine(temp_database_url())
+            create_db(engine)
+            root_id, items = generate_shape(shape, size)
+            insert_items(engine, items)
+            del items
+            result = {'shape': shape, 'items': size, 'single_query': measure(engine, fetch_subtree, root_id)}
+            if size <= args.legacy_limit:
+                result['legacy'] = measure(engine, legacy_check_folder_for_children, root_id)
+            results.append(result)
+            print(json.dumps(result))
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
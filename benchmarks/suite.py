@@ -0,0 +1,246 @@
+"""
+Нагрузочный прогон всех ручек: POST /imports, GET /nodes/{id}, GET /updates,
+GET /children и DELETE /delete/{id} на синтетическом дереве. Запросы идут в
+процессе через TestClient или в локальный uvicorn (--server). Для каждого
+сценария выводятся пропускная способность, p50/p95/p99 и число SQL-запросов
+на запрос (по /metrics). Отчёт сохраняется в JSON, два отчёта можно сравнить.
+
+    python -m benchmarks.suite run --items 10000 --output before.json
+    python -m benchmarks.suite run --items 10000 --server --output after.json
+    python -m benchmarks.suite compare before.json after.json --threshold 10
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import temp_database_url, make_client, start_server, generate_synthetic_tree, \
+    percentiles
+
+DATE = '2022-02-01T12:00:00Z'
+SQL_STATEMENTS_METRIC = 'disk_http_request_sql_statements'
+
+
+class InProcessDriver:
+    """Запросы к приложению в этом же процессе"""
+
+    def __init__(self, database_url: str):
+        self.client = make_client(database_url)
+
+    def request(self, method: str, path: str, data: dict | None = None) -> int:
+        return self.client.request(method, path, json=data).status_code
+
+    def text(self, path: str) -> str:
+        return self.client.get(path).text
+
+    def close(self) -> None:
+        pass
+
+
+class ServerDriver:
+    """Запросы по HTTP к uvicorn в отдельном процессе"""
+
+    def __init__(self, database_url: str, async_mode: bool = False):
+        self.process, self.base_url = start_server(database_url, async_mode)
+
+    def request(self, method: str, path: str, data: dict | None = None) -> int:
+        body = json.dumps(data).encode() if data is not None else None
+        request = urllib.request.Request(f'{self.base_url}{path}', data=body, method=method,
+                                         headers={'Content-Type': 'application/json'} if body else {})
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def text(self, path: str) -> str:
+        with urllib.request.urlopen(f'{self.base_url}{path}') as response:
+            return response.read().decode()
+
+    def close(self) -> None:
+        self.process.terminate()
+        self.process.join()
+
+
+def sql_statements(metrics_text: str) -> dict[str, tuple[float, float]]:
+    """Сумма и число наблюдений гистограммы SQL-запросов по маршрутам из текста /metrics"""
+    result = {}
+    for line in metrics_text.splitlines():
+        for suffix, index in (('_sum', 0), ('_count', 1)):
+            prefix = SQL_STATEMENTS_METRIC + suffix + '{'
+            if line.startswith(prefix):
+                labels, value = line[len(prefix):].rsplit('} ', 1)
+                route = labels.split('route="', 1)[1].split('"', 1)[0]
+                method = labels.split('method="', 1)[1].split('"', 1)[0]
+                entry = result.setdefault(f'{method} {route}', [0.0, 0.0])
+                entry[index] += float(value)
+    return {key: tuple(value) for key, value in result.items()}
+
+
+def run_scenario(driver, name: str, route: str, requests: list[tuple], threads: int) -> dict:
+    """Выполняет запросы (method, path, data) в threads потоков и собирает задержки"""
+    before = sql_statements(driver.text('/metrics'))
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def send(request):
+        nonlocal errors
+        start = time.perf_counter()
+        status = driver.request(*request)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(send, requests))
+    elapsed = time.perf_counter() - start
+
+    after = sql_statements(driver.text('/metrics'))
+    total, count = after.get(route, (0, 0))
+    total_before, count_before = before.get(route, (0, 0))
+    observed = count - count_before
+    return {'scenario': name, 'requests': len(requests), 'errors': errors,
+            'throughput_rps': round(len(requests) / elapsed, 1), **percentiles(latencies),
+            'sql_per_request': round((total - total_before) / observed, 2) if observed else None}
+
+
+def folder_paths(items: list[dict]) -> list[str]:
+    """url для /children по цепочке папок от корня: home/a/b"""
+    parents = {item['id']: item['parentId'] for item in items}
+    paths = []
+    for item in items:
+        if item['type'] != 'FOLDER':
+            continue
+        chain, id = [], item['id']
+        while id:
+            chain.append(id)
+            id = parents[id]
+        paths.append('home/' + '/'.join(reversed(chain)))
+    return paths
+
+
+def run(args) -> dict:
+    # свой генератор, чтобы id новых файлов не совпали с id дерева из того же seed
+    rng = random.Random(f'suite-{args.seed}')
+    root_id, items = generate_synthetic_tree(args.items, args.fanout, args.depth, args.folder_ratio,
+                                             args.size_distribution, args.mean_size, args.seed)
+    folders = [item['id'] for item in items if item['type'] == 'FOLDER']
+    database_url = temp_database_url()
+    driver = ServerDriver(database_url, args.async_mode) if args.server else InProcessDriver(database_url)
+    try:
+        # первичная загрузка дерева тоже замеряется: пачки по batch элементов
+        batches = [('POST', '/imports', {'items': items[start:start + args.batch], 'updateDate': DATE})
+                   for start in range(0, len(items), args.batch)]
+        scenarios = [run_scenario(driver, 'imports_initial', 'POST /imports', batches, 1)]
+
+        new_files = [{'id': str(uuid.UUID(int=rng.getrandbits(128))), 'type': 'FILE',
+                      'parentId': rng.choice(folders), 'url': '/file/new', 'size': rng.randint(1, 8192)}
+                     for _ in range(args.requests * args.batch_updates)]
+        updates = [('POST', '/imports', {'items': new_files[start:start + args.batch_updates],
+                                         'updateDate': DATE})
+                   for start in range(0, len(new_files), args.batch_updates)]
+        scenarios.append(run_scenario(driver, 'imports_update', 'POST /imports', updates, args.threads))
+
+        nodes = [('GET', f'/nodes/{rng.choice(folders)}') for _ in range(args.requests)]
+        scenarios.append(run_scenario(driver, 'nodes_folder', 'GET /nodes/{id}', nodes, args.threads))
+        root = [('GET', f'/nodes/{root_id}') for _ in range(args.root_requests)]
+        scenarios.append(run_scenario(driver, 'nodes_root', 'GET /nodes/{id}', root, args.threads))
+
+        recent = [('GET', f'/updates?date={DATE}&limit=100') for _ in range(args.requests)]
+        scenarios.append(run_scenario(driver, 'updates', 'GET /updates', recent, args.threads))
+
+        paths = folder_paths(items)
+        children = [('GET', f'/children?url={rng.choice(paths)}') for _ in range(args.requests)]
+        scenarios.append(run_scenario(driver, 'children', 'GET /children', children, args.threads))
+
+        deletes = [('DELETE', f'/delete/{item["id"]}?date={DATE}') for item in new_files[:args.requests]]
+        scenarios.append(run_scenario(driver, 'delete', 'DELETE /delete/{id}', deletes, args.threads))
+    finally:
+        driver.close()
+
+    return {'config': {key: value for key, value in vars(args).items() if key not in ('command', 'output')},
+            'mode': ('async ' if args.async_mode else '') + ('server' if args.server else 'in-process'),
+            'scenarios': {scenario.pop('scenario'): scenario for scenario in scenarios}}
+
+
+def compare(before: dict, after: dict, threshold: float) -> list[dict]:
+    """
+    Сравнивает два отчёта по сценариям. Регрессия - рост задержек или SQL-запросов на запрос
+    либо падение пропускной способности больше чем на threshold процентов.
+    """
+    rows = []
+    for name, old in before['scenarios'].items():
+        new = after['scenarios'].get(name)
+        if new is None:
+            continue
+        row = {'scenario': name}
+        regressions = []
+        for key, higher_is_worse in (('p50_ms', True), ('p95_ms', True), ('p99_ms', True),
+                                     ('throughput_rps', False), ('sql_per_request', True)):
+            if old.get(key) is None or new.get(key) is None:
+                continue
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            row[key] = {'before': old[key], 'after': new[key], 'change_pct': round(change, 1)}
+            if (change > threshold) if higher_is_worse else (change < -threshold):
+                regressions.append(key)
+        row['regressions'] = regressions
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='прогнать сценарии и вывести отчёт')
+    run_parser.add_argument('--items', type=int, default=10000)
+    run_parser.add_argument('--fanout', type=int, default=10)
+    run_parser.add_argument('--depth', type=int, default=8)
+    run_parser.add_argument('--folder-ratio', type=float, default=0.3)
+    run_parser.add_argument('--size-distribution', choices=['fixed', 'uniform', 'lognormal'], default='lognormal')
+    run_parser.add_argument('--mean-size', type=int, default=4096)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--batch', type=int, default=1000, help='элементов в пачке первичной загрузки')
+    run_parser.add_argument('--batch-updates', type=int, default=10, help='файлов в пачке обновления')
+    run_parser.add_argument('--requests', type=int, default=500, help='запросов в сценарии')
+    run_parser.add_argument('--root-requests', type=int, default=20, help='запросов всего дерева')
+    run_parser.add_argument('--threads', type=int, default=1)
+    run_parser.add_argument('--server', action='store_true', help='запросы к uvicorn вместо TestClient')
+    run_parser.add_argument('--async-mode', action='store_true', help='сервер в асинхронном режиме')
+    run_parser.add_argument('--output', help='файл для отчёта JSON')
+
+    compare_parser = commands.add_parser('compare', help='сравнить два отчёта')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type=float, default=10, help='допустимое ухудшение, %%')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        report = run(args)
+        if args.output:
+            with open(args.output, 'w') as output:
+                json.dump(report, output, indent=2)
+        print(json.dumps(report))
+        return
+
+    with open(args.before) as before, open(args.after) as after:
+        rows = compare(json.load(before), json.load(after), args.threshold)
+    for row in rows:
+        print(json.dumps(row))
+    # ненулевой код выхода, чтобы регрессию было видно в проверках
+    if any(row['regressions'] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
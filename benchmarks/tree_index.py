@@ -0,0 +1,86 @@
+"""
+Индекс дерева в памяти (TREE_INDEX_ENABLED): объём на элемент, время прогрева из SQLite
+и скорость чтения. Память индекса считается по tracemalloc отдельной загрузкой, время
+прогрева - загрузкой без трассировки. Размер папки и обход поддерева из индекса
+сравниваются с теми же чтениями из базы.
+
+    python -m benchmarks.tree_index --size 1000000
+"""
+import argparse
+import gc
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy.orm import Session
+
+from app.db.models import Item, init_engine
+from app.main import create_db
+from app.utils.streaming import encodeNode
+from app.utils.tree_index import buildTreeIndex
+from benchmarks.common import temp_database_url, generate_synthetic_tree, insert_items
+
+
+def measure(function, arguments: list) -> dict:
+    """Задержки function по каждому аргументу, в микросекундах"""
+    latencies = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        latencies.append(time.perf_counter() - start)
+    points = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {'count': len(latencies), 'p50_us': round(points[49] * 1e6, 1),
+            'p95_us': round(points[94] * 1e6, 1), 'p99_us': round(points[98] * 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--fanout', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    database_url = temp_database_url()
+    engine = init_engine(database_url)
+    create_db(engine)
+    _, items = generate_synthetic_tree(args.size, fanout=args.fanout, seed=args.seed)
+    insert_items(engine, items)
+    folders = [item['id'] for item in items if item['type'] == 'FOLDER']
+    del items
+    rng = random.Random(args.seed)
+    sample = [rng.choice(folders) for _ in range(args.requests)]
+
+    with Session(engine) as database:
+        gc.collect()
+        tracemalloc.start()
+        index = buildTreeIndex(database)
+        traced, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del index
+        gc.collect()
+
+        start = time.perf_counter()
+        index = buildTreeIndex(database)
+        warm_up = time.perf_counter() - start
+
+        result = {'items': len(index), 'bytes_per_node': round(traced / len(index), 1),
+                  'index_mb': round(traced / 2 ** 20, 1), 'warm_up_s': round(warm_up, 2)}
+        result['folder_size_index'] = measure(lambda id: index.sizes[index.slots[id]], sample)
+        result['folder_size_database'] = measure(lambda id: database.get(Item, id).size, sample)
+        database.expunge_all()
+        result['subtree_index'] = measure(lambda id: b''.join(index.encodeNode(id)), sample)
+        result['subtree_database'] = measure(lambda id: b''.join(encodeNode(database.get(Item, id), database)),
+                                             sample)
+        start = time.perf_counter()
+        walked = sum(1 for _ in index.walk())
+        result['walk_all_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        assert walked == len(index)
+    print(json.dumps(result))
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
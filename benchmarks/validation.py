@@ -0,0 +1,105 @@
+"""
+Замеряет этап валидации POST /imports отдельно от записи: validateItems и
+validateNoCycles на готовых ItemForm и словаре existing (как после
+loadItemsWithAncestors), в сравнении с прежней validateItems (поиск по списку
+папок пачки), а также проверку даты заранее скомпилированным выражением ISO8601 и
+выражением, которое компилируется при каждом вызове.
+
+    python -m benchmarks.validation --sizes 1000 10000
+"""
+import argparse
+import json
+import re
+import time
+
+from app.forms import ItemForm
+from app.utils.exceptions import ValidateExeption
+from app.utils.dates import ISO8601
+from app.validations import validateItems, validateNoCycles, checkFile, checkFolder
+from benchmarks.common import generate_tree
+
+DATE = '2022-02-01T12:00:00.000Z'
+
+
+def legacy_validate_items(items: list[ItemForm], existing: dict[str, dict]) -> bool:
+    """Прежняя реализация: папки пачки ищутся в списке, тип родителя и смена типа не проверяются"""
+    if len({item.id for item in items}) != len(items):
+        raise ValidateExeption("Invalid item")
+    importFolders = [item.id for item in items if item.type == 'FOLDER']
+    for item in items:
+        if item.id:
+            parent = existing.get(item.parentId)
+            if not item.parentId or item.parentId == "0" or parent or (item.parentId in importFolders):
+                if item.type == 'FILE' and checkFile(item) is None:
+                    continue
+                elif item.type == 'FOLDER' and checkFolder(item) is None:
+                    continue
+            raise ValidateExeption("Invalid item")
+        raise ValidateExeption("Invalid item")
+    return True
+
+
+def validate_date(s: str) -> bool:
+    """Проверка даты заранее скомпилированным выражением, как в parseDate"""
+    if ISO8601.match(s) is not None:
+        return True
+    raise ValidateExeption("Invalid date")
+
+
+def legacy_validate_date(s: str) -> bool:
+    """Прежняя реализация: выражение компилируется при каждом вызове"""
+    regular = r'^(-?(?:[1-9][0-9]*)?[0-9]{4})-(1[0-2]|0[1-9])-(3[01]|0[1-9]|[12][0-9])' \
+              r'T(2[0-3]|[01][0-9]):([0-5][0-9]):([0-5][0-9])(\.[0-9]+)?(Z|[+-](?:2[0-3]|' \
+              r'[01][0-9]):[0-5][0-9])?$'
+    if re.compile(regular).match(s) is not None:
+        return True
+    raise ValidateExeption("Invalid date")
+
+
+def best_of(function, repeat: int) -> float:
+    """Лучшее время вызова в секундах"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--legacy-limit', type=int, default=10000,
+                        help='не запускать прежнюю валидацию на пачках больше этого размера')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        root_id, raw = generate_tree(size)
+        items = [ItemForm(**item) for item in raw]
+        # половина пачки уже есть в базе: обновление существующих элементов
+        existing = {item.id: {'parentId': item.parentId, 'type': item.type, 'size': item.size or 0, 'path': None}
+                    for item in items[:size // 2]}
+
+        def validate():
+            validateItems(items, existing)
+            validateNoCycles(items, existing)
+
+        batch = best_of(validate, args.repeat)
+        result = {'items': size,
+                  'batch_ms': round(batch * 1000, 3),
+                  'per_1k_items_ms': round(batch * 1000 * 1000 / size, 3)}
+        if size <= args.legacy_limit:
+            legacy = best_of(lambda: legacy_validate_items(items, existing), args.repeat)
+            result['legacy_ms'] = round(legacy * 1000, 3)
+        print(json.dumps(result))
+
+    calls = 10000
+    result = {'validate_date_us': round(best_of(lambda: [validate_date(DATE) for _ in range(calls)], 5) / calls * 1e6, 3),
+              'legacy_validate_date_us': round(best_of(lambda: [legacy_validate_date(DATE) for _ in range(calls)], 5)
+                                               / calls * 1e6, 3)}
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
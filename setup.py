@@ -10,7 +10,12 @@ setup(
         'fastapi==0.83.0',
         'requests==2.28.1',
         'SQLAlchemy==1.4.41',
-        'uvicorn==0.18.3'
+        'uvicorn==0.18.3',
+        'aiosqlite==0.17.0',
+        'orjson==3.8.3'
     ],
+    extras_require={
+        'postgresql': ['psycopg2-binary==2.9.5', 'asyncpg==0.27.0']
+    },
     scripts=['app/main.py']
 )
\ No newline at end of file
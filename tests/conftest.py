@@ -0,0 +1,41 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import get_application
+
+# unit_test.py - сценарий для запущенного сервера (python tests/unit_test.py), pytest его не собирает
+collect_ignore = ['unit_test.py']
+
+
+def generate_tree(count: int, fanout: int = 10, file_size: int = 128) -> tuple[str, list[dict]]:
+    """
+    Сбалансированное дерево из count элементов в формате ImportForm.items: каждый второй
+    ребёнок - папка. Возвращает id корня и элементы в порядке родитель-раньше-ребёнка.
+    """
+    root_id = str(uuid.uuid4())
+    items = [{'id': root_id, 'type': 'FOLDER', 'parentId': None}]
+    folders = [root_id]
+    while len(items) < count:
+        parent_id = folders[(len(items) - 1) // fanout]
+        item_id = str(uuid.uuid4())
+        if len(items) % 2:
+            items.append({'id': item_id, 'type': 'FOLDER', 'parentId': parent_id})
+            folders.append(item_id)
+        else:
+            items.append({'id': item_id, 'type': 'FILE', 'parentId': parent_id, 'url': '/file', 'size': file_size})
+    return root_id, items
+
+
+def import_items(client: TestClient, items: list[dict], date: str = '2022-02-01T12:00:00Z',
+                 batch_size: int = 1000) -> None:
+    """Импортирует элементы пачками через POST /imports, каждая пачка должна быть принята"""
+    for start in range(0, len(items), batch_size):
+        response = client.post('/imports', json={'items': items[start:start + batch_size], 'updateDate': date})
+        assert response.status_code == 200, response.text
+
+
+@pytest.fixture
+def client(tmp_path):
+    return TestClient(get_application(f'sqlite:///{tmp_path / "test.db"}'))
@@ -0,0 +1,78 @@
+import pytest
+
+from app.utils.cache import CacheBackend, LRUCache, nodesCache
+from conftest import import_items
+
+TREE = [
+    {'id': 'root', 'type': 'FOLDER', 'parentId': None},
+    {'id': 'a', 'type': 'FOLDER', 'parentId': 'root'},
+    {'id': 'b', 'type': 'FOLDER', 'parentId': 'root'},
+    {'id': 'file', 'type': 'FILE', 'parentId': 'a', 'url': '/file', 'size': 10},
+]
+
+
+def test_lru_eviction():
+    cache = LRUCache(maxItems=2, maxBytes=10)
+    cache.set('x', b'12345', cache.version())
+    cache.set('y', b'123', cache.version())
+    cache.get('x')
+    cache.set('z', b'123', cache.version())
+    assert cache.get('y') is None
+    assert cache.get('x') == b'12345'
+    cache.set('big', b'12345678901', cache.version())
+    assert cache.get('big') is None
+    cache.set('w', b'123456', cache.version())
+    assert cache.stats()['bytes'] <= 10
+    assert cache.stats()['evictions'] == 3
+
+
+
+def test_incomplete_backend_is_rejected():
+    class GetOnly(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
+
+def test_stale_version_is_not_stored():
+    cache = LRUCache(maxItems=10, maxBytes=100)
+    version = cache.version()
+    cache.delete(['x'])
+    cache.set('x', b'old', version)
+    assert cache.get('x') is None
+
+
+def test_import_evicts_changed_nodes_and_ancestors(client):
+    import_items(client, TREE)
+    for id in ('root', 'a', 'b', 'file'):
+        client.get(f'/nodes/{id}')
+
+    import_items(client, [{'id': 'file', 'type': 'FILE', 'parentId': 'a', 'url': '/file', 'size': 20}],
+                 date='2022-02-02T12:00:00Z')
+    assert nodesCache.get('b') is not None
+    assert all(nodesCache.get(id) is None for id in ('root', 'a', 'file'))
+    assert client.get('/nodes/root').json()['size'] == 20
+
+
+def test_delete_evicts_subtree_and_ancestors(client):
+    import_items(client, TREE)
+    for id in ('root', 'a', 'b', 'file'):
+        client.get(f'/nodes/{id}')
+
+    client.delete('/delete/a', params={'date': '2022-02-02T12:00:00Z'})
+    assert client.get('/nodes/file').status_code == 404
+    assert client.get('/nodes/root').json()['size'] == 0
+    assert nodesCache.get('b') is not None
+    assert client.get('/cache/stats').json()['nodes']['hits'] >= 1
+
+
+def test_path_cache_is_invalidated_by_moves(client):
+    import_items(client, TREE + [{'id': 'c', 'type': 'FOLDER', 'parentId': 'a'}])
+    assert client.get('/children', params={'url': 'home/root/a/c'}).status_code == 200
+    assert client.get('/children', params={'url': 'home/root/a/c'}).status_code == 200
+    assert client.get('/cache/stats').json()['paths']['hits'] == 1
+
+    import_items(client, [{'id': 'c', 'type': 'FOLDER', 'parentId': 'b'}], date='2022-02-02T12:00:00Z')
+    assert client.get('/children', params={'url': 'home/root/a/c'}).status_code == 400
+    assert client.get('/children', params={'url': 'home/root/b/c'}).status_code == 200
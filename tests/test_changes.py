@@ -0,0 +1,106 @@
+import asyncio
+import json
+import threading
+import time
+
+from app.utils import changes
+from app.utils.dates import formatDate, parseDate
+from conftest import generate_tree, import_items
+
+
+def replay(state: dict, entries: list[dict]) -> None:
+    """Применяет записи журнала к копии дерева клиента: id -> поля элемента"""
+    for entry in entries:
+        if entry['kind'] == 'DELETE':
+            removed = {entry['id']}
+            while True:
+                children = {id for id, item in state.items() if item['parentId'] in removed} - removed
+                if not children:
+                    break
+                removed |= children
+            for id in removed:
+                del state[id]
+        else:
+            state[entry['id']] = {key: entry[key] for key in ('parentId', 'url', 'size', 'type', 'date')}
+
+
+def exported(client) -> dict:
+    lines = [json.loads(line) for line in client.get('/export').content.splitlines()]
+    return {line['id']: {'parentId': line['parentId'], 'url': line['url'], 'size': line['size'],
+                         'type': line['type'], 'date': formatDate(parseDate(line['date']))}
+            for line in lines}
+
+
+def pull(client, since: int, limit: int = 7) -> tuple[list[dict], int]:
+    entries = []
+    while True:
+        page = client.get('/changes', params={'since': since, 'limit': limit}).json()
+        entries += page['items']
+        since = page['lastSeq']
+        if not page['hasMore']:
+            return entries, since
+
+
+def test_replaying_changes_reproduces_tree(client):
+    root_id, items = generate_tree(100, fanout=3)
+    import_items(client, items[:50], date='2022-02-01T12:00:00Z')
+    response = client.get('/export')
+    state, since = exported(client), int(response.headers['X-Changes-Seq'])
+
+    folders = [item for item in items[:50] if item['type'] == 'FOLDER']
+    import_items(client, items[50:], date='2022-02-02T12:00:00Z')
+    import_items(client, [dict(folders[-1], parentId=root_id)], date='2022-02-03T12:00:00Z')
+    assert client.delete(f'/delete/{folders[2]["id"]}?date=2022-02-04T12:00:00Z').status_code == 200
+
+    entries, since = pull(client, since)
+    assert [entry['seq'] for entry in entries] == sorted({entry['seq'] for entry in entries})
+    # удаление - одна запись, даты предков - записи UPDATE той же датой
+    deletes = [entry for entry in entries if entry['kind'] == 'DELETE']
+    assert [entry['id'] for entry in deletes] == [folders[2]['id']]
+    assert entries[-1]['id'] == root_id and entries[-1]['date'] == '2022-02-04T12:00:00Z'
+    replay(state, entries)
+    assert state == exported(client)
+    assert client.get('/changes', params={'since': since}).json() == {'items': [], 'lastSeq': since,
+                                                                      'hasMore': False}
+
+
+def test_compaction_and_restore(client, monkeypatch):
+    monkeypatch.setattr(changes, 'CHANGES_MAX_ENTRIES', 5)
+    import_items(client, [{'id': 'root', 'type': 'FOLDER', 'parentId': None}])
+    for number in range(5):
+        import_items(client, [{'id': f'file{number}', 'type': 'FILE', 'parentId': 'root', 'url': '/f', 'size': 1}],
+                     date=f'2022-02-0{number + 1}T12:00:00Z')
+    page = client.get('/changes', params={'since': 6}).json()
+    assert len(page['items']) == 5 and page['lastSeq'] == 11
+    assert client.get('/changes', params={'since': 5}).status_code == 410
+    assert client.get('/changes', params={'since': -1}).status_code == 400
+
+    snapshot = client.get('/export').content
+    assert client.post('/restore?replace=true', data=snapshot).status_code == 200
+    assert [entry['kind'] for entry in client.get('/changes', params={'since': 11}).json()['items']] == ['RESET']
+    assert client.get('/changes', params={'since': 10}).status_code == 410
+
+
+def test_long_poll_returns_on_write(client):
+    timer = threading.Timer(0.3, import_items, [client, [{'id': 'root', 'type': 'FOLDER', 'parentId': None}]])
+    timer.start()
+    start = time.monotonic()
+    page = client.get('/changes', params={'since': 0, 'wait': 10}).json()
+    timer.join()
+    assert [entry['id'] for entry in page['items']] == ['root']
+    assert time.monotonic() - start < 5
+    # без записей долгий опрос заканчивается по времени
+    assert client.get('/changes', params={'since': page['lastSeq'], 'wait': 0.2}).json()['items'] == []
+
+
+def test_wait_wakes_on_notify_from_other_thread(monkeypatch):
+    monkeypatch.setattr(changes, 'CHANGES_POLL_INTERVAL', 10)
+
+    async def wait() -> float:
+        start = time.monotonic()
+        threading.Timer(0.1, changes.notifyChanges).start()
+        await changes.waitForChanges(changes.changesVersion, start + 10)
+        return time.monotonic() - start
+
+    assert asyncio.run(wait()) < 1
+    assert not changes.waiters
@@ -0,0 +1,124 @@
+import asyncio
+import random
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.db.consistency import findSizeDrift, findStatsDrift, findPathDrift
+from app.db.models import SessionLocal, AsyncSessionLocal
+from app.main import get_application
+from app.forms import ItemForm
+from app.utils.dates import parseDate
+from app.utils.exceptions import PreconditionExeption
+from app.utils.import_queue import ImportRequest, processRequests
+from app.utils import writes
+from app.utils.writes import runWrite
+
+FOLDERS = [f'folder{number}' for number in range(4)]
+
+
+def writer(client, number: int, files: dict, errors: list) -> None:
+    """Импорты, переносы и удаления своих файлов; files - ожидаемое итоговое состояние писателя"""
+    rng = random.Random(number)
+    for step in range(20):
+        date = f'2022-02-01T12:{number:02d}:{step:02d}Z'
+        if files and rng.random() < 0.2:
+            id = rng.choice(sorted(files))
+            response = client.delete(f'/delete/{id}?date={date}')
+            del files[id]
+        else:
+            if files and rng.random() < 0.4:
+                id = rng.choice(sorted(files))
+            else:
+                id = f'file{number}-{step}'
+            files[id] = (rng.choice(FOLDERS), rng.randint(1, 1000))
+            response = client.post('/imports', json={'updateDate': date, 'items': [
+                {'id': id, 'type': 'FILE', 'parentId': files[id][0], 'url': f'/{id}', 'size': files[id][1]}]})
+        if response.status_code != 200:
+            errors.append(response.text)
+
+
+def test_parallel_writers_keep_aggregates(client):
+    assert client.post('/imports', json={'updateDate': '2022-02-01T00:00:00Z', 'items': [
+        {'id': 'root', 'type': 'FOLDER', 'parentId': None},
+        *({'id': id, 'type': 'FOLDER', 'parentId': 'root'} for id in FOLDERS)]}).status_code == 200
+    files = [{} for _ in range(8)]
+    errors = []
+    threads = [threading.Thread(target=writer, args=(client, number, files[number], errors))
+               for number in range(len(files))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+    expected = {id: value for own in files for id, value in own.items()}
+    root = client.get('/node/root/stats').json()
+    assert root['size'] == sum(size for _, size in expected.values())
+    assert root['fileCount'] == len(expected)
+    for folder in FOLDERS:
+        node = client.get(f'/nodes/{folder}').json()
+        assert sorted((child['id'], child['size']) for child in node['children']) == \
+            sorted((id, size) for id, (parent, size) in expected.items() if parent == folder)
+    with SessionLocal() as database:
+        assert findSizeDrift(database) == [] and findStatsDrift(database) == [] and findPathDrift(database) == []
+
+
+def test_if_match_precondition(client):
+    def put(item: dict, date: str, ifMatch: str | None = None) -> int:
+        headers = {'If-Match': ifMatch} if ifMatch is not None else {}
+        return client.post('/imports', json={'items': [item], 'updateDate': date}, headers=headers).status_code
+
+    folder = {'id': 'root', 'type': 'FOLDER', 'parentId': None}
+    file = {'id': 'file', 'type': 'FILE', 'parentId': 'root', 'url': '/file', 'size': 1}
+    assert put(folder, '2022-02-01T12:00:00Z') == put(file, '2022-02-01T12:00:00Z') == 200
+    seq = client.get('/changes').json()['lastSeq']
+
+    assert put(dict(file, size=2), '2022-02-02T12:00:00Z', f'"{seq}"') == 200
+    # второй писатель с той же версией не перезаписывает первого
+    assert put(dict(file, size=3), '2022-02-03T12:00:00Z', f'"{seq}"') == 412
+    assert client.get('/nodes/file').json()['size'] == 2
+    assert put({'id': 'other', 'type': 'FOLDER', 'parentId': None}, '2022-02-03T12:00:00Z', f'"{seq}"') == 200
+    assert put(file, '2022-02-03T12:00:00Z', 'abc') == 400
+
+    # в очереди импортов пачки одной транзакции видят друг друга
+    seq = client.get('/changes', params={'since': seq}).json()['lastSeq']
+    requests = [ImportRequest([ItemForm(**dict(file, size=size))], parseDate('2022-02-04T12:00:00Z'), seq)
+                for size in (4, 5)]
+    processRequests(requests)
+    assert requests[0].future.result() is None
+    with pytest.raises(PreconditionExeption):
+        requests[1].future.result()
+    assert client.get('/nodes/file').json()['size'] == 4
+
+
+def test_retry_pause_does_not_block_event_loop(tmp_path, monkeypatch):
+    get_application(f'sqlite:///{tmp_path / "test.db"}', async_mode=True)
+    monkeypatch.setattr(writes, 'retryDelay', lambda attempt: 0.2)
+    attempts = []
+
+    def write(database):
+        attempts.append(attempt := len(attempts))
+        if attempt == 0:
+            raise OperationalError('BEGIN IMMEDIATE', {}, sqlite3.OperationalError('database is locked'))
+
+    async def main() -> int:
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while len(attempts) < 2:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        async with AsyncSessionLocal() as session:
+            ticker = asyncio.create_task(tick())
+            await session.run_sync(runWrite, write)
+            await ticker
+        return ticks
+
+    # пока запись ждёт повтора, цикл событий обслуживает другие задачи
+    assert asyncio.run(main()) > 5
+    assert attempts == [0, 1]
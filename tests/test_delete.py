@@ -0,0 +1,88 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db.models import Item, ItemHistory, SessionLocal
+from app.main import get_application
+from app.utils.dates import parseDate
+from app.utils.utils import saveHistory
+from conftest import generate_tree, import_items
+
+ROOT_ID, ITEMS = generate_tree(300, fanout=4)
+DELETE_DATE = '2022-02-03T12:00:00Z'
+
+
+def build_database(path) -> TestClient:
+    client = TestClient(get_application(f'sqlite:///{path}'))
+    import_items(client, ITEMS, date='2022-02-01T12:00:00Z')
+    # вторая версия части файлов, чтобы у элементов была история
+    import_items(client, [dict(item, size=256) for item in ITEMS[::7] if item['type'] == 'FILE'],
+                 date='2022-02-02T12:00:00Z')
+    return client
+
+
+def recursive_delete(item_id: str, date, database) -> None:
+    """Удаление обходом: поддерево по одному элементу, предки по одному с вычетом размера"""
+    item = database.query(Item).filter(Item.id == item_id).one()
+    deleted, folders = [item_id], [item_id] if item.type == 'FOLDER' else []
+    while folders:
+        for child in database.query(Item.id, Item.type).filter(Item.parentId == folders.pop()).all():
+            deleted.append(child.id)
+            if child.type == 'FOLDER':
+                folders.append(child.id)
+    parents, parentId = [], item.parentId
+    while parentId:
+        parent = database.query(Item).filter(Item.id == parentId).one()
+        parent.updateDate, parent.size = date, parent.size - (item.size or 0)
+        parents.append(parent.id)
+        parentId = parent.parentId
+    for deletedId in deleted:
+        database.query(Item).filter(Item.id == deletedId).delete()
+        database.query(ItemHistory).filter(ItemHistory.itemId == deletedId).delete()
+    saveHistory(parents, date, database)
+
+
+def dump_database() -> tuple[list, list]:
+    with SessionLocal() as database:
+        items = database.query(Item.id, Item.parentId, Item.url, Item.size, Item.type, Item.updateDate) \
+            .order_by(Item.id).all()
+        history = database.query(ItemHistory.itemId, ItemHistory.parentId, ItemHistory.size, ItemHistory.date) \
+            .order_by(ItemHistory.itemId, ItemHistory.date).all()
+    return items, history
+
+
+@pytest.mark.parametrize('target', [
+    ROOT_ID,
+    next(item['id'] for item in ITEMS if item['parentId'] == ROOT_ID and item['type'] == 'FOLDER'),
+    next(item['id'] for item in reversed(ITEMS) if item['type'] == 'FILE'),
+])
+def test_delete_matches_recursive_implementation(tmp_path, target):
+    build_database(tmp_path / 'recursive.db')
+    with SessionLocal() as database:
+        recursive_delete(target, parseDate(DELETE_DATE), database)
+        database.commit()
+    expected = dump_database()
+
+    client = build_database(tmp_path / 'new.db')
+    assert client.delete(f'/delete/{target}', params={'date': DELETE_DATE}).status_code == 200
+    assert dump_database() == expected
+
+
+def test_delete_updates_ancestors(client):
+    import_items(client, [
+        {'id': 'root', 'type': 'FOLDER', 'parentId': None},
+        {'id': 'folder', 'type': 'FOLDER', 'parentId': 'root'},
+        {'id': 'file', 'type': 'FILE', 'parentId': 'folder', 'url': '/file', 'size': 10},
+        {'id': 'other', 'type': 'FILE', 'parentId': 'root', 'url': '/other', 'size': 5},
+    ])
+    assert client.delete('/delete/folder', params={'date': DELETE_DATE}).status_code == 200
+
+    root = client.get('/nodes/root').json()
+    assert root['size'] == 5
+    assert root['date'] == DELETE_DATE
+    assert [child['id'] for child in root['children']] == ['other']
+    assert client.get('/nodes/file').status_code == 404
+    assert client.get('/node/file/history').status_code == 404
+
+
+def test_delete_missing_item(client):
+    assert client.delete('/delete/missing', params={'date': DELETE_DATE}).status_code == 404
@@ -0,0 +1,22 @@
+from sqlalchemy import event, text
+
+from app.config import SQLITE_BUSY_TIMEOUT
+from app.db import models
+
+
+def test_requests_share_pooled_engine(client):
+    engine = models.engine
+    connects = []
+    event.listen(engine, 'connect', lambda *args: connects.append(1))
+    for _ in range(20):
+        assert client.get('/nodes/missing').status_code == 404
+    # запросы берут соединение из общего пула и всегда его возвращают
+    assert models.engine is engine
+    assert engine.pool.checkedout() == 0
+    assert len(connects) <= 1
+
+
+def test_sqlite_connections_are_tuned(client):
+    with models.engine.connect() as connection:
+        assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert connection.execute(text('PRAGMA busy_timeout')).scalar() == SQLITE_BUSY_TIMEOUT
@@ -0,0 +1,80 @@
+import random
+
+from app.db.consistency import findStatsDrift
+from app.db.models import SessionLocal
+from conftest import generate_tree, import_items
+
+
+def assert_no_drift():
+    with SessionLocal() as database:
+        assert findStatsDrift(database) == []
+
+
+def test_stats_endpoint(client):
+    import_items(client, [
+        {'id': 'root', 'type': 'FOLDER', 'parentId': None},
+        {'id': 'folder', 'type': 'FOLDER', 'parentId': 'root'},
+        {'id': 'empty', 'type': 'FOLDER', 'parentId': 'folder'},
+        {'id': 'file', 'type': 'FILE', 'parentId': 'folder', 'url': '/file', 'size': 10},
+    ], date='2022-02-01T12:00:00Z')
+    import_items(client, [{'id': 'other', 'type': 'FILE', 'parentId': 'root', 'url': '/other', 'size': 5}],
+                 date='2022-02-02T12:00:00Z')
+    assert client.get('/node/root/stats').json() == {
+        'id': 'root', 'size': 15, 'fileCount': 2, 'folderCount': 2, 'maxDepth': 2,
+        'newestUpdate': '2022-02-02T12:00:00Z'}
+    assert client.get('/node/empty/stats').json()['newestUpdate'] is None
+    assert client.get('/node/file/stats').status_code == 400
+    assert client.get('/node/missing/stats').status_code == 404
+
+    # файл, давший последнюю дату и глубину, удаляется: максимумы пересчитываются
+    assert client.delete('/delete/folder?date=2022-02-03T12:00:00Z').status_code == 200
+    assert client.get('/node/root/stats').json() == {
+        'id': 'root', 'size': 5, 'fileCount': 1, 'folderCount': 0, 'maxDepth': 1,
+        'newestUpdate': '2022-02-02T12:00:00Z'}
+
+    response = client.post('/nodes/stats/batch', json={'ids': ['root', 'other', 'folder', 'root']})
+    items = response.json()['items']
+    assert [item['id'] for item in items] == ['root', 'other', 'folder', 'root']
+    assert items[0] == items[3] and items[0]['fileCount'] == 1
+    assert items[1]['error'] == "Item is not a folder" and items[2]['error'] == "Item not found"
+
+
+def test_stats_follow_moves_and_deletes(client):
+    root_id, items = generate_tree(200, fanout=3)
+    import_items(client, items, date='2022-02-01T12:00:00Z')
+    assert_no_drift()
+
+    folders = [item for item in items if item['type'] == 'FOLDER']
+    files = [item for item in items if item['type'] == 'FILE']
+    rng = random.Random(0)
+    for step in range(30):
+        date = f'2022-02-{rng.randint(1, 28):02d}T12:00:00Z'
+        batch = []
+        for file in rng.sample(files, 3):
+            # переносы и повторный импорт, в том числе с более старой датой
+            batch.append(dict(file, parentId=rng.choice(folders)['id'], size=rng.randint(1, 100)))
+        folder = rng.choice(folders[1:])
+        target = rng.choice(folders)['id']
+        if not is_descendant(client, target, folder['id']):
+            batch.append(dict(folder, parentId=target))
+        import_items(client, batch, date=date)
+        assert_no_drift()
+        if step % 5 == 4:
+            victim = rng.choice(files)
+            if client.delete(f'/delete/{victim["id"]}?date={date}').status_code == 200:
+                assert_no_drift()
+
+    victim = folders[1]['id']
+    assert client.delete(f'/delete/{victim}?date=2022-03-01T12:00:00Z').status_code == 200
+    assert_no_drift()
+
+
+def is_descendant(client, itemId: str, folderId: str) -> bool:
+    """Лежит ли itemId в поддереве folderId"""
+    stack = [client.get(f'/nodes/{folderId}').json()]
+    while stack:
+        node = stack.pop()
+        if node['id'] == itemId:
+            return True
+        stack.extend(node['children'] or [])
+    return False
@@ -0,0 +1,56 @@
+from app.utils import utils
+
+
+def put(client, items: list[dict], day: int) -> None:
+    response = client.post('/imports', json={'items': items, 'updateDate': f'2022-02-{day:02d}T12:00:00Z'})
+    assert response.status_code == 200
+
+
+def file(size: int) -> dict:
+    return {'id': 'file', 'type': 'FILE', 'parentId': 'folder', 'url': '/file', 'size': size}
+
+
+def history(client, id: str, **params) -> list[tuple[str, int]]:
+    response = client.get(f'/node/{id}/history', params=params)
+    assert response.status_code == 200
+    return [(item['date'], item['size']) for item in response.json()['items']]
+
+
+def day(number: int) -> str:
+    return f'2022-02-{number:02d}T12:00:00Z'
+
+
+def test_history_ranges(client):
+    put(client, [{'id': 'folder', 'type': 'FOLDER', 'parentId': None}], 1)
+    for number in range(1, 5):
+        put(client, [file(number * 10)], number)
+    # версия с той же датой заменяет прежнюю
+    put(client, [file(45)], 4)
+
+    assert history(client, 'file') == [(day(1), 10), (day(2), 20), (day(3), 30), (day(4), 45)]
+    # размеры папки в истории - суммы на момент каждой версии
+    assert history(client, 'folder') == [(day(1), 10), (day(2), 20), (day(3), 30), (day(4), 45)]
+    # [dateStart, dateEnd): начало включается, конец нет
+    assert history(client, 'file', dateStart=day(2), dateEnd=day(4)) == [(day(2), 20), (day(3), 30)]
+    assert history(client, 'file', dateStart=day(4)) == [(day(4), 45)]
+    assert history(client, 'file', dateEnd=day(1)) == []
+    assert history(client, 'file', dateStart=day(3), dateEnd=day(3)) == []
+
+
+def test_history_errors(client):
+    put(client, [{'id': 'folder', 'type': 'FOLDER', 'parentId': None}, file(10)], 1)
+    assert client.get('/node/file/history', params={'dateStart': day(3), 'dateEnd': day(2)}).status_code == 400
+    assert client.get('/node/file/history', params={'dateStart': 'monday'}).status_code == 400
+    assert client.get('/node/missing/history').status_code == 404
+    assert client.delete(f'/delete/folder?date={day(2)}').status_code == 200
+    # история удалённого элемента недоступна
+    assert client.get('/node/file/history').status_code == 404
+
+
+def test_history_retention(client, monkeypatch):
+    monkeypatch.setattr(utils, 'HISTORY_MAX_VERSIONS', 3)
+    put(client, [{'id': 'folder', 'type': 'FOLDER', 'parentId': None}], 1)
+    for number in range(1, 7):
+        put(client, [file(number)], number)
+    assert history(client, 'file') == [(day(4), 4), (day(5), 5), (day(6), 6)]
+    assert history(client, 'folder') == [(day(4), 4), (day(5), 5), (day(6), 6)]
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.db.consistency import findPathDrift, findSizeDrift
+from app.db import models
+from app.db.models import Item, ItemHistory, SessionLocal
+from app.forms import ItemForm
+from app.main import get_application
+from app.utils.dates import parseDate
+from app.utils.import_queue import ImportRequest, processRequests
+from app.utils.metrics import IMPORT_BATCH_REQUESTS
+from conftest import import_items
+
+DATE = '2022-02-01T12:00:00Z'
+TREE = [
+    {'id': 'root', 'type': 'FOLDER', 'parentId': None},
+    {'id': 'a', 'type': 'FOLDER', 'parentId': 'root'},
+    {'id': 'b', 'type': 'FOLDER', 'parentId': 'root'},
+]
+# пачки в порядке поступления: перенос файла внутри окна, пачка с ошибкой, другая дата
+BATCHES = [
+    ([{'id': 'f1', 'type': 'FILE', 'parentId': 'a', 'url': '/f1', 'size': 10}], DATE),
+    ([{'id': 'f2', 'type': 'FILE', 'parentId': 'b', 'url': '/f2', 'size': 20}], DATE),
+    ([{'id': 'f1', 'type': 'FILE', 'parentId': 'b', 'url': '/f1', 'size': 15}], DATE),
+    ([{'id': 'f3', 'type': 'FILE', 'parentId': 'f2', 'url': '/f3', 'size': 5}], DATE),
+    ([{'id': 'c', 'type': 'FOLDER', 'parentId': 'a'}], '2022-02-02T12:00:00Z'),
+    ([{'id': 'f4', 'type': 'FILE', 'parentId': 'c', 'url': '/f4', 'size': 1}], '2022-02-02T12:00:00Z'),
+]
+
+
+def dump_database() -> tuple[list, list]:
+    with SessionLocal() as database:
+        assert findSizeDrift(database) == []
+        assert findPathDrift(database) == []
+        items = database.query(Item.id, Item.parentId, Item.size, Item.updateDate, Item.path).order_by(Item.id).all()
+        history = database.query(ItemHistory.itemId, ItemHistory.size, ItemHistory.date) \
+            .order_by(ItemHistory.itemId, ItemHistory.date).all()
+    return items, history
+
+
+def test_merged_batches_match_sequential_imports(tmp_path):
+    client = TestClient(get_application(f'sqlite:///{tmp_path / "direct.db"}'))
+    import_items(client, TREE)
+    statuses = [client.post('/imports', json={'items': items, 'updateDate': date}).status_code
+                for items, date in BATCHES]
+    expected = dump_database()
+
+    client = TestClient(get_application(f'sqlite:///{tmp_path / "queue.db"}'))
+    import_items(client, TREE)
+    requests = [ImportRequest([ItemForm(**item) for item in items], parseDate(date)) for items, date in BATCHES]
+    processRequests(requests)
+
+    assert [400 if request.future.exception() else 200 for request in requests] == statuses
+    assert dump_database() == expected
+
+
+def test_concurrent_imports_share_transactions(tmp_path):
+    with TestClient(get_application(f'sqlite:///{tmp_path / "test.db"}', import_queue=True)) as client:
+        import_items(client, TREE)
+
+        def send(number):
+            item = {'id': f'file{number}', 'type': 'FILE', 'parentId': 'a', 'url': '/file', 'size': 1}
+            if number % 5 == 0:
+                # у папки не бывает url: ошибка только у этого вызова
+                item = {'id': f'folder{number}', 'type': 'FOLDER', 'parentId': 'a', 'url': '/folder'}
+            return client.post('/imports', json={'items': [item], 'updateDate': DATE}).status_code
+
+        with ThreadPoolExecutor(8) as executor:
+            statuses = list(executor.map(send, range(100)))
+
+        assert statuses == [400 if number % 5 == 0 else 200 for number in range(100)]
+        assert client.get('/nodes/root').json()['size'] == 80
+        counts = [count for _, _, count in IMPORT_BATCH_REQUESTS.values.values()]
+        sums = [total for _, total, _ in IMPORT_BATCH_REQUESTS.values.values()]
+        # пачки объединялись: транзакций меньше, чем вызовов
+        assert sum(sums) == 101 and sum(counts) < 101
+        assert 'disk_import_queue_depth 0' in client.get('/metrics').text
+    dump_database()
+
+
+def ancestor_updates(requests: list[ImportRequest]) -> list[list[str]]:
+    """Обновления предков (UPDATE items по id) при записи пачек: id строк каждого выполнения"""
+    updates = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE items SET'):
+            rows = parameters if executemany else [parameters]
+            updates.append(sorted(row[-1] for row in rows))
+
+    event.listen(models.engine, 'before_cursor_execute', listener)
+    try:
+        processRequests(requests)
+    finally:
+        event.remove(models.engine, 'before_cursor_execute', listener)
+    assert all(request.future.exception() is None for request in requests)
+    return updates
+
+
+def test_batches_under_one_folder_update_ancestors_once(client):
+    import_items(client, TREE)
+    files = [[{'id': f'f{number}', 'type': 'FILE', 'parentId': 'a', 'url': '/f', 'size': number}] for number in (1, 2)]
+    requests = [ImportRequest([ItemForm(**item) for item in items], parseDate(DATE)) for items in files]
+    # две пачки одной даты пишутся одним upsert и одним обновлением общих предков
+    assert ancestor_updates(requests) == [['a', 'root']]
+    assert client.get('/nodes/a').json()['size'] == 3
+
+    # пачки разных дат не сливаются: у предков остаётся версия истории на каждую дату
+    dates = ['2022-02-02T12:00:00Z', '2022-02-03T12:00:00Z']
+    requests = [ImportRequest([ItemForm(**dict(items[0], size=10))], parseDate(date)) for items, date in zip(files, dates)]
+    assert ancestor_updates(requests) == [['a', 'root'], ['a', 'root']]
+    assert [version['date'] for version in client.get('/node/a/history').json()['items']] == [DATE] + dates
@@ -0,0 +1,98 @@
+import pytest
+from sqlalchemy import text
+
+from app.db import models
+from app.db.consistency import findStatsDrift
+from app.utils.utils import pathSegment
+
+
+def folder(id: str, parentId: str | None) -> dict:
+    return {'id': id, 'type': 'FOLDER', 'parentId': parentId}
+
+
+def file(id: str, parentId: str, size: int) -> dict:
+    return {'id': id, 'type': 'FILE', 'parentId': parentId, 'url': f'/{id}', 'size': size}
+
+
+def post(client, items: list[dict], date: str = '2022-02-01T12:00:00Z') -> None:
+    response = client.post('/imports', json={'items': items, 'updateDate': date})
+    assert response.status_code == 200, response.text
+
+
+def stored_items() -> dict[str, dict]:
+    with models.engine.connect() as connection:
+        rows = connection.execute(text('SELECT id, parentId, type, size, path FROM items'))
+        return {id: {'parentId': parentId, 'type': type, 'size': size or 0, 'path': path}
+                for id, parentId, type, size, path in rows}
+
+
+def assert_consistent(expected_parents: dict[str, str | None]) -> dict[str, dict]:
+    """Сверяет parentId, пути, сохранённые размеры и агрегаты папок с полным пересчётом по дереву"""
+    items = stored_items()
+    assert {id: item['parentId'] for id, item in items.items()} == expected_parents
+
+    def size(id):
+        if items[id]['type'] == 'FILE':
+            return items[id]['size']
+        return sum(size(child) for child, item in items.items() if item['parentId'] == id)
+
+    def path(id):
+        return (path(items[id]['parentId']) if items[id]['parentId'] else '/') + pathSegment(id)
+
+    assert {id: item['size'] for id, item in items.items()} == {id: size(id) for id in items}
+    assert {id: item['path'] for id, item in items.items()} == {id: path(id) for id in items}
+    with models.SessionLocal() as database:
+        assert findStatsDrift(database) == []
+    return items
+
+
+# батчи, в которых папки переносятся друг под друга: d6 уходит под своего бывшего потомка d5,
+# а d4 одновременно поднимается в корень
+INTERDEPENDENT_MOVES = [
+    [folder('d0', None)],
+    [folder('d6', 'd0'), folder('d5', 'd6')],
+    [folder('d40', 'd6')],
+    [folder('d4', 'd40'), file('f6', 'd5', 46)],
+    [folder('d5', 'd4')],
+    [folder('d6', 'd5'), folder('d4', None)],
+]
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_interdependent_moves(client, reverse):
+    for day, batch in enumerate(INTERDEPENDENT_MOVES, start=1):
+        post(client, batch[::-1] if reverse else batch, f'2022-02-{day:02}T12:00:00Z')
+    items = assert_consistent({'d0': None, 'd4': None, 'd5': 'd4', 'd6': 'd5', 'd40': 'd6', 'f6': 'd5'})
+    assert {id: item['size'] for id, item in items.items() if item['type'] == 'FOLDER'} == \
+           {'d0': 0, 'd4': 46, 'd5': 46, 'd6': 0, 'd40': 0}
+
+
+TREE = [
+    folder('r1', None), folder('x', 'r1'), folder('y', 'x'), folder('w', 'y'),
+    folder('r2', None), folder('z', 'r2'),
+    file('fx', 'x', 1), file('fy', 'y', 10), file('fw', 'w', 100), file('fz', 'z', 1000), file('f2', 'r2', 10000),
+]
+
+# один батч переносит вложенные папки: w наверх в r2, y под z, x под w, z в корень, fy меняет размер
+NESTED_MOVES = [folder('w', 'r2'), folder('y', 'z'), folder('x', 'w'), folder('z', None), file('fy', 'x', 20)]
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_nested_moves_in_one_batch(client, reverse):
+    post(client, TREE)
+    assert_consistent({item['id']: item['parentId'] for item in TREE})
+
+    post(client, NESTED_MOVES[::-1] if reverse else NESTED_MOVES, '2022-02-02T12:00:00Z')
+    expected = {item['id']: item['parentId'] for item in TREE + NESTED_MOVES}
+    items = assert_consistent(expected)
+    assert {id: items[id]['size'] for id in ('r1', 'r2', 'w', 'x', 'y', 'z')} == \
+           {'r1': 0, 'r2': 10121, 'w': 121, 'x': 21, 'y': 0, 'z': 1000}
+
+    stats = {id: client.get(f'/node/{id}/stats').json() for id in ('r1', 'r2', 'w', 'x', 'y', 'z')}
+    assert {id: (value['fileCount'], value['folderCount'], value['maxDepth']) for id, value in stats.items()} == \
+           {'r1': (0, 0, 0), 'r2': (4, 2, 3), 'w': (3, 1, 2), 'x': (2, 0, 1), 'y': (0, 0, 0), 'z': (1, 1, 1)}
+
+    # ответ GET /nodes строится из тех же сохранённых размеров
+    response = client.get('/nodes/r2').json()
+    assert response['size'] == 10121
+    assert {child['id']: child['size'] for child in response['children']} == {'w': 121, 'f2': 10000}
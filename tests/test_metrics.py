@@ -0,0 +1,81 @@
+import logging
+
+from sqlalchemy import event, text
+
+from app.db import models
+from app.utils import metrics
+from conftest import generate_tree, import_items
+
+
+def sample(text: str, name: str) -> float:
+    """Значение строки метрики по её имени с метками"""
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    raise AssertionError(f'{name} not found')
+
+
+def test_metrics_per_route(client):
+    root_id, items = generate_tree(100)
+    import_items(client, items)
+    client.get(f'/nodes/{root_id}')
+    client.get(f'/nodes/{root_id}')
+    client.get('/nodes/missing')
+
+    text = client.get('/metrics').text
+    assert sample(text, 'disk_http_requests_total{method="GET",route="/nodes/{id}",status="200"}') == 2
+    assert sample(text, 'disk_http_requests_total{method="GET",route="/nodes/{id}",status="404"}') == 1
+    assert sample(text, 'disk_http_request_duration_seconds_count{method="POST",route="/imports"}') == 1
+    assert sample(text, 'disk_http_request_duration_seconds_bucket{method="GET",route="/nodes/{id}",le="+Inf"}') == 3
+    # промах кэша - два запроса, попадание - ни одного, 404 - один
+    assert sample(text, 'disk_http_request_sql_statements_sum{method="GET",route="/nodes/{id}"}') == 3
+    assert sample(text, 'disk_cache_hits_total{cache="nodes"}') == 1
+    assert sample(text, 'disk_tree_items{type="FOLDER"}') + sample(text, 'disk_tree_items{type="FILE"}') == 100
+    assert sample(text, 'disk_tree_size_bytes') == sum(item.get('size', 0) for item in items)
+
+
+def test_tree_size_counts_top_level_parent_zero(client):
+    import_items(client, [{'id': 'root', 'type': 'FOLDER', 'parentId': '0'},
+                          {'id': 'file', 'type': 'FILE', 'parentId': 'root', 'url': '/file', 'size': 7},
+                          {'id': 'loose', 'type': 'FILE', 'parentId': None, 'url': '/loose', 'size': 3}])
+    assert sample(client.get('/metrics').text, 'disk_tree_size_bytes') == 10
+
+
+def test_slow_request_log(client, monkeypatch, caplog):
+    monkeypatch.setattr(metrics, 'SLOW_REQUEST_MS', 0)
+    root_id, items = generate_tree(10)
+    with caplog.at_level(logging.WARNING, logger='app.slow_requests'):
+        import_items(client, items)
+    assert 'POST /imports 200' in caplog.text
+    assert 'statements' in caplog.text and 'INSERT' in caplog.text
+    assert sample(client.get('/metrics').text, 'disk_http_slow_requests_total{method="POST",route="/imports"}') == 1
+
+
+def test_tree_gauges_follow_stored_aggregates(client):
+    root_id, items = generate_tree(200, fanout=3)
+    import_items(client, items)
+    folders = [item for item in items if item['type'] == 'FOLDER']
+    # перенос поддерева наверх и удаление другого поддерева
+    import_items(client, [dict(folders[5], parentId=None)], date='2022-02-02T12:00:00Z')
+    assert client.delete(f'/delete/{folders[7]["id"]}?date=2022-02-03T12:00:00Z').status_code == 200
+
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(models.engine, 'before_cursor_execute', listener)
+    try:
+        body = client.get('/metrics').text
+    finally:
+        event.remove(models.engine, 'before_cursor_execute', listener)
+    with models.engine.connect() as connection:
+        counts = dict(connection.execute(text('SELECT type, count(*) FROM items GROUP BY type')).all())
+        size = connection.execute(text("SELECT sum(size) FROM items WHERE type = 'FILE'")).scalar()
+        # гауги читаются по строкам верхнего уровня через индекс, без прохода по таблице
+        plans = [connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+                 for statement, parameters in statements]
+    assert sample(body, 'disk_tree_items{type="FILE"}') == counts['FILE']
+    assert sample(body, 'disk_tree_items{type="FOLDER"}') == counts['FOLDER']
+    assert sample(body, 'disk_tree_size_bytes') == size
+    assert not any(row[-1].startswith('SCAN items') for plan in plans for row in plan)
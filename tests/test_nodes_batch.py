@@ -0,0 +1,29 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import get_application
+from app.utils import tree_index
+from conftest import generate_tree, import_items
+
+
+@pytest.mark.parametrize('with_index', [False, True])
+def test_batch_matches_single_requests(tmp_path, with_index):
+    client = TestClient(get_application(f'sqlite:///{tmp_path / "test.db"}', tree_index=with_index))
+    root_id, items = generate_tree(300, fanout=3)
+    import_items(client, items + [{'id': 'empty', 'type': 'FOLDER', 'parentId': None}])
+    folders = [item['id'] for item in items if item['type'] == 'FOLDER']
+    files = [item['id'] for item in items if item['type'] == 'FILE']
+    # вложенные и повторные папки, файлы, отсутствующий id
+    ids = [folders[4], root_id, folders[1], files[3], 'missing', folders[4], 'empty', folders[-1]]
+    try:
+        for depth in [None, 0, 1, 2]:
+            query = '' if depth is None else f'?depth={depth}'
+            expected = [client.get(f'/nodes/{id}' + query).json()
+                        if id != 'missing' else {'id': 'missing', 'error': "Item not found"} for id in ids]
+            response = client.post('/nodes/batch', json={'ids': ids, 'depth': depth})
+            assert response.status_code == 200
+            assert response.json() == {'items': expected}
+        assert client.post('/nodes/batch', json={'ids': ids, 'depth': -1}).status_code == 400
+        assert client.post('/nodes/batch', json={'ids': []}).json() == {'items': []}
+    finally:
+        tree_index.stopTreeIndex()
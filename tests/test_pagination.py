@@ -0,0 +1,51 @@
+from conftest import import_items
+
+TREE = [
+    {'id': 'root', 'type': 'FOLDER', 'parentId': None},
+    {'id': 'a', 'type': 'FOLDER', 'parentId': 'root'},
+    {'id': 'b', 'type': 'FOLDER', 'parentId': 'a'},
+    {'id': 'c', 'type': 'FILE', 'parentId': 'root', 'url': '/c', 'size': 5},
+    {'id': 'd', 'type': 'FILE', 'parentId': 'root', 'url': '/d', 'size': 7},
+    {'id': 'file', 'type': 'FILE', 'parentId': 'b', 'url': '/file', 'size': 10},
+]
+
+
+def test_nodes_depth(client):
+    import_items(client, TREE)
+    root = client.get('/nodes/root', params={'depth': 1}).json()
+    assert root['size'] == 22
+    assert [child['id'] for child in root['children']] == ['a', 'c', 'd']
+    assert root['children'][0]['children'] is None
+    assert root['children'][0]['size'] == 10
+
+    root = client.get('/nodes/root', params={'depth': 2}).json()
+    assert root['children'][0]['children'][0]['id'] == 'b'
+    assert root['children'][0]['children'][0]['children'] is None
+    assert client.get('/nodes/root', params={'depth': 0}).json()['children'] is None
+    assert client.get('/nodes/root', params={'depth': -1}).status_code == 400
+
+
+def test_nodes_pages(client):
+    import_items(client, TREE)
+    first = client.get('/nodes/root', params={'limit': 2}).json()
+    assert [child['id'] for child in first['children']] == ['a', 'c']
+    assert first['children'][0]['children'][0]['children'][0]['id'] == 'file'
+    second = client.get('/nodes/root', params={'limit': 2, 'cursor': first['nextCursor']}).json()
+    assert [child['id'] for child in second['children']] == ['d']
+    assert second['nextCursor'] is None
+    assert client.get('/nodes/root', params={'limit': 2, 'cursor': 'broken'}).status_code == 400
+
+
+def test_children_pages(client):
+    import_items(client, TREE)
+    ids, cursor = [], None
+    while True:
+        params = {'url': 'home/root', 'limit': 1}
+        if cursor:
+            params['cursor'] = cursor
+        page = client.get('/children', params=params).json()
+        ids += [item['id'] for item in page['items']]
+        cursor = page['nextCursor']
+        if cursor is None:
+            break
+    assert ids == ['a', 'c', 'd']
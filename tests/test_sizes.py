@@ -0,0 +1,82 @@
+import json
+import subprocess
+import sys
+
+from sqlalchemy import text
+
+from app.db import models
+
+TREE = [
+    {'id': 'root', 'type': 'FOLDER', 'parentId': None},
+    {'id': 'a', 'type': 'FOLDER', 'parentId': 'root'},
+    {'id': 'b', 'type': 'FOLDER', 'parentId': 'a'},
+    {'id': 'c', 'type': 'FOLDER', 'parentId': 'root'},
+    {'id': 'f1', 'type': 'FILE', 'parentId': 'b', 'url': '/f1', 'size': 10},
+    {'id': 'f2', 'type': 'FILE', 'parentId': 'a', 'url': '/f2', 'size': 20},
+    {'id': 'f3', 'type': 'FILE', 'parentId': 'c', 'url': '/f3', 'size': 40},
+]
+
+
+def post(client, items: list[dict], date: str = '2022-02-01T12:00:00Z') -> None:
+    response = client.post('/imports', json={'items': items, 'updateDate': date})
+    assert response.status_code == 200, response.text
+
+
+def recomputed(node: dict) -> int:
+    """Размер по детям ответа GET /nodes, рекурсивно; проверяет и сохранённые размеры вложенных папок"""
+    if node['type'] == 'FILE':
+        return node['size']
+    total = sum(recomputed(child) for child in node['children'])
+    assert node['size'] == total, node['id']
+    return total
+
+
+def assert_sizes(client, expected_root: int) -> None:
+    assert recomputed(client.get('/nodes/root').json()) == expected_root
+
+
+def test_sizes_follow_every_operation(client):
+    post(client, TREE)
+    assert_sizes(client, 70)
+    assert client.get('/nodes/b').json()['size'] == 10
+
+    # изменение размера файла
+    post(client, [dict(TREE[4], size=15)], '2022-02-02T12:00:00Z')
+    assert_sizes(client, 75)
+    assert client.get('/nodes/a').json()['size'] == 35
+
+    # перенос папки с поддеревом
+    post(client, [dict(TREE[2], parentId='c')], '2022-02-03T12:00:00Z')
+    assert_sizes(client, 75)
+    assert client.get('/nodes/a').json()['size'] == 20
+    assert client.get('/nodes/c').json()['size'] == 55
+
+    # удаление поддерева
+    assert client.delete('/delete/b?date=2022-02-04T12:00:00Z').status_code == 200
+    assert_sizes(client, 60)
+    assert client.get('/nodes/c').json()['size'] == 40
+
+
+def run_consistency(database_url: str, *args: str) -> tuple[int, dict]:
+    result = subprocess.run([sys.executable, '-m', 'app.db.consistency', '--database-url', database_url, *args],
+                            capture_output=True, text=True)
+    return result.returncode, json.loads(result.stdout)
+
+
+def test_consistency_reports_and_fixes_drift(client, tmp_path):
+    database_url = f'sqlite:///{tmp_path / "test.db"}'
+    post(client, TREE)
+    assert run_consistency(database_url)[0] == 0
+
+    with models.engine.begin() as connection:
+        connection.execute(text("UPDATE items SET size = 999 WHERE id IN ('a', 'root')"))
+    code, report = run_consistency(database_url)
+    assert code == 1 and report['drift'] == 2
+    assert {entry['id'] for entries in report.values() if isinstance(entries, list) for entry in entries} \
+        == {'a', 'root'}
+
+    code, report = run_consistency(database_url, '--fix')
+    assert code == 0 and report['fixed']
+    code, report = run_consistency(database_url)
+    assert code == 0 and report['drift'] == 0
+    assert_sizes(client, 70)
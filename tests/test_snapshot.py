@@ -0,0 +1,56 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app.db.consistency import findPathDrift, findSizeDrift, findStatsDrift
+from app.db.models import SessionLocal
+from app.main import get_application
+from conftest import generate_tree, import_items
+
+
+def build_tree(client) -> tuple[str, list[dict]]:
+    root_id, items = generate_tree(300, fanout=3)
+    import_items(client, items)
+    folders = [item for item in items if item['type'] == 'FOLDER']
+    import_items(client, [dict(folders[-1], parentId=root_id), {'id': 'a/b%', 'type': 'FOLDER', 'parentId': '0'},
+                          {'id': 'f', 'type': 'FILE', 'parentId': 'a/b%', 'url': '/f', 'size': 7}],
+                 date='2022-02-02T12:00:00.123456Z')
+    assert client.delete(f'/delete/{folders[4]["id"]}?date=2022-02-03T12:00:00Z').status_code == 200
+    return root_id, items
+
+
+def test_restore_reproduces_export(tmp_path):
+    client = TestClient(get_application(f'sqlite:///{tmp_path / "source.db"}'))
+    root_id, items = build_tree(client)
+    snapshot = client.get('/export').content
+    paths = [f'/nodes/{root_id}', '/nodes/a%2Fb%25', '/updates?date=2022-02-02T12:00:00.123456Z',
+             f'/children?url=home/{root_id}', f'/node/{items[-1]["id"]}/history?dateStart=2022-02-02T12:00:00Z']
+    expected = [client.get(path).json() for path in paths]
+
+    client = TestClient(get_application(f'sqlite:///{tmp_path / "restored.db"}'))
+    assert client.post('/restore', data=snapshot).status_code == 200
+    assert [client.get(path).json() for path in paths] == expected
+    assert client.get('/export').content == snapshot
+    with SessionLocal() as database:
+        assert findSizeDrift(database) == [] and findPathDrift(database) == [] and findStatsDrift(database) == []
+
+    # в непустую базу - только с replace
+    assert client.post('/restore', data=snapshot).status_code == 400
+    assert client.post('/restore?replace=true', data=snapshot).status_code == 200
+    assert client.get('/export').content == snapshot
+
+
+def test_invalid_snapshot_changes_nothing(tmp_path):
+    client = TestClient(get_application(f'sqlite:///{tmp_path / "test.db"}'))
+    build_tree(client)
+    snapshot = client.get('/export').content
+    lines = snapshot.splitlines()
+    file = next(number for number, line in enumerate(lines) if b'"FILE"' in line)
+    # ребёнок раньше родителя, файл без размера, повтор id
+    broken = [lines[1:] + lines[:1],
+              lines[:file] + [json.dumps(dict(json.loads(lines[file]), size=None)).encode()] + lines[file + 1:],
+              lines + lines[-1:]]
+    for body in broken:
+        response = client.post('/restore?replace=true', data=b'\n'.join(body))
+        assert response.status_code == 400, response.text
+        assert client.get('/export').content == snapshot
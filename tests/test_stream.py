@@ -0,0 +1,30 @@
+import json
+from collections import defaultdict
+
+from app.db.models import Item, SessionLocal
+from app.utils.streaming import bufferChunks, encodeNode
+from app.utils.dates import formatDate
+from conftest import generate_tree, import_items
+
+
+def nested_tree(database) -> dict[str, dict]:
+    """Ответы GET /nodes всех папок, собранные из строк items в порядке path"""
+    nodes, children = {}, defaultdict(list)
+    for item in database.query(Item).order_by(Item.path):
+        nodes[item.id] = {'id': item.id, 'url': item.url, 'type': item.type, 'parentId': item.parentId,
+                          'date': formatDate(item.updateDate), 'size': item.size,
+                          'children': children[item.id] if item.type == 'FOLDER' else None}
+        children[item.parentId].append(nodes[item.id])
+    return nodes
+
+
+def test_stream_matches_nested_dicts(client):
+    root_id, items = generate_tree(500, fanout=3)
+    import_items(client, items)
+    with SessionLocal() as database:
+        expected = nested_tree(database)
+        for item in database.query(Item).filter(Item.type == 'FOLDER'):
+            body = b''.join(bufferChunks(encodeNode(item, database), size=100))
+            assert json.loads(body) == expected[item.id]
+    assert client.get(f'/nodes/{root_id}').json() == expected[root_id]
+    assert expected[root_id]['size'] == sum(item.get('size', 0) for item in items)
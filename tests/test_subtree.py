@@ -0,0 +1,47 @@
+from sqlalchemy import event
+
+from app.db import models
+
+
+def chain(prefix: str, depth: int) -> list[dict]:
+    """Цепочка вложенных папок глубины depth, в каждой по файлу размера 1"""
+    items = []
+    for level in range(depth):
+        parentId = f'{prefix}{level - 1}' if level else None
+        items.append({'id': f'{prefix}{level}', 'type': 'FOLDER', 'parentId': parentId})
+        items.append({'id': f'{prefix}file{level}', 'type': 'FILE', 'parentId': f'{prefix}{level}',
+                      'url': f'/{prefix}{level}', 'size': 1})
+    return items
+
+
+def get_counting(client, path: str) -> tuple[dict, int]:
+    statements = []
+    listener = lambda *args: statements.append(1)
+    event.listen(models.engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(models.engine, 'before_cursor_execute', listener)
+    assert response.status_code == 200
+    return response.json(), len(statements)
+
+
+def test_subtree_is_fetched_in_constant_queries(client):
+    response = client.post('/imports', json={'items': chain('shallow', 2) + chain('deep', 40),
+                                             'updateDate': '2022-02-01T12:00:00Z'})
+    assert response.status_code == 200
+
+    shallow, shallowStatements = get_counting(client, '/nodes/shallow0')
+    deep, deepStatements = get_counting(client, '/nodes/deep0')
+    # число запросов не зависит от глубины поддерева
+    assert deepStatements == shallowStatements
+
+    node, level = deep, 0
+    while node['type'] == 'FOLDER':
+        assert node['id'] == f'deep{level}' and node['size'] == 40 - level
+        children = sorted(node['children'], key=lambda child: child['type'], reverse=True)
+        assert [child['id'] for child in children] == \
+            ([f'deep{level + 1}'] if level < 39 else []) + [f'deepfile{level}']
+        assert children[-1]['children'] is None
+        node, level = children[0], level + 1
+    assert level == 40 and shallow['size'] == 2
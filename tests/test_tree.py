@@ -0,0 +1,45 @@
+from app.db.consistency import findPathDrift, findSizeDrift
+from app.db.models import SessionLocal
+from conftest import import_items
+
+TREE = [
+    {'id': 'root', 'type': 'FOLDER', 'parentId': None},
+    {'id': 'a', 'type': 'FOLDER', 'parentId': 'root'},
+    {'id': 'b', 'type': 'FOLDER', 'parentId': 'a'},
+    {'id': 'c', 'type': 'FOLDER', 'parentId': 'root'},
+    {'id': 'file', 'type': 'FILE', 'parentId': 'b', 'url': '/file', 'size': 10},
+]
+
+
+def assert_consistent():
+    with SessionLocal() as database:
+        assert findSizeDrift(database) == []
+        assert findPathDrift(database) == []
+
+
+def test_reparent_moves_subtree(client):
+    import_items(client, TREE)
+    import_items(client, [{'id': 'a', 'type': 'FOLDER', 'parentId': 'c'}], date='2022-02-02T12:00:00Z')
+
+    c = client.get('/nodes/c').json()
+    assert c['size'] == 10
+    assert c['children'][0]['id'] == 'a'
+    assert c['children'][0]['children'][0]['children'][0]['id'] == 'file'
+    assert_consistent()
+
+
+def test_cycle_is_rejected(client):
+    import_items(client, TREE)
+    response = client.post('/imports', json={
+        'items': [{'id': 'a', 'type': 'FOLDER', 'parentId': 'b'}],
+        'updateDate': '2022-02-02T12:00:00Z'
+    })
+    assert response.status_code == 400
+
+    response = client.post('/imports', json={
+        'items': [{'id': 'x', 'type': 'FOLDER', 'parentId': 'y'}, {'id': 'y', 'type': 'FOLDER', 'parentId': 'x'}],
+        'updateDate': '2022-02-02T12:00:00Z'
+    })
+    assert response.status_code == 400
+    assert client.get('/nodes/root').json()['size'] == 10
+    assert_consistent()
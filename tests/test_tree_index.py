@@ -0,0 +1,118 @@
+import asyncio
+import random
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+
+from app.db.models import SessionLocal, AsyncSessionLocal
+from app.forms import ImportForm
+from app.handlers import writeImport
+from app.main import get_application
+from app.utils import tree_index
+from app.utils.dates import parseDate
+from app.utils.tree_index import findIndexDrift
+from app.utils.writes import runWrite
+from conftest import generate_tree, import_items
+
+
+def read_all(client, paths: list[str]) -> list:
+    return [(response.status_code, response.content) for response in map(client.get, paths)]
+
+
+def test_index_matches_database(tmp_path):
+    client = TestClient(get_application(f'sqlite:///{tmp_path / "test.db"}', tree_index=True))
+    root_id, items = generate_tree(300, fanout=3)
+    import_items(client, items)
+    folders = [item for item in items if item['type'] == 'FOLDER']
+    files = [item for item in items if item['type'] == 'FILE']
+    # перенос папки, элемент с отсутствующим родителем, обновление файлов и удаление поддерева
+    import_items(client, [dict(folders[-1], parentId=root_id), {'id': 'a/b%', 'type': 'FOLDER', 'parentId': '0'}],
+                 date='2022-02-02T12:00:00Z')
+    import_items(client, [dict(item, size=256) for item in files[::7]], date='2022-02-03T12:00:00Z')
+    assert client.delete(f'/delete/{folders[4]["id"]}?date=2022-02-03T12:00:00Z').status_code == 200
+
+    paths = [f'/nodes/{root_id}', f'/nodes/{root_id}?depth=2&limit=2', f'/nodes/{folders[4]["id"]}',
+             '/nodes/a%2Fb%25', '/updates?date=2022-02-03T12:00:00Z', '/updates?date=2022-02-03T12:00:00Z&limit=3',
+             '/children?url=home', f'/children?url=home/{root_id}&limit=2', f'/children?url=home/{files[0]["id"]}']
+    paths += [f'/nodes/{item["id"]}?depth=1' for item in folders[:20]]
+    with_index = read_all(client, paths)
+    with SessionLocal() as database:
+        assert findIndexDrift(tree_index.treeIndex, database) == []
+
+    index, tree_index.treeIndex = tree_index.treeIndex, None
+    try:
+        assert read_all(client, paths) == with_index
+    finally:
+        tree_index.treeIndex = index
+
+    # уплотнение убирает удалённые номера, не меняя ответов
+    index.compact()
+    assert len(index.ids) == len(index)
+    assert read_all(client, paths) == with_index
+
+
+def children_pages(client, url: str) -> list[str]:
+    ids, cursor = [], None
+    while True:
+        page = client.get('/children', params={'url': url, 'limit': 2, **({'cursor': cursor} if cursor else {})}).json()
+        ids += [item['id'] for item in page['items']]
+        cursor = page['nextCursor']
+        if cursor is None:
+            return ids
+
+
+def test_index_pages_children_in_id_order(tmp_path):
+    client = TestClient(get_application(f'sqlite:///{tmp_path / "test.db"}', tree_index=True))
+    try:
+        # в порядке path 'x-1/' < 'x.2/' < 'x/' < 'x0/', в порядке id 'x' идёт первым
+        children = ['x0', 'x', 'x.2', 'x-1']
+        import_items(client, [{'id': 'root', 'type': 'FOLDER', 'parentId': None}] +
+                     [{'id': id, 'type': 'FOLDER', 'parentId': 'root'} for id in children[:2]])
+        import_items(client, [{'id': id, 'type': 'FOLDER', 'parentId': 'root'} for id in children[2:]] +
+                     [{'id': 'y', 'type': 'FOLDER', 'parentId': 'x'}], date='2022-02-02T12:00:00Z')
+        import_items(client, [{'id': 'y', 'type': 'FOLDER', 'parentId': 'root'}], date='2022-02-03T12:00:00Z')
+        assert children_pages(client, 'home/root') == sorted(children + ['y'])
+        assert children_pages(client, 'home') == ['root']
+        with SessionLocal() as database:
+            assert findIndexDrift(tree_index.treeIndex, database) == []
+        tree_index.treeIndex.compact()
+        assert children_pages(client, 'home/root') == sorted(children + ['y'])
+    finally:
+        tree_index.stopTreeIndex()
+
+
+def test_index_follows_concurrent_async_imports(tmp_path):
+    get_application(f'sqlite:///{tmp_path / "test.db"}', async_mode=True, tree_index=True)
+    folders = [f'folder{number}' for number in range(4)]
+    rng = random.Random(0)
+
+    def slow_commit(session):
+        # после commit обработчик отдаёт цикл событий: следующая запись успевает зафиксироваться раньше
+        await_only(asyncio.sleep(rng.random() * 0.05))
+
+    async def write(items: list[dict], date: str) -> None:
+        form = ImportForm(items=items, updateDate=date)
+        async with AsyncSessionLocal() as session:
+            await session.run_sync(runWrite, writeImport, form, parseDate(date), None)
+
+    async def main() -> list:
+        await write([{'id': 'root', 'type': 'FOLDER', 'parentId': None}] +
+                    [{'id': id, 'type': 'FOLDER', 'parentId': 'root'} for id in folders], '2022-02-01T00:00:00Z')
+        drift = []
+        for step in range(20):
+            # импорты меняют один и тот же файл и размеры общих предков
+            await asyncio.gather(*(write([{'id': 'file', 'type': 'FILE', 'parentId': folders[number],
+                                           'url': '/file', 'size': step * 4 + number + 1}],
+                                         f'2022-02-01T12:{step:02d}:{number:02d}Z') for number in range(4)))
+            with SessionLocal() as database:
+                drift += findIndexDrift(tree_index.treeIndex, database)
+        return drift
+
+    event.listen(Session, 'after_commit', slow_commit)
+    try:
+        assert asyncio.run(main()) == []
+    finally:
+        event.remove(Session, 'after_commit', slow_commit)
+        tree_index.stopTreeIndex()
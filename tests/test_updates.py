@@ -0,0 +1,66 @@
+import sqlite3
+
+from fastapi.testclient import TestClient
+
+from app.main import get_application
+
+DATE = '2022-02-02T12:00:00Z'
+
+
+def put_file(client, id: str, date: str) -> None:
+    response = client.post('/imports', json={'updateDate': date, 'items': [
+        {'id': id, 'type': 'FILE', 'parentId': None, 'url': f'/{id}', 'size': 1}]})
+    assert response.status_code == 200
+
+
+def updated_ids(client, date: str, **params) -> list[str]:
+    response = client.get('/updates', params={'date': date, **params})
+    assert response.status_code == 200
+    return [item['id'] for item in response.json()['items']]
+
+
+def test_updates_window_bounds(client):
+    put_file(client, 'too-old', '2022-02-01T11:59:59Z')
+    put_file(client, 'start', '2022-02-01T12:00:00Z')
+    put_file(client, 'middle', '2022-02-02T03:00:00+03:00')
+    put_file(client, 'end', DATE)
+    put_file(client, 'too-new', '2022-02-02T12:00:01Z')
+    assert client.post('/imports', json={'updateDate': DATE, 'items': [
+        {'id': 'folder', 'type': 'FOLDER', 'parentId': None}]}).status_code == 200
+
+    # окно [date - 24h, date] включительно, только файлы, в порядке даты
+    assert updated_ids(client, DATE) == ['start', 'middle', 'end']
+    # та же точка времени в другом часовом поясе
+    assert updated_ids(client, '2022-02-02T15:00:00+03:00') == ['start', 'middle', 'end']
+    assert client.get('/updates', params={'date': 'yesterday'}).status_code == 400
+
+
+def test_updates_pages(client):
+    for number in range(5):
+        put_file(client, f'file{number}', DATE)
+    ids, cursor = [], None
+    while True:
+        params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+        page = client.get('/updates', params={'date': DATE, **params}).json()
+        assert len(page['items']) <= 2
+        ids += [item['id'] for item in page['items']]
+        cursor = page['nextCursor']
+        if cursor is None:
+            break
+    assert ids == [f'file{number}' for number in range(5)]
+
+
+def test_string_dates_of_old_database_are_migrated(tmp_path):
+    path = tmp_path / 'old.db'
+    with sqlite3.connect(path) as connection:
+        connection.execute("""create table items(id varchar(256) primary key, parentId varchar(256),
+            url varchar(255) NULL, size integer NULL, type varchar(6) NULL, updateDate varchar(256))""")
+        connection.executemany('insert into items values (?, ?, ?, ?, ?, ?)', [
+            ('folder', None, None, None, 'FOLDER', '2022-02-02T12:00:00Z'),
+            ('old', 'folder', '/old', 5, 'FILE', '2022-01-01T00:00:00Z'),
+            ('new', 'folder', '/new', 7, 'FILE', '2022-02-02T14:00:00+03:00'),
+        ])
+    client = TestClient(get_application(f'sqlite:///{path}'))
+    assert updated_ids(client, DATE) == ['new']
+    folder = client.get('/nodes/folder').json()
+    assert folder['size'] == 12 and folder['date'] == DATE
@@ -0,0 +1,85 @@
+import time
+
+from app.utils.dates import parseDate, utcNow
+from conftest import import_items
+
+TREE = [
+    {'id': 'root', 'type': 'FOLDER', 'parentId': None},
+    {'id': 'file', 'type': 'FILE', 'parentId': 'root', 'url': '/file', 'size': 10},
+]
+
+
+def post(client, items):
+    return client.post('/imports', json={'items': items, 'updateDate': '2022-02-02T12:00:00Z'})
+
+
+def test_type_change_is_rejected(client):
+    import_items(client, TREE)
+    assert post(client, [{'id': 'file', 'type': 'FOLDER', 'parentId': 'root'}]).status_code == 400
+    assert post(client, [{'id': 'root', 'type': 'FILE', 'parentId': None, 'url': '/r', 'size': 1}]).status_code == 400
+
+
+def test_parent_must_be_folder(client):
+    import_items(client, TREE)
+    assert post(client, [{'id': 'child', 'type': 'FILE', 'parentId': 'file', 'url': '/c', 'size': 1}]).status_code == 400
+    assert post(client, [
+        {'id': 'other', 'type': 'FILE', 'parentId': None, 'url': '/o', 'size': 1},
+        {'id': 'child', 'type': 'FILE', 'parentId': 'other', 'url': '/c', 'size': 1},
+    ]).status_code == 400
+
+
+def test_all_errors_are_returned(client):
+    import_items(client, TREE)
+    response = post(client, [
+        {'id': 'a', 'type': 'FILE', 'parentId': None, 'url': '/a', 'size': 0},
+        {'id': 'b', 'type': 'FOLDER', 'parentId': 'missing'},
+        {'id': 'a', 'type': 'FOLDER', 'parentId': None},
+        {'id': 'file', 'type': 'FILE', 'parentId': 'root', 'url': '/file', 'size': 5},
+    ])
+    assert response.status_code == 400
+    errors = response.json()['detail']['errors']
+    assert [error['id'] for error in errors] == ['a', 'b', 'a']
+
+
+def test_moves_into_own_subtree_are_rejected(client):
+    import_items(client, TREE + [
+        {'id': 'a', 'type': 'FOLDER', 'parentId': 'root'},
+        {'id': 'b', 'type': 'FOLDER', 'parentId': 'a'},
+    ])
+    # неизменённые элементы пачки не прерывают цепочку от перенесённого
+    assert post(client, [
+        {'id': 'b', 'type': 'FOLDER', 'parentId': 'a'},
+        {'id': 'a', 'type': 'FOLDER', 'parentId': 'b'},
+    ]).status_code == 400
+    assert post(client, [{'id': 'root', 'type': 'FOLDER', 'parentId': 'b'}]).status_code == 400
+    assert post(client, [
+        {'id': 'c', 'type': 'FOLDER', 'parentId': 'd'},
+        {'id': 'd', 'type': 'FOLDER', 'parentId': 'c'},
+    ]).status_code == 400
+    assert post(client, [{'id': 'b', 'type': 'FOLDER', 'parentId': 'root'}]).status_code == 200
+
+
+def test_missing_date_is_request_time(client):
+    import_items(client, TREE)
+    before = utcNow()
+    time.sleep(0.01)
+    client.post('/imports', json={'items': [dict(TREE[1], size=20)]})
+    time.sleep(0.01)
+    assert client.delete('/delete/file').status_code == 200
+    # каждый вызов получает своё время, а не время импорта модуля
+    history = client.get('/node/root/history').json()['items']
+    dates = [parseDate(version['date']) for version in history]
+    assert dates[0] < before < dates[1] < dates[2]
+    assert post(client, TREE[:1]).status_code == 200
+    assert client.get('/updates?date=2022-02-30T12:00:00Z').status_code == 400
+    assert client.delete('/delete/root?date=2022-02-02T25:00:00Z').status_code == 400
+
+
+def test_out_of_range_dates_are_rejected(client):
+    # формат верный, но перевод в UTC уводит дату за пределы годов 1-9999
+    response = client.post('/imports', json={'items': TREE, 'updateDate': '0001-01-01T00:00:00+01:00'})
+    assert response.status_code == 400
+    assert client.get('/updates', params={'date': '9999-12-31T23:59:59-01:00'}).status_code == 400
+    # окно /updates начинается за сутки до даты
+    assert client.get('/updates', params={'date': '0001-01-01T12:00:00Z'}).status_code == 400
+    assert client.get('/node/root/history', params={'dateStart': '0001-01-01T00:00:00+01:00'}).status_code == 400